@@ -1,276 +1,392 @@
-import math
+import os
 import h5py
 import numpy as np
 import argparse as argp
-from os import listdir as ls
-import readWrite as rw
-import functions as fncs
 from glob import glob
+import mpi_functions as mpi_fncs
+import functions as fncs
+
+# Averages two- and three-point functions over sources. Each
+# configuration directory contains one file per source with datasets
+# named <top group>/<source group>/..., and the average is written to
+# one file per configuration with the source group removed from the
+# dataset names. Configurations are averaged one at a time, reading
+# one dataset at a time, so only the averages of one configuration
+# are in memory, and are split between processes. A configuration
+# whose output files already exist is skipped, so an interrupted run
+# continues where it stopped when run again.
 
 nptFunction_list = [ "2", "3", "both" ]
 
-#########################
-# Parse input arguments #
-#########################
+ins_current = [ "noether", "oneD", "ultra_local" ]
 
-parser = argp.ArgumentParser( description="Average Sources" )
 
-parser.add_argument( "threep_dir", action='store', type=str )
+# Returns the names of all datasets in an HDF5 file
 
-parser.add_argument( "threep_template", action='store', type=str )
+# filename: Name of file
 
-parser.add_argument( "twop_dir", action='store', type=str )
+def datasetNames( filename ):
 
-parser.add_argument( "twop_template", action='store', type=str )
+    dsetname = []
 
-parser.add_argument( 't_sink', action='store', \
-                     help="Comma seperated list of t sink's", \
-                     type=lambda s: [int(item) for item in s.split(',')] )
+    with h5py.File( filename, "r" ) as dataFile:
 
-parser.add_argument( "-npt", "--n_point_function", action='store', type=str, default="both", \
-                     help="n-point functions to average. Should be '2', '3', or 'both'." )
+        dataFile.visititems( lambda name,obj: dsetname.append( name )
+                             if type( obj ) is h5py.Dataset else None )
 
-parser.add_argument( "-3o", "--threep_out", action='store', type=str, default="./threep.*_avgSources.h5" )
+    return dsetname
 
-parser.add_argument( "-2o", "--twop_out", action='store', type=str, default="./twop.*_avgSources.h5" )
 
-parser.add_argument( "-c", "--config_list", action='store', type=str, default="" )
+# Returns the name of a dataset without its source (2nd) group
 
-args = parser.parse_args()
+# dsetname: Dataset name in the form <top group>/<source group>/...
 
-threepDir = args.threep_dir
+def outputDatasetName( dsetname ):
 
-twopDir = args.twop_dir
+    groups = dsetname.split( "/" )
 
-threep_template = args.threep_template
+    return "/".join( [ groups[ 0 ] ] + groups[ 2: ] )
 
-twop_template = args.twop_template
 
-tsink = args.t_sink
+# Averages datasets over the source files of one configuration. Also
+# checks that every file has the same momentum list, a different
+# source group and the same datasets.
 
-nptFunction = args.n_point_function
+# filename: List of source files of the configuration
+# keywordList: List of lists of keywords. Datasets which contain all
+#              keywords of any of the lists are averaged.
+# config: Configuration, used in error messages
 
-threepOut_template = args.threep_out
+# Returns the momentum list and a dictionary of the average of each
+# dataset by output dataset name
 
-twopOut_template = args.twop_out
+def averageSources( filename, keywordList, config ):
 
-configList = fncs.getConfigList( args.config_list, threepDir )
+    sources = set()
 
-configNum = len( configList )
+    momList_0 = None
 
-# Check inputs
+    # Sum of each dataset and its type
 
-assert nptFunction in nptFunction_list, "Error: n-point function not supported. " \
-    + "Supported n-point functions: " + str( particle_list )
+    dataSum = {}
+    dataType = {}
 
-#############################################
-# Fill matrices with values from data files #
-#############################################
+    # Loop over source files
+    for fn in filename:
 
-threep = []
+        dsetname = datasetNames( fn )
 
-threepDatasetName = []
+        momDsetname = [ name for name in dsetname
+                        if "Momenta_list_xyz" in name ]
 
-if nptFunction == "3" or nptFunction == "both":
+        dsetname = [ name for name in dsetname
+                     if any( all( kw in name for kw in keyword )
+                             for keyword in keywordList ) ]
 
-    for ts in tsink:
+        assert momDsetname, \
+            "No momentum list in file {}".format( fn )
 
-        # Read three-point functions
-        # threep[ ts ][ curr_type ][ c, src, ds, ti, q, curr, part ]
+        assert dsetname, \
+            "No datasets containing keywords {} in file {}".format( keywordList,
+                                                                   fn )
 
-        threep_ts, threepDatasetName_ts = rw.getHDF5File_wNames( threepDir, configList, threep_template, "threep", "tsink_" + str( ts ) )
+        with h5py.File( fn, "r" ) as dataFile:
 
-        threep.append( threep_ts )
+            # Check that all of the momenta are the same
 
-        threepDatasetName.append( threepDatasetName_ts )
+            for name in momDsetname:
 
-        momentaList_threep = rw.getDatasets( threepDir, configList, threep_template, "Momenta_list_xyz" )
+                momList = np.array( dataFile[ name ] )
 
-    # Check that all of the momenta are the same
+                if momList_0 is None:
 
-    for c in range( configNum ):
+                    momList_0 = momList
 
-        momList_0 = momentaList_threep[ c, 0 ].flat
+                assert np.array_equal( momList, momList_0 ), \
+                    "Momenta lists in configuration " + config \
+                    + " do not match"
 
-        for momList in momentaList_threep[ c ]:
+            # Ensure that the source (2nd) group is unique to
+            # each file in sub-directory
 
-            for i in range( momList.size ):
+            sources_fn = set( name.split( "/" )[ 1 ] for name in dsetname )
 
-                assert momList.flat[ i ] == momList_0[ i ], \
-                    "Momenta lists in configuration " + configList[ c ] \
-                    + " do not match"
+            assert len( sources_fn ) == 1 \
+                and sources_fn.isdisjoint( sources ), \
+                "Source groups in configuration " \
+                + "{} are not unique to file".format( config )
+
+            sources |= sources_fn
 
-    # End loop over tsink
+            outputName = [ outputDatasetName( name ) for name in dsetname ]
 
-if nptFunction == "2" or nptFunction == "both":
+            assert not dataSum or set( outputName ) == set( dataSum ), \
+                "Datasets of file {} do not match ".format( fn ) \
+                + "the other files in configuration " + config
 
-    # Read two-point functions
+            # Loop over datasets
+            for name, outName in zip( dsetname, outputName ):
 
-    twop, twopDatasetName = rw.getDatasets_wNames( twopDir, configList, twop_template, "twop" )
+                data = np.array( dataFile[ name ] )
 
-    # Read momenta lists
+                if outName in dataSum:
 
-    momentaList_twop = rw.getDatasets( twopDir, configList, twop_template, "Momenta_list_xyz" )
+                    dataSum[ outName ] += data
 
-    # Check that all of the momenta are the same
+                else:
 
-    for c in range( configNum ):
+                    # Sum in at least double precision
 
-        momList_0 = momentaList_twop[ c, 0 ].flat
+                    dataType[ outName ] = data.dtype
 
-        for momList in momentaList_twop[ c ]:
+                    dataSum[ outName ] \
+                        = data.astype( np.result_type( data.dtype,
+                                                       np.float64 ) )
 
-            for i in range( momList.size ):
+            # End loop over datasets
+        # Close file
+    # End loop over source files
 
-                assert momList.flat[ i ] == momList_0[ i ], \
-                    "Momenta lists in configuration " + configList[ c ] \
-                    + " do not match"
+    avg = { name: ( dataSum[ name ] / len( filename ) ).astype( dataType[ name ] )
+            for name in dataSum }
 
-print( "Read data from HDF5 files" )
+    return momList_0, avg
 
 
-if nptFunction == "3" or nptFunction == "both":
+# Writes source averaged datasets of one configuration. The file is
+# written under a temporary name and renamed when complete so that
+# an existing output file is always complete.
 
-    for c in range( configNum ):
+# filename: Name of output file
+# momList: Momentum list
+# avg: Dictionary of averaged datasets by dataset name
 
-        momList_0 = momentaList_threep[ c, 0 ].flat
+def writeAverage( filename, momList, avg ):
 
-        for momList in momentaList_threep[ c ]:
+    dirname = os.path.dirname( filename )
 
-            for i in range( momList.size ):
+    if dirname:
 
-                assert momList.flat[ i ] == momList_0[ i ], \
-                    "Momenta lists in configuration " + configList[ c ] \
-                    + " do not match"
+        os.makedirs( dirname, exist_ok=True )
 
+    tmpFilename = filename + ".tmp"
 
-if nptFunction == "2" or nptFunction == "both":
+    with h5py.File( tmpFilename, "w" ) as outputFile:
 
-    for c in range( configNum ):
+        # Write momenta list from first source file, which has already been
+        # checked to be the same as the others
 
-        momList_0 = momentaList_twop[ c, 0 ].flat
+        outputFile.create_dataset( "/Momenta_list_xyz", data=momList )
 
-        for momList in momentaList_twop[ c ]:
+        for name in sorted( avg ):
 
-            for i in range( momList.size ):
+            outputFile.create_dataset( name, data=avg[ name ] )
 
-                assert momList.flat[ i ] == momList_0[ i ], \
-                    "Momenta lists in configuration " + configList[ c ] \
-                    + " do not match"
+    # Close file
 
+    os.replace( tmpFilename, filename )
 
-########################
-# Average over sources #
-########################
-    
-threep_avg = []
-    
-twop_avg = []
-    
-if nptFunction == "3" or nptFunction == "both":
 
-    for threep_ts in threep:
+# Averages the two- and/or three-point functions of one configuration
+# and writes them to its output files
 
-        threep_avg.append( [] )
+# config: Configuration
+# avg_info: Dictionary of directories, templates and keywords from
+#           avgSources() for each n-point function
 
-        for threep_curr in threep_ts:
-    
-            threep_avg[ -1 ].append( np.average( threep_curr, axis=1 ) )
+def avgConfig( config, avg_info ):
 
-if nptFunction == "2" or nptFunction == "both":
+    # Loop over n-point functions
+    for npt in avg_info:
 
-    twop_avg = np.average( twop, axis=1 )
+        filename = sorted( glob( os.path.join( avg_info[ npt ][ 'dir' ],
+                                               config,
+                                               avg_info[ npt ][ 'template' ] ) ) )
 
-######################
-# Write output files #
-######################
+        assert filename, \
+            "No files matching {} were found in {}".format( avg_info[ npt ][ 'template' ],
+                                                            os.path.join( avg_info[ npt ][ 'dir' ],
+                                                                          config ) )
 
-# Loop through configurations
+        momList, avg = averageSources( filename,
+                                       avg_info[ npt ][ 'keywords' ],
+                                       config )
 
-for c in range( configNum ):
-        
-    if nptFunction == "3" or nptFunction == "both":
+        writeAverage( avg_info[ npt ][ 'output' ].replace( "*", config ),
+                      momList, avg )
+
+    # End loop over n-point functions
+
+
+# Averages sources of configurations split between processes and
+# returns the configurations which failed. Configurations whose
+# output files all exist are skipped unless overwrite is True.
+
+# mpi_info: MPI info dictionary from mpi_functions.lqcdjk_mpi_init()
+#           or mpi_functions.lqcdjk_pool_run()
+# configList: List of configurations
+# avg_info: Dictionary of 'dir', 'template', 'keywords' and 'output'
+#           template of each n-point function
+# overwrite (Optional): If True, average configurations whose output
+#                       files exist again
+
+def avgSources( mpi_info, configList, avg_info, overwrite=False ):
+
+    rank = mpi_info[ 'rank' ]
+    procNum = mpi_info[ 'procNum' ]
+
+    if overwrite:
+
+        configList_todo = list( configList )
+
+    else:
+
+        configList_todo = [ config for config in configList
+                            if not all( os.path.isfile( avg_info[ npt ][ 'output' ]\
+                                                        .replace( "*", config ) )
+                                        for npt in avg_info ) ]
+
+    mpi_fncs.mpiPrint( "Skipping {} configurations ".format( len( configList )
+                                                            - len( configList_todo ) )
+                       + "with existing output", mpi_info )
+
+    failed = []
 
-        # Set three-point output filename
+    # Configurations are assigned to processes in turn
 
-        threepOutFilename = threepOut_template.replace( "*", configList[ c ] )
+    # Loop over configurations of this process
+    for ic in range( rank, len( configList_todo ), procNum ):
 
-        with h5py.File( threepOutFilename, "w" ) as outputFile:
-        
-            # Write momenta list from first source file, which has already been 
-            # checked to be the same as the others
-        
-            outputFile.create_dataset( "/Momenta_list_xyz", data=momentaList_threep[ c ][ 0 ][ 0 ] )
+        config = configList_todo[ ic ]
 
-            # Loop over tsink
+        try:
 
-            for threep_ts, threepDsetName_ts in zip( threep_avg, threepDatasetName ):
+            avgConfig( config, avg_info )
 
-                # Loop over insertion currents
+        except Exception as e:
 
-                for threep_curr, threepDsetName_curr in zip( threep_ts, threepDsetName_ts ):
+            print( "Error averaging configuration {}: {}".format( config, e ),
+                   flush=True )
 
-                    # Loop over datasets
+            failed.append( config )
 
-                    for ds in range( len( threep_curr[ c ] ) ):
+            continue
 
-                        # Set name output dataset which is the same as the input
-                        # but without the source (2nd) group
-            
-                        outputDataset = threepDsetName_curr[ c ][ 0 ][ ds ][ 0 ]
+        print( "Averaged configuration {} ({} of {})".format( config, ic + 1,
+                                                              len( configList_todo ) ),
+               flush=True )
 
-                        for grp in range( 2, len( threepDsetName_curr[ c ][ 0 ][ ds ] ) ):
-                            
-                            outputDataset += "/" + threepDsetName_curr[ c ][ 0 ][ ds ][ grp ]
-                    
-                        # Write averaged three-point functions to output file
+    # End loop over configurations
 
-                        outputFile.create_dataset( outputDataset, data=threep_curr[ c ][ ds ] )
+    failed = [ config for failed_p in mpi_info[ 'comm' ].allgather( failed )
+               for config in failed_p ]
 
-                    # End loop over datasets
+    return failed
 
-                # End loop over insertion currents
 
-            # End loop over tsink
+# Average sources from the command line
 
-        # Close threep file
+if __name__ == "__main__":
 
-    # End threep
+    #########################
+    # Parse input arguments #
+    #########################
+
+    parser = argp.ArgumentParser( description="Average Sources" )
+
+    parser.add_argument( "threep_dir", action='store', type=str )
+
+    parser.add_argument( "threep_template", action='store', type=str )
+
+    parser.add_argument( "twop_dir", action='store', type=str )
+
+    parser.add_argument( "twop_template", action='store', type=str )
+
+    parser.add_argument( 't_sink', action='store', \
+                         help="Comma seperated list of t sink's", \
+                         type=lambda s: [int(item) for item in s.split(',')] )
+
+    parser.add_argument( "-npt", "--n_point_function", action='store', type=str, default="both", \
+                         help="n-point functions to average. Should be '2', '3', or 'both'." )
+
+    parser.add_argument( "-3o", "--threep_out", action='store', type=str, default="./threep.*_avgSources.h5" )
+
+    parser.add_argument( "-2o", "--twop_out", action='store', type=str, default="./twop.*_avgSources.h5" )
+
+    parser.add_argument( "-c", "--config_list", action='store', type=str, default="" )
+
+    parser.add_argument( "-np", "--processes", action='store', type=int,
+                         help="Number of processes of this node to "
+                         + "average configurations with, without MPI. "
+                         + "If not given, configurations are split "
+                         + "between MPI processes." )
+
+    parser.add_argument( "--overwrite", action='store_true',
+                         help="Average configurations whose output files "
+                         + "already exist again instead of skipping them." )
+
+    args = parser.parse_args()
+
+    nptFunction = args.n_point_function
+
+    # Check inputs
+
+    assert nptFunction in nptFunction_list, "Error: n-point function not supported. " \
+        + "Supported n-point functions: " + str( nptFunction_list )
+
+    configList = list( fncs.getConfigList( args.config_list, args.threep_dir ) )
+
+    avg_info = {}
+
+    if nptFunction == "3" or nptFunction == "both":
+
+        # Three-point functions of each tsink and insertion current
+
+        avg_info[ "threep" ] = { 'dir': args.threep_dir,
+                                 'template': args.threep_template,
+                                 'keywords': [ [ "threep", "tsink_" + str( ts ), curr ]
+                                               for ts in args.t_sink
+                                               for curr in ins_current ],
+                                 'output': args.threep_out }
 
     if nptFunction == "2" or nptFunction == "both":
 
-        # Set two-point output filename
+        avg_info[ "twop" ] = { 'dir': args.twop_dir,
+                               'template': args.twop_template,
+                               'keywords': [ [ "twop" ] ],
+                               'output': args.twop_out }
 
-        twopOutFilename = twopOut_template.replace( "*", configList[ c ] )
+    ########################
+    # Average over sources #
+    ########################
 
-        with h5py.File( twopOutFilename, "w" ) as outputFile:
-        
-            # Write momenta list from first source file, which has already been 
-            # checked to be the same as the others
+    if args.processes:
 
-            outputFile.create_dataset( "/Momenta_list_xyz", data=momentaList_twop[ c ][ 0 ][ 0 ] )
+        failed = mpi_fncs.lqcdjk_pool_run( avgSources, args.processes,
+                                           configList, avg_info,
+                                           args.overwrite )[ 0 ]
 
-            # Loop over datasets
+        rank = 0
 
-            for ds in range( len( twop_avg[ c ] ) ):
+    else:
 
-                # Set name output dataset which is the same as the input
-                # but without the source (2nd) group
+        mpi_info = mpi_fncs.lqcdjk_mpi_init()
 
-                outputDataset = twopDatasetName[ c ][ 0 ][ ds ][ 0 ]
+        failed = avgSources( mpi_info, configList, avg_info, args.overwrite )
 
-                for grp in range( 2, len( twopDatasetName[ c ][ 0 ][ ds ] ) ):
+        rank = mpi_info[ 'rank' ]
 
-                    outputDataset += "/" + twopDatasetName[ c ][ 0 ][ ds ][ grp ]
+    if rank == 0:
 
-                # Write averaged two-point functions to output file
+        if failed:
 
-                outputFile.create_dataset( outputDataset, data=twop_avg[ c ][ ds ] )
+            print( "Failed to average {} configurations: ".format( len( failed ) )
+                   + ", ".join( failed ) )
 
-            # End loop over datasets
+        else:
 
-        # Close twop file
+            print( "Averaged sources of {} configurations".format( len( configList ) ) )
 
-    # End twop
+    if failed:
 
-# End loop over configs
+        exit( 1 )
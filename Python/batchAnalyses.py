@@ -0,0 +1,226 @@
+import sys
+import json
+import numpy as np
+import argparse as argp
+import mpi_functions as mpi_fncs
+import profiling as prof
+import readWrite as rw
+import ensemble as ens
+import batchPipeline as bp
+
+# Runs a batch of analyses of one ensemble, e.g., several form factors
+# and Mellin moments of a particle, in one MPI job. Two-point functions
+# are read, jackknifed and fit once for all analyses which need the
+# same ones. The batch file is a JSON list of analyses, e.g.,
+#
+# [ { "analysis": "formFactors", "form_factor": "GE_GM",
+#     "particle": "pion", "t_sink": [ 12, 14, 16 ],
+#     "threep_final_momentum_squared": 0, "binSize": 50,
+#     "source_number": [ 16, 16, 16 ] },
+#   { "analysis": "chargesAndMoments", "ratio": "avgX",
+#     "particle": "pion", "t_sink": [ 12, 14, 16 ], "mom_squared": 0,
+#     "binSize": 50, "source_number": 16 } ]
+#
+# where "analysis" is formFactors or chargesAndMoments and the rest are
+# the arguments of formFactors.py or chargesAndMoments.py by their
+# long names.
+
+# Set option so that entire numpy arrays are printed
+
+np.set_printoptions(threshold=sys.maxsize)
+
+#########################
+# Parse input arguments #
+#########################
+
+parser = argp.ArgumentParser( description="Run a batch of analyses "
+                              + "of one ensemble" )
+
+# Set input arguments
+
+parser.add_argument( "threep_dir", action='store', type=str,
+                     help="Directory containing subdirectories of "
+                     + "three-point functions. Subdirectories should "
+                     + "contain three-point functions from a single "
+                     + "configurations and be named after that "
+                     + "configuration." )
+
+parser.add_argument( "threep_tokens", action='store',
+                     type=lambda s: [str(token) for token in s.split(',')],
+                     help="Comma seperated list of filename tokens. "
+                     + "CPU: part before tsink, part before momentum "
+                     + "boost components. GPU: part before momentum "
+                     + "boost components, part after momentum boost; "
+                     + "* for configuration number." )
+
+parser.add_argument( "twop_dir", action='store',
+                     help="Comma seperated list of directories "
+                     + "containing subdirectories of two-point "
+                     + "functions for each particle/flavor "
+                     + "combination.",
+                     type=lambda s: [str(item) for item in s.split(',')] )
+
+parser.add_argument( "twop_template", action='store',
+                     help="Comma seperated list of twop filename templates"
+                     + " with same order as 'twop_dir'.",
+                     type=lambda s: [str(item) for item in s.split(',')] )
+
+parser.add_argument( "batch_file", action='store', type=str,
+                     help="JSON file with the list of analyses." )
+
+parser.add_argument( "-o", "--output_template", action='store',
+                     type=str, default="./*.dat",
+                     help="Template for output files of analyses "
+                     + "which do not give one. '*' will be replaced "
+                     + "with text depending on output data." )
+
+parser.add_argument( "-c", "--config_list", action='store',
+                     type=str, default="",
+                     help="Filename of configuration list file. "
+                     + "If not given, will use list of subdirectories "
+                     + "in 'threepDir'." )
+
+parser.add_argument( "--ensemble", action='store', type=str,
+                     help="Name of ensemble in --ensemble_registry "
+                     + "whose lattice spacing and extent are used. "
+                     + "If not given, defaults in ensemble.py are "
+                     + "used." )
+
+parser.add_argument( "--ensemble_registry", action='store', type=str,
+                     help="JSON file of ensemble information by "
+                     + "name." )
+
+parser.add_argument( "-bw", "--bin_workers", action='store', type=int,
+                     help="Number of workers each process uses to "
+                     + "fit its bins.",
+                     default=1 )
+
+parser.add_argument( "--bin_worker_type", action='store', type=str,
+                     help="Type of workers used to fit bins. Must be "
+                     + "'thread' or 'process'. Processes cannot be "
+                     + "forked once MPI is initialized, so threads are "
+                     + "used instead when running under MPI.",
+                     default="thread" )
+
+parser.add_argument( "--dynamic_bins", action='store_true',
+                     help="Hand out the bins of fits to processes as "
+                     + "they finish their previous bins instead of "
+                     + "splitting them evenly beforehand. Helps when "
+                     + "fits take different times for different "
+                     + "bins." )
+
+parser.add_argument( "--timing", action='store_true',
+                     help="Time reading, jackknifing, fitting and "
+                     + "collectives on each process and print a "
+                     + "report at the end." )
+
+parser.add_argument( "--profile_dir", action='store', type=str,
+                     help="Also run cProfile on each process and "
+                     + "write its statistics to this directory. "
+                     + "Implies --timing." )
+
+parser.add_argument( "--txt_cache_dir", action='store', type=str,
+                     help="Directory for a binary cache of ASCII "
+                     + "correlator files. Files are parsed once and "
+                     + "later runs memory map the cache." )
+
+parser.add_argument( "--results_file", action='store', type=str,
+                     help="HDF5 file all output is written to. "
+                     + "Defaults to the output template with "
+                     + "'batch_results' and the number of "
+                     + "configurations for '*' and the extension .h5." )
+
+parser.add_argument( "--ascii", action='store_true',
+                     help="Also export every output of the results "
+                     + "file as an ASCII file at the end." )
+
+# Parse
+
+args = parser.parse_args()
+
+#########
+# Setup #
+#########
+
+# Set MPI values
+
+mpi_confs_info = mpi_fncs.lqcdjk_mpi_init()
+
+if args.timing or args.profile_dir:
+
+    prof.lqcdjk_profiling_init( mpi_confs_info, args.profile_dir )
+
+if args.txt_cache_dir:
+
+    rw.lqcdjk_txt_cache_init( args.txt_cache_dir )
+
+procNum = mpi_confs_info[ 'procNum' ]
+rank = mpi_confs_info[ 'rank' ]
+
+# Read list of analyses
+
+with open( args.batch_file, "r" ) as batchFile:
+
+    analysisList = json.load( batchFile )
+
+# Directories, filename templates, configurations and lattice
+# parameters of the ensemble
+
+ensemble_info \
+    = ens.lqcdjk_ensemble_info( args.threep_dir, args.threep_tokens,
+                                args.twop_dir, args.twop_template,
+                                args.config_list,
+                                **ens.lqcdjk_ensemble_parameters( args.ensemble_registry,
+                                                                  args.ensemble ) )
+
+configNum = len( ensemble_info[ 'configList' ] )
+
+# Write all output to the results file
+
+if rank == 0:
+
+    if args.results_file:
+
+        results_filename = args.results_file
+
+    else:
+
+        results_filename \
+            = rw.makeResultsFilename( args.output_template,
+                                      "batch_results_{}configs",
+                                      configNum )
+
+    rw.lqcdjk_results_init( results_filename, args.output_template,
+                            dict( vars( args ), script="batchAnalyses.py",
+                                  analyses=json.dumps( analysisList ),
+                                  configNum=configNum,
+                                  procNum=procNum ) )
+
+    # Write output from a thread while computing continues
+
+    rw.lqcdjk_write_queue_init()
+
+# Options used by analyses which do not give them
+
+options = { 'output_template': args.output_template,
+            'bin_workers': args.bin_workers,
+            'bin_worker_type': args.bin_worker_type,
+            'dynamic_bins': args.dynamic_bins }
+
+
+############
+# Analysis #
+############
+
+
+bp.batchAnalyses( ensemble_info, analysisList, mpi_confs_info, options )
+
+if rank == 0:
+
+    rw.lqcdjk_results_finalize( args.ascii )
+
+if args.timing or args.profile_dir:
+
+    prof.lqcdjk_profiling_report( mpi_confs_info, args.profile_dir )
+
+exit()
@@ -0,0 +1,222 @@
+import mpi_functions as mpi_fncs
+import checkpoint as ckpt
+import formFactorsPipeline as ffp
+import chargesAndMomentsPipeline as cmp
+
+# Runs a batch of analyses of one ensemble in one process. The
+# two-point functions of analyses which need the same ones, e.g., the
+# form factors GE_GM, BT10 and FS of a particle, are read, jackknifed
+# and fit once by the first of these analyses, and the data of these
+# stages is given to the others, which only run their three-point
+# function stages.
+
+# Pipeline of each analysis name: its module, setup function and the
+# function which runs its stages
+
+pipelines = { "formFactors": { 'module': ffp,
+                               'setup': ffp.formFactorsSetup,
+                               'run': ffp.formFactors },
+              "chargesAndMoments": { 'module': cmp,
+                                     'setup': cmp.chargesAndMomentsSetup,
+                                     'run': cmp.chargesAndMoments } }
+
+
+# Name of an analysis used in printed messages, e.g.,
+# "formFactors GE_GM pion"
+
+# analysis: Dictionary of an analysis of a batch
+
+def analysisName( analysis ):
+
+    name = [ analysis[ 'analysis' ] ]
+
+    for key in "form_factor", "ratio", "particle":
+
+        if key in analysis:
+
+            name.append( str( analysis[ key ] ) )
+
+    return " ".join( name )
+
+
+# Sets up each analysis of a batch and groups the analyses which can
+# share their two-point function stages
+
+# ensemble_info: Dictionary of ensemble information from
+#                ensemble.lqcdjk_ensemble_info()
+# analysisList: List of dictionaries of analyses. Each has the name of
+#               its pipeline, e.g., "formFactors", under 'analysis' and
+#               the options given to the pipeline's setup function.
+# mpi_confs_info: Dictionary of MPI information from
+#                 mpi_functions.lqcdjk_mpi_init()
+# options (Optional): Options used by all analyses which do not give
+#                     them, e.g., output_template
+
+# Returns list of analysis_info and mpi_confs_info of each analysis
+# and list of groups of indices of analyses which share two-point
+# function stages
+
+def batchSetup( ensemble_info, analysisList, mpi_confs_info, options={} ):
+
+    for analysis in analysisList:
+
+        if analysis.get( 'analysis' ) not in pipelines:
+
+            mpi_fncs.mpiPrintError( "Error (batchPipeline.batchSetup): "
+                                    + "analysis {} not ".format( analysis.get( 'analysis' ) )
+                                    + "supported. Supported analyses: "
+                                    + ", ".join( pipelines ) + ".",
+                                    mpi_confs_info )
+
+    # Each analysis sets its own configuration and bin information
+
+    analysis_info_list = []
+    mpi_info_list = []
+
+    for analysis in analysisList:
+
+        pipeline = pipelines[ analysis[ 'analysis' ] ]
+
+        analysisOptions = dict( options )
+
+        analysisOptions.update( { key: value for key, value
+                                  in analysis.items()
+                                  if key != 'analysis' } )
+
+        mpi_info = dict( mpi_confs_info )
+
+        analysis_info_list.append( pipeline[ 'setup' ]( ensemble_info,
+                                                        analysisOptions,
+                                                        mpi_info ) )
+
+        mpi_info_list.append( mpi_info )
+
+    # End loop over analyses
+
+    # Group analyses of the same pipeline whose two-point function
+    # stages depend on equal entries. Grouping on rank 0 makes sure
+    # every process runs the same stages.
+
+    if mpi_confs_info[ 'rank' ] == 0:
+
+        groups = {}
+
+        for ia, ( analysis, analysis_info ) \
+            in enumerate( zip( analysisList, analysis_info_list ) ):
+
+            module = pipelines[ analysis[ 'analysis' ] ][ 'module' ]
+
+            key = ( analysis[ 'analysis' ], ) \
+                  + tuple( ckpt.dataHash( analysis_info[ name ] )
+                           for name in module.twopInfoList )
+
+            groups.setdefault( key, [] ).append( ia )
+
+        # End loop over analyses
+
+        groupList = list( groups.values() )
+
+    else:
+
+        groupList = None
+
+    groupList = mpi_confs_info[ 'comm' ].bcast( groupList, root=0 )
+
+    return analysis_info_list, mpi_info_list, groupList
+
+
+# Runs a batch of analyses of one ensemble. Output of all analyses
+# goes to the results file if it has been initialized. Output of the
+# two-point function stages is written once for each group of
+# analyses which share them.
+
+# ensemble_info: Dictionary of ensemble information from
+#                ensemble.lqcdjk_ensemble_info()
+# analysisList: List of dictionaries of analyses. Each has the name of
+#               its pipeline, e.g., "formFactors", under 'analysis' and
+#               the options given to the pipeline's setup function.
+# mpi_confs_info: Dictionary of MPI information from
+#                 mpi_functions.lqcdjk_mpi_init()
+# options (Optional): Options used by all analyses which do not give
+#                     them, e.g., output_template
+
+def batchAnalyses( ensemble_info, analysisList, mpi_confs_info,
+                   options={} ):
+
+    analysisNum = len( analysisList )
+
+    analysis_info_list, mpi_info_list, groupList \
+        = batchSetup( ensemble_info, analysisList, mpi_confs_info,
+                      options )
+
+    mpi_fncs.mpiPrint( "Running {} analyses with {} ".format( analysisNum,
+                                                             len( groupList ) )
+                       + "reads and fits of two-point functions",
+                       mpi_confs_info )
+
+    # Loop over groups of analyses
+    for group in groupList:
+
+        pipeline = pipelines[ analysisList[ group[ 0 ] ][ 'analysis' ] ]
+
+        module = pipeline[ 'module' ]
+
+        firstStage = module.stageList[ len( module.twopStageList ) ]
+
+        # Loop over analyses of group
+        for ia in group:
+
+            analysis_info = analysis_info_list[ ia ]
+
+            message = "Analysis {} of {}: ".format( ia + 1, analysisNum ) \
+                      + analysisName( analysisList[ ia ] )
+
+            if ia == group[ 0 ]:
+
+                mpi_fncs.mpiPrint( message, mpi_confs_info )
+
+                # Run two-point function stages and keep the entries
+                # they created or reassigned for the other analyses
+
+                setup = dict( analysis_info )
+
+                for stage in module.twopStageList:
+
+                    module.stageFunctions[ stage ]( analysis_info,
+                                                    mpi_info_list[ ia ] )
+
+                twopData = { name: value for name, value
+                             in analysis_info.items()
+                             if not ( name in setup
+                                      and setup[ name ] is value ) }
+
+                del setup
+
+            else:
+
+                mpi_fncs.mpiPrint( message + ", sharing two-point "
+                                   + "functions with analysis "
+                                   + "{}".format( group[ 0 ] + 1 ),
+                                   mpi_confs_info )
+
+                analysis_info.update( twopData )
+
+            pipeline[ 'run' ]( analysis_info, mpi_info_list[ ia ],
+                               firstStage=firstStage )
+
+            # Free the three-point function data of finished analyses
+
+            analysis_info_list[ ia ] = None
+
+            del analysis_info
+
+        # End loop over analyses of group
+
+        # Free the node-shared two-point function data of the group
+        # before the communicators of the batch can be freed
+
+        mpi_fncs.freeSharedArrays( twopData, module.sharedArrayList )
+
+        del twopData
+
+    # End loop over groups
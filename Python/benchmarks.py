@@ -0,0 +1,541 @@
+import os
+import sys
+import json
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+import argparse as argp
+from time import perf_counter
+import functions as fncs
+import mpi_functions as mpi_fncs
+import readWrite as rw
+import physQuants as pq
+import lqcdjk_fitting as fit
+import syntheticData as sd
+
+# Benchmarks the hot paths of the analysis on synthetic data from
+# syntheticData for several numbers of configurations. Each benchmark
+# is timed on every process and the maximum over processes of the
+# fastest of several repeats is reported along with the peak memory
+# allocated during one more run. Results can be saved as a baseline
+# and later runs compared against it, exiting with status 1 if any
+# benchmark is slower or uses more memory than the baseline by more
+# than the given tolerance. The time and peak memory of importing the
+# library modules in a new interpreter are benchmarked as well, and
+# importing mpi4py.MPI, h5py or scipy.optimize with them, which should
+# only be imported when used, counts as a regression.
+#
+# Run on one process with
+#   python benchmarks.py
+# or on several with
+#   mpirun -np <N> python benchmarks.py
+
+
+#########################
+# Parse input arguments #
+#########################
+
+parser = argp.ArgumentParser( description="Benchmark the analysis on "
+                              + "synthetic data" )
+
+parser.add_argument( "-s", "--sizes", action='store', type=int,
+                     nargs='+', help="Numbers of configurations to "
+                     + "benchmark.", default=[ 32, 128 ] )
+
+parser.add_argument( "-b", "--bin_size", action='store', type=int,
+                     help="Bin size.", default=4 )
+
+parser.add_argument( "-T", "--time_dim", action='store', type=int,
+                     help="Time dimension length.", default=64 )
+
+parser.add_argument( "-q", "--Qsq_max", action='store', type=int,
+                     help="Maximum Q^2 in units of ( 2 pi / L )^2.",
+                     default=4 )
+
+parser.add_argument( "-r", "--repeat", action='store', type=int,
+                     help="Number of times each benchmark is timed.",
+                     default=3 )
+
+parser.add_argument( "-k", "--keyword", action='store', type=str,
+                     nargs='+', help="Only run benchmarks whose "
+                     + "names contain one of these keywords." )
+
+parser.add_argument( "--baseline", action='store', type=str,
+                     help="Baseline file to compare to or save to.",
+                     default=os.path.join( os.path.dirname(
+                         os.path.abspath( __file__ ) ),
+                                           "benchmarks_baseline.json" ) )
+
+parser.add_argument( "--save", action='store_true',
+                     help="Save results as the baseline." )
+
+parser.add_argument( "--tolerance", action='store', type=float,
+                     help="Relative increase over the baseline "
+                     + "which counts as a regression.", default=0.2 )
+
+args = parser.parse_args()
+
+
+#########
+# Setup #
+#########
+
+mpi_info = mpi_fncs.lqcdjk_mpi_init()
+
+comm = mpi_info[ 'comm' ]
+rank = mpi_info[ 'rank' ]
+
+T = args.time_dim
+L = 32
+binSize = args.bin_size
+particle = "pion"
+srcNum = 16
+tsink = [ 12, 14, 16 ]
+m0 = 0.2
+m1 = 0.6
+
+momList = sd.momentumList( args.Qsq_max )
+
+Q, Qsq, Qsq_start, Qsq_end, Qsq_where_Q = fncs.processMomList( momList )
+QNum = len( Q )
+
+twop_model = sd.twopModel( T, Q, m0, m1, L )
+
+threep_model = sd.threepModel( T, tsink[ 0 ], Q, [ 0, 0, 0 ], m0, m1, L )
+
+# Directory of synthetic ensembles written by rank 0
+
+if rank == 0:
+
+    tmpDir = tempfile.TemporaryDirectory( prefix="lqcdjk_bench_" )
+
+    workDir = tmpDir.name
+
+else:
+
+    workDir = None
+
+workDir = comm.bcast( workDir, root=0 )
+
+
+# Sets the MPI information for configNum configurations and writes a
+# synthetic cpu ensemble with that many configurations
+
+def setupSize( configNum ):
+
+    configList = [ "{:0>5}".format( c ) for c in range( configNum ) ]
+
+    mpi_info[ 'configList' ] = configList
+    mpi_info[ 'configNum' ] = configNum
+    mpi_info[ 'binSize' ] = binSize
+
+    mpi_fncs.lqcdjk_mpi_confs_info( mpi_info )
+
+    twopDir = os.path.join( workDir, str( configNum ) )
+
+    if rank == 0:
+
+        sd.writeTwop( twopDir, "twop.h5", configList, twop_model, Q,
+                      particle, srcNum, "cpu" )
+
+    comm.Barrier()
+
+    return twopDir
+
+
+##############
+# Benchmarks #
+##############
+
+# Each benchmark takes the number of configurations and the directory
+# of the synthetic ensemble, sets up its input, and returns the
+# function to be timed
+
+def bench_jackknife( configNum, twopDir ):
+
+    data = sd.noisyConfig( np.broadcast_to( twop_model,
+                                            ( configNum, QNum, T ) ),
+                           0.01, np.random.default_rng( 0 ) )
+
+    return lambda: fncs.jackknife( data, binSize )
+
+
+def bench_getDatasets( configNum, twopDir ):
+
+    dsetname = [ "/twop_{}/ave{}/msq{:0>4}/arr".format( particle,
+                                                        srcNum, qsq )
+                 for qsq in Qsq ]
+
+    return lambda: rw.getDatasets( twopDir, mpi_info[ 'configList_loc' ],
+                                   "twop.h5", dsetname=dsetname[ -1: ] )
+
+
+def bench_readTwopFile( configNum, twopDir ):
+
+    return lambda: rw.readTwopFile( twopDir, "twop.h5",
+                                    mpi_info[ 'configList_loc' ],
+                                    configNum, Q, Qsq, Qsq_start,
+                                    Qsq_end, particle, srcNum, "cpu",
+                                    mpi_info )
+
+
+def bench_calcFormFactorRatio( configNum, twopDir ):
+
+    binNum = configNum // binSize
+
+    rng = np.random.default_rng( 0 )
+
+    # threep[ b, Q, t ], twop[ b, Q, t ]
+
+    threep = sd.noisyConfig( np.broadcast_to( threep_model,
+                                              ( binNum, QNum, T ) ),
+                             0.001, rng )
+    twop = sd.noisyConfig( np.broadcast_to( twop_model,
+                                            ( binNum, QNum, T ) ),
+                           0.001, rng )
+
+    return lambda: pq.calcFormFactorRatio( threep, twop, tsink[ 0 ] )
+
+
+# Inputs of kineFactor and calcFormFactors_SVD
+
+def formFactorInput( configNum ):
+
+    binNum = configNum // binSize
+
+    rng = np.random.default_rng( 0 )
+
+    mEff = m0 * ( 1.0 + 0.001 * rng.standard_normal( binNum ) )
+
+    p_fin = np.array( [ [ 0, 0, 0 ] ] )
+
+    # ratio[ b, p, q, r ]
+
+    ratio = 1.0 + 0.01 * rng.standard_normal( ( binNum, 1, QNum, 4 ) )
+
+    ratio_err = fncs.calcError( ratio, binNum )
+
+    return mEff, p_fin, ratio, ratio_err
+
+
+def bench_kineFactor( configNum, twopDir ):
+
+    mEff, p_fin, ratio, ratio_err = formFactorInput( configNum )
+
+    return lambda: pq.kineFactor( ratio_err, "GE_GM", particle, "u",
+                                  mEff[ mpi_info[ 'binList_loc' ] ],
+                                  p_fin, Q, L, mpi_info )
+
+
+def bench_calcFormFactors_SVD( configNum, twopDir ):
+
+    mEff, p_fin, ratio, ratio_err = formFactorInput( configNum )
+
+    mEff_loc = mEff[ mpi_info[ 'binList_loc' ] ]
+
+    kineFactor_loc = pq.kineFactor( ratio_err, "GE_GM", particle, "u",
+                                    mEff_loc, p_fin, Q, L, mpi_info )
+
+    Qsq_loc, QsqNum, Qsq_where = pq.calcQsq( p_fin, Q, mEff_loc, L,
+                                             mpi_info )
+
+    return lambda: pq.calcFormFactors_SVD( kineFactor_loc, ratio,
+                                           ratio_err, Qsq_where,
+                                           "GE_GM", 1.0, 0, mpi_info )
+
+
+def bench_twoStateFit_twop( configNum, twopDir ):
+
+    twop = fncs.jackknife( sd.noisyConfig( np.broadcast_to( twop_model[ 0 ],
+                                                            ( configNum, T ) ),
+                                           0.01,
+                                           np.random.default_rng( 0 ) ),
+                           binSize )
+
+    return lambda: fit.twoStateFit_twop( twop, 2, 20, m0, T, mpi_info )
+
+
+def bench_twoStateFit_threep( configNum, twopDir ):
+
+    binNum = configNum // binSize
+
+    rng = np.random.default_rng( 0 )
+
+    # threep[ ts, b, t ]
+
+    threep = np.array( [ fncs.jackknife( sd.noisyConfig( np.broadcast_to(
+        sd.threepModel( T, ts, Q[ :1 ], [ 0, 0, 0 ], m0, m1, L )[ 0 ],
+        ( configNum, T ) ), 0.01, rng ), binSize ) for ts in tsink ] )
+
+    ti_to_fit = [ np.arange( 2, ts - 1 ) for ts in tsink ]
+
+    E0 = np.full( binNum, m0 )
+    E1 = np.full( binNum, m1 )
+
+    return lambda: fit.twoStateFit_threep( threep, ti_to_fit, tsink,
+                                           E0, E1, mpi_info )
+
+
+def bench_fitFormFactor_dipole( configNum, twopDir ):
+
+    binNum = configNum // binSize
+
+    rng = np.random.default_rng( 0 )
+
+    # Qsq[ b, qs ], F[ b, qs ]
+
+    Qsq_lat = np.broadcast_to( ( 2.0 * np.pi / L ) ** 2 * Qsq,
+                               ( binNum, len( Qsq ) ) )
+
+    F = fit.dipole( Qsq_lat, 0.8, 1.0 ) \
+        * ( 1.0 + 0.01 * rng.standard_normal( Qsq_lat.shape ) )
+
+    F_err = fncs.calcError( F, binNum )
+
+    return lambda: fit.fitFormFactor_dipole( F, F_err, Qsq_lat, 2,
+                                             mpi_info )
+
+
+benchmarkList = [ bench_jackknife,
+                  bench_getDatasets,
+                  bench_readTwopFile,
+                  bench_calcFormFactorRatio,
+                  bench_kineFactor,
+                  bench_calcFormFactors_SVD,
+                  bench_twoStateFit_twop,
+                  bench_twoStateFit_threep,
+                  bench_fitFormFactor_dipole ]
+
+# Library modules whose import is benchmarked and modules which they
+# should not import until used
+
+importList = [ "functions",
+               "mpi_functions",
+               "readWrite",
+               "physQuants",
+               "lqcdjk_fitting" ]
+
+lazyModuleList = [ "mpi4py.MPI", "h5py", "scipy.optimize" ]
+
+if args.keyword:
+
+    benchmarkList = [ bench for bench in benchmarkList
+                      if any( kw in bench.__name__
+                              for kw in args.keyword ) ]
+
+    importList = [ module for module in importList
+                   if any( kw in "import_" + module
+                           for kw in args.keyword ) ]
+
+
+# Time function on every process, returning the maximum over processes
+# of the fastest of the repeats and the maximum peak memory allocated
+# during one more run
+
+def measure( func ):
+
+    times = []
+
+    for r in range( args.repeat ):
+
+        comm.Barrier()
+
+        t0 = perf_counter()
+
+        func()
+
+        times.append( perf_counter() - t0 )
+
+    # End loop over repeats
+
+    comm.Barrier()
+
+    tracemalloc.start()
+
+    func()
+
+    memory = tracemalloc.get_traced_memory()[ 1 ]
+
+    tracemalloc.stop()
+
+    return comm.allreduce( min( times ), op=max ), \
+        comm.allreduce( memory, op=max )
+
+
+# Import a module in a new interpreter, returning the fastest time of
+# the repeats, the peak memory allocated during one more import, and
+# the modules of lazyModuleList which were imported with it
+
+def measureImport( module ):
+
+    code = "import sys, time, tracemalloc\n" \
+           + "if sys.argv[ 1 ] == 'memory': tracemalloc.start()\n" \
+           + "t0 = time.perf_counter()\n" \
+           + "import {}\n".format( module ) \
+           + "print( time.perf_counter() - t0 )\n" \
+           + "print( tracemalloc.get_traced_memory()[ 1 ] )\n" \
+           + "print( ','.join( m for m in {} ".format( lazyModuleList ) \
+           + "if m in sys.modules ) )"
+
+    def run( mode ):
+
+        return subprocess.run( [ sys.executable, "-c", code, mode ],
+                               cwd=os.path.dirname( os.path.abspath( __file__ ) ),
+                               capture_output=True, text=True,
+                               check=True ).stdout.split( "\n" )
+
+    times = [ float( run( "time" )[ 0 ] ) for r in range( args.repeat ) ]
+
+    output = run( "memory" )
+
+    imported = [ m for m in output[ 2 ].split( "," ) if m ]
+
+    return min( times ), int( output[ 1 ] ), imported
+
+
+#######
+# Run #
+#######
+
+# Smallest increase in time (s) and memory (bytes) over the baseline
+# which counts as a regression, since small benchmarks are noisy
+
+noiseFloor = [ 0.005, 1024 ** 2 ]
+
+# Starting an interpreter makes import times noisier
+
+importNoiseFloor = [ 0.05, 1024 ** 2 ]
+
+results = {}
+
+# Modules of lazyModuleList imported by each import benchmark
+
+eagerImports = {}
+
+status = 0
+
+# Imports are benchmarked on one process, since they do not depend on
+# the size of the ensemble
+
+if rank == 0:
+
+    # Loop over modules
+    for module in importList:
+
+        name = "import_" + module
+
+        seconds, memory, imported = measureImport( module )
+
+        results[ name ] = { "time": seconds, "memory": memory }
+
+        if imported:
+
+            eagerImports[ name ] = imported
+
+    # End loop over modules
+
+# Loop over sizes
+for configNum in args.sizes:
+
+    if configNum % binSize:
+
+        mpi_fncs.mpiPrintError( "Error (benchmarks): number of "
+                                + "configurations {} ".format( configNum )
+                                + "not evenly divided by bin size "
+                                + "{}.".format( binSize ), mpi_info )
+
+    twopDir = setupSize( configNum )
+
+    # Loop over benchmarks
+    for bench in benchmarkList:
+
+        name = "{}[{}]".format( bench.__name__[ len( "bench_" ): ],
+                                configNum )
+
+        seconds, memory = measure( bench( configNum, twopDir ) )
+
+        results[ name ] = { "time": seconds, "memory": memory }
+
+    # End loop over benchmarks
+# End loop over sizes
+
+if rank == 0:
+
+    tmpDir.cleanup()
+
+    baseline = {}
+
+    if os.path.exists( args.baseline ) and not args.save:
+
+        with open( args.baseline, "r" ) as baselineFile:
+
+            baseline = json.load( baselineFile )
+
+    regression = []
+
+    print( "{:<36} {:>10} {:>12} {:>10} {:>10}".format( "benchmark",
+                                                       "time (s)",
+                                                       "memory (MB)",
+                                                       "time/base",
+                                                       "mem/base" ) )
+
+    for name, result in results.items():
+
+        line = "{:<36} {:>10.4f} {:>12.2f}".format( name,
+                                                    result[ "time" ],
+                                                    result[ "memory" ]
+                                                    / 1024 ** 2 )
+
+        if name in baseline:
+
+            ratio = [ result[ key ] / baseline[ name ][ key ]
+                      if baseline[ name ][ key ] else 1.0
+                      for key in ( "time", "memory" ) ]
+
+            line += " {:>10.2f} {:>10.2f}".format( *ratio )
+
+            # Differences smaller than noiseFloor are not regressions
+
+            increase = [ result[ key ] - ( 1.0 + args.tolerance )
+                         * baseline[ name ][ key ]
+                         for key in ( "time", "memory" ) ]
+
+            floor = importNoiseFloor if name.startswith( "import_" ) \
+                    else noiseFloor
+
+            if any( inc > fl for inc, fl in zip( increase, floor ) ):
+
+                regression.append( name )
+
+                line += "  REGRESSION"
+
+        if name in eagerImports:
+
+            if name not in regression:
+
+                regression.append( name )
+
+            line += "  IMPORTS " + ", ".join( eagerImports[ name ] )
+
+        print( line )
+
+    # End loop over results
+
+    if args.save:
+
+        with open( args.baseline, "w" ) as baselineFile:
+
+            json.dump( results, baselineFile, indent=2, sort_keys=True )
+
+        print( "Saved baseline to {}".format( args.baseline ) )
+
+    elif regression:
+
+        print( "Regressions of more than {:.0%} ".format( args.tolerance )
+               + "or imports of {}: ".format( ", ".join( lazyModuleList ) )
+               + ", ".join( regression ) )
+
+        status = 1
+
+sys.exit( comm.bcast( status, root=0 ) )
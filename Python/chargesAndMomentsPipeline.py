@@ -0,0 +1,1641 @@
+import numpy as np
+import functions as fncs
+import mpi_functions as mpi_fncs
+import readWrite as rw
+import physQuants as pq
+import lqcdjk_fitting as fit
+import momentumOrbits as orb
+from mpi4py import MPI
+
+# Calculation of charges and Mellin moments at zero momentum transfer
+# from the ratio of three- and two-point functions as a pipeline of
+# stages which chargesAndMoments.py runs from the command line. As in
+# formFactorsPipeline, chargesAndMomentsSetup() makes a dictionary of
+# analysis information from an ensemble's information and a dictionary
+# of options, and each stage reads what it needs from this dictionary
+# and stores what later stages need in it.
+
+mellin_list = fncs.mellinMomentList()
+GE_list = fncs.GEList()
+
+ratio_list = mellin_list + GE_list
+
+# Stages in order
+
+stageList = [ "read_twop", "fit_twop", "read_threep", "ratio",
+              "two_state_fit" ]
+
+# Stages which use only two-point functions, which are the first
+# stages, and the entries of analysis_info they depend on. Analyses of
+# a batch with equal entries share the data of these stages (see
+# batchPipeline).
+
+twopStageList = [ "read_twop", "fit_twop" ]
+
+twopInfoList = [ 'twopDir', 'twop_template', 'twop_boost_template',
+                 'dataFormat_twop', 'smear_str_list', 'smearNum',
+                 'smear_str_list_boost', 'smearNum_boost', 'particle',
+                 'srcNum', 'configNum', 'binSize', 'momSq',
+                 'momOrbit_where', 'momOrbitCount', 'momOrbitNum', 'L',
+                 'tsf', 'checkFit', 'tsf_fitStart', 'plat_fitStart' ]
+
+# Entries of analysis_info which are node-shared arrays, to be freed 
+# with mpi_functions.freeSharedArrays() when the analyses using them
+# have finished. This pipeline has none.
+
+sharedArrayList = []
+
+# Options of an analysis with their defaults. The rest, i.e.,
+# particle, t_sink, mom_squared, ratio, binSize and source_number,
+# must be given.
+
+optionDefaults = { 'output_template': "./*.dat",
+                   'two_state_fit': False,
+                   'tsf_fit_start': None,
+                   'plat_fit_start': None,
+                   'bin_workers': 1,
+                   'bin_worker_type': "thread",
+                   'dynamic_bins': False }
+
+
+# Sets up an analysis: sets the configurations and bins of each
+# process, checks the options, and reads the momentum list
+
+# ensemble_info: Dictionary of ensemble information from
+#                ensemble.lqcdjk_ensemble_info()
+# options: Dictionary of options with the names of
+#          chargesAndMoments.py's arguments. Options not given are set
+#          from optionDefaults.
+# mpi_confs_info: Dictionary of MPI information from
+#                 mpi_functions.lqcdjk_mpi_init(). Its configuration
+#                 information is set for this analysis.
+
+# Returns dictionary of analysis information
+
+def chargesAndMomentsSetup( ensemble_info, options, mpi_confs_info ):
+
+    options = dict( optionDefaults, **options )
+
+    # Input directories and filename templates
+
+    threepDir = ensemble_info[ 'threepDir' ]
+
+    twopDir = ensemble_info[ 'twopDir' ]
+
+    threep_tokens = ensemble_info[ 'threep_tokens' ]
+
+    twop_template = ensemble_info[ 'twop_template' ]
+
+    L = ensemble_info[ 'L' ]
+
+    # Info on what to analyze
+
+    particle = options[ 'particle' ]
+
+    tsink = options[ 't_sink' ]
+    tsinkNum = len( tsink )
+    ts_range_str = "tsink" + str(tsink[0]) + "_" + str(tsink[-1])
+
+    # Other info
+
+    output_template = options[ 'output_template' ]
+
+    tsf_fitStart = options[ 'tsf_fit_start' ]
+    plat_fitStart = options[ 'plat_fit_start' ]
+
+    if tsf_fitStart and plat_fitStart:
+
+        checkFit = False
+
+    else:
+
+        checkFit = True
+
+    srcNum = options[ 'source_number' ]
+
+    tsf = options[ 'two_state_fit' ]
+
+    momSq = options[ 'mom_squared' ]
+
+    whichRatio = options[ 'ratio' ]
+
+    # Configurations of the ensemble
+
+    mpi_confs_info[ 'configList' ] = ensemble_info[ 'configList' ]
+
+    configNum = len( mpi_confs_info[ 'configList' ] )
+    mpi_confs_info[ 'configNum' ] = configNum
+
+    binSize = options[ 'binSize' ]
+    mpi_confs_info[ 'binSize' ] = binSize
+
+    # Set mpi configuration information
+
+    mpi_fncs.lqcdjk_mpi_confs_info( mpi_confs_info )
+
+    mpi_fncs.lqcdjk_bin_workers_info( mpi_confs_info,
+                                      options[ 'bin_workers' ],
+                                      options[ 'bin_worker_type' ],
+                                      options[ 'dynamic_bins' ] )
+
+    configList_loc = mpi_confs_info[ 'configList_loc' ]
+
+    # Check inputs
+
+    particle_list = fncs.particleList()
+
+    assert whichRatio in ratio_list, \
+        "Error: Ratio " + whichRatio + " not supported. " \
+        + "Supported ratios: " + ", ".join( ratio_list )
+
+    assert particle in particle_list, \
+        "Error: Particle not supported. " \
+        + "Supported particles: " + ", ".join( particle_list )
+
+    # Set flavor strings.
+    # If pion, will not access strange.
+
+    if whichRatio in GE_list:
+
+        if particle == "pion":
+
+            flav_str = [ "" ]
+
+        elif particle == "kaon":
+
+            flav_str = [ "", "" ]
+
+    elif whichRatio in mellin_list:
+
+        if particle == "pion":
+
+            flav_str = [ "_u" ]
+
+        elif particle == "kaon":
+
+            flav_str = [ "_u", "_s" ]
+
+        elif particle == "nucleon":
+
+            flav_str = [ "_IV", "_IS" ]
+
+    flavNum = len( flav_str )
+
+    # Set data format for twop and threep files
+    # and smear strings based on
+    # particle and p^2
+
+    dataFormat_twop, dataFormat_threep \
+        = fncs.setDataFormat( particle, momSq )
+
+    twop_boost_template \
+        = fncs.setTwopBoostTemplate( particle, momSq, twop_template )
+
+    smear_str_list, smear_str_list_boost, smearNum, smearNum_boost \
+        = fncs.setSmearString( particle, momSq )
+
+    # Renormalization factor
+
+    if whichRatio == "avgX":
+
+        Z = 1.123
+
+    elif whichRatio == "avgX2":
+
+        Z = 1.34
+
+    elif whichRatio == "avgX3":
+
+        Z = 1.668
+
+    elif whichRatio == "GE0_local":
+
+        Z = 0.715
+
+    elif whichRatio == "GE0_noether":
+
+        Z = 1.0
+
+    # Read momentum list
+
+    momList = rw.readMomentaList( twopDir[ 0 ],
+                                  twop_template[ 0 ].format(smear_str_list[ 0 ]),
+                                  configList_loc[ 0 ], particle,
+                                  srcNum, momSq, dataFormat_twop[ 0 ],
+                                  mpi_confs_info )
+
+    momBoostNum = len( momList )
+
+    # Orbit of each momentum boost under the cubic group.
+    # Data is averaged over orbits before jackknifing.
+
+    momOrbit_where, momOrbitRep, momOrbitPSq, momOrbitCount \
+        = orb.orbitIndex( momList )
+
+    momOrbitNum = len( momOrbitRep )
+
+    analysis_info = { 'threepDir': threepDir,
+                      'twopDir': twopDir,
+                      'threep_tokens': threep_tokens,
+                      'twop_template': twop_template,
+                      'twop_boost_template': twop_boost_template,
+                      'L': L,
+                      'particle': particle,
+                      'tsink': tsink,
+                      'tsinkNum': tsinkNum,
+                      'ts_range_str': ts_range_str,
+                      'output_template': output_template,
+                      'tsf_fitStart': tsf_fitStart,
+                      'plat_fitStart': plat_fitStart,
+                      'checkFit': checkFit,
+                      'srcNum': srcNum,
+                      'tsf': tsf,
+                      'momSq': momSq,
+                      'whichRatio': whichRatio,
+                      'configNum': configNum,
+                      'binSize': binSize,
+                      'flav_str': flav_str,
+                      'flavNum': flavNum,
+                      'dataFormat_twop': dataFormat_twop,
+                      'dataFormat_threep': dataFormat_threep,
+                      'smear_str_list': smear_str_list,
+                      'smear_str_list_boost': smear_str_list_boost,
+                      'smearNum': smearNum,
+                      'smearNum_boost': smearNum_boost,
+                      'Z': Z,
+                      'momList': momList,
+                      'momBoostNum': momBoostNum,
+                      'momOrbit_where': momOrbit_where,
+                      'momOrbitCount': momOrbitCount,
+                      'momOrbitNum': momOrbitNum }
+
+    return analysis_info
+
+
+# Reads, jackknifes, and folds two-point functions, fits their
+# effective masses, and reads, averages over momentum orbits, and
+# jackknifes boosted two-point functions
+
+# analysis_info: Dictionary of analysis information from
+#                chargesAndMomentsSetup() and earlier stages
+# mpi_confs_info: Dictionary of MPI configuration information
+
+def readTwop( analysis_info, mpi_confs_info ):
+
+    configList_loc = mpi_confs_info[ 'configList_loc' ]
+    binNum = mpi_confs_info[ 'binNum_glob' ]
+    binNum_loc = mpi_confs_info[ 'binNum_loc' ]
+    binList_loc = mpi_confs_info[ 'binList_loc' ]
+    comm = mpi_confs_info[ 'comm' ]
+    recvCount = mpi_confs_info[ 'recvCount' ]
+    recvOffset = mpi_confs_info[ 'recvOffset' ]
+    rank = mpi_confs_info[ 'rank' ]
+
+    smear_str_list = analysis_info[ 'smear_str_list' ]
+    smearNum = analysis_info[ 'smearNum' ]
+    twop_template = analysis_info[ 'twop_template' ]
+    twopDir = analysis_info[ 'twopDir' ]
+    configNum = analysis_info[ 'configNum' ]
+    srcNum = analysis_info[ 'srcNum' ]
+    dataFormat_twop = analysis_info[ 'dataFormat_twop' ]
+    binSize = analysis_info[ 'binSize' ]
+    output_template = analysis_info[ 'output_template' ]
+    particle = analysis_info[ 'particle' ]
+    L = analysis_info[ 'L' ]
+    tsf = analysis_info[ 'tsf' ]
+    plat_fitStart = analysis_info[ 'plat_fitStart' ]
+    checkFit = analysis_info[ 'checkFit' ]
+    tsf_fitStart = analysis_info[ 'tsf_fitStart' ]
+    momSq = analysis_info[ 'momSq' ]
+    smearNum_boost = analysis_info[ 'smearNum_boost' ]
+    momOrbitNum = analysis_info[ 'momOrbitNum' ]
+    smear_str_list_boost = analysis_info[ 'smear_str_list_boost' ]
+    twop_boost_template = analysis_info[ 'twop_boost_template' ]
+    momOrbit_where = analysis_info[ 'momOrbit_where' ]
+
+    ############################
+    # Read Two-point Functions #
+    ############################
+
+
+    # Zero momentum two-point functions
+    # twop[ smr, c, t ]
+
+    twop = [ [] for smr in smear_str_list ]
+
+    for smr, ismr in zip( smear_str_list, range( smearNum ) ):
+
+        twop_template_smr = twop_template[ ismr ].format( smr )
+
+        twop[ ismr ] = rw.readTwopFile_zeroQ( twopDir[ ismr ], configList_loc, 
+                                              configNum,
+                                              twop_template_smr,
+                                              srcNum, 0, 
+                                              dataFormat_twop[ ismr ],
+                                              mpi_confs_info )
+
+    twop = np.array( twop )
+
+    # Time dimension length
+
+    T = twop.shape[ -1 ]
+
+    # Time dimension length after fold
+
+    T_fold = T // 2 + 1
+
+    rangeEnd = T // 2 - 1
+
+
+    ##########################################
+    # Jackknife and fold two-point functions #
+    ##########################################
+
+
+    twop_fold = np.zeros( ( smearNum, binNum, T_fold ) )
+    mEff = np.zeros( ( smearNum, binNum, T_fold ) )
+
+    for ismr in range( smearNum ):
+
+        if binNum_loc:
+
+            twop_jk_loc = fncs.jackknifeBinSubset( twop[ ismr ],
+                                                   binSize,
+                                                   binList_loc )
+
+            # twop_fold[ b, t ]
+
+            twop_fold_loc = fncs.fold( twop_jk_loc )
+
+            # mEff[ b, t ]
+
+            mEff_loc = pq.mEffFromSymTwop( twop_fold_loc )
+
+        else:
+
+            twop_jk_loc = np.array( [] )
+            twop_fold_loc = np.array( [] )
+            mEff_loc = np.array( [] )
+
+        comm.Allgatherv( twop_fold_loc, 
+                         [ twop_fold[ ismr ], 
+                           recvCount * T_fold,
+                           recvOffset * T_fold, 
+                           MPI.DOUBLE ] )
+        comm.Allgatherv( mEff_loc, 
+                         [ mEff[ ismr ], 
+                           recvCount * T_fold, 
+                           recvOffset * T_fold, 
+                           MPI.DOUBLE ] )
+
+
+    ##################
+    # Effective mass #
+    ##################
+
+
+    fitResults = [ [] for smr in smear_str_list ]
+    mEff_fit = np.zeros( ( smearNum, binNum ) )
+    mEff_fit_avg = np.zeros( smearNum )
+
+    for ismr in range( smearNum ):
+
+        if rank == 0 and ismr == 0:
+
+            # mEff_avg[ t ]
+
+            mEff_avg = np.average( mEff[ ismr ], axis=-2 )
+            mEff_err = fncs.calcError( mEff[ ismr ], binNum, axis=-2 )
+
+            avgOutputFilename = rw.makeFilename( output_template, 
+                                                 "mEff_avg_{}_psq{}" \
+                                                 + "_{}configs_binSize{}",
+                                                 particle, 0, 
+                                                 configNum, binSize )
+            rw.writeAvgDataFile( avgOutputFilename, mEff_avg, mEff_err )
+
+        # End if first rank
+
+        # Fit the effective mass and two-point functions 
+
+        try:
+
+            fitResults[ ismr ] \
+                = fit.effEnergyTwopFit( mEff[ ismr ], twop_fold[ ismr ],
+                                        rangeEnd, 0, L, tsf,
+                                        mpi_confs_info,
+                                        plat_t_low_range=[plat_fitStart],
+                                        checkFit=checkFit,
+                                        fitType="twop",
+                                        tsf_t_low_range=[tsf_fitStart] )
+
+        except fit.lqcdjk_BadFitError as error: # Bad twop fit
+
+            mpi_fncs.mpiPrint( error, mpi_confs_info )
+            mpi_fncs.mpiPrint( " Will try fit on effective mass.", 
+                               mpi_confs_info )
+
+            try:
+
+                fitResults[ ismr ] \
+                    = fit.effEnergyTwopFit( mEff[ ismr ], 
+                                            twop_fold[ ismr ],
+                                            rangeEnd, 0, L, tsf,
+                                            mpi_confs_info,
+                                            tsf_t_low_range=[tsf_fitStart],
+                                            plat_t_low_range=[plat_fitStart],
+                                            checkFit=checkFit,
+                                            fitType="effEnergy" )
+
+            except fit.lqcdjk_BadFitError as error: # Bad effEnergy fit
+
+                mpi_fncs.mpiPrintError( "ERROR (lqcdjk_fitting.mEffTwopFit):"
+                                      + str( error ), mpi_confs_info )
+
+            # End bad effEnergy fit
+        # End bad twop fit
+
+        fitParams = fitResults[ ismr ][ 0 ]
+        chiSq = fitResults[ ismr ][ 1 ]
+
+        mEff_fit[ ismr ] = fitResults[ ismr ][ 2 ]
+
+        rangeStart = fitResults[ ismr ][ 3 ]
+        mEff_rangeStart = fitResults[ ismr ][ 4 ]
+
+        fitType = fitResults[ ismr ][ 5 ]
+
+        if rank == 0 and ismr == 0:
+
+            mEffFit_str = "2s" + str( rangeStart ) \
+                          + ".2e" + str( rangeEnd )
+
+            if tsf:
+
+                if fitType == "twop":
+
+                    E0_mEff = fitParams[ :, 2 ]
+                    E1_mEff = fitParams[ :, 3 ]
+
+                elif fitType == "effEnergy":
+
+                    #c = fitParams[ :, 0 ]
+                    E0_mEff = fitParams[ :, 1 ]
+                    E1_mEff = fitParams[ :, 2 ]
+                """
+                # Calculate fitted curve
+
+                curve, \
+                t_s = fit.calcmEffTwoStateCurve( np.ones( binNum ),
+                c, E0_mEff, E1_mEff, T,
+                rangeStart,
+                rangeEnd )
+
+                curveOutputFilename = rw.makeFilename( output_template,
+                "mEff_2sf_curve_{}",
+                mEffFit_str )
+                """
+                E0_mEff_avg = np.average( E0_mEff, axis=0 )
+                E0_mEff_err = fncs.calcError( E0_mEff, binNum )
+
+                E1_mEff_avg = np.average( E1_mEff, axis=0 )
+                E1_mEff_err = fncs.calcError( E1_mEff, binNum )
+
+                mEff_tsf_outputFilename = rw.makeFilename( output_template,
+                                                           "mEff_{}_2sf_{}_{}" \
+                                                           + "_psq{}_{}configs_binSize{}",
+                                                           fitType, particle, 
+                                                           mEffFit_str, 0,
+                                                           configNum, binSize )
+                rw.writeFitDataFile( mEff_tsf_outputFilename, E0_mEff_avg,
+                                     E0_mEff_err, rangeStart, rangeEnd )
+
+                chiSqOutputFilename = rw.makeFilename( output_template,
+                                                       "mEff_{}_2sf_chiSq_{}_{}" \
+                                                       + "_psq{}_{}configs_binSize{}",
+                                                       fitType, particle, 
+                                                       mEffFit_str, 0,
+                                                       configNum, binSize )
+
+            else: # One-state fit
+                """
+                c = fitParams[ :, 0 ]
+                E0_mEff = fitParams[ :, 1 ]
+
+                # Calculate fitted curve
+
+                curve, t_s = fit.calcTwopOneStateCurve( c, E0_mEff, T,
+                rangeStart, rangeEnd )
+
+                curveOutputFilename = rw.makeFilename( output_template,
+                "twop_1sf_curve_{}",
+                mEffFit_str )
+                """
+                chiSqOutputFilename = rw.makeFilename( output_template,
+                                                       "mEff_{}_1sf_chiSq_{}_{}"
+                                                       + "_psq{}_{}configs_binSize{}",
+                                                       "twop", particle, 
+                                                       mEffFit_str, 0,
+                                                       configNum, binSize )
+
+            # End if one-state fit
+
+            #curve_avg = np.average( curve, axis=0 )
+            #curve_err = fncs.calcError( curve, binNum )
+
+            chiSq_avg = np.average( chiSq, axis=0 )
+            chiSq_err = fncs.calcError( chiSq, binNum )
+
+            # Write output files
+
+            #rw.writeAvgDataFile_wX( curveOutputFilename, t_s,
+            #                        curve_avg, curve_err )
+
+            rw.writeFitDataFile( chiSqOutputFilename, chiSq_avg,
+                                 chiSq_err, rangeStart, rangeEnd )
+
+            mEff_fit_avg[ ismr ] = np.average( mEff_fit[ ismr ], axis=0 )
+            mEff_fit_err = fncs.calcError( mEff_fit[ ismr ], binNum )
+
+            mEff_plat_fit_str = "2s" + str( mEff_rangeStart ) \
+                                + ".2e" + str( rangeEnd )
+
+            mEff_outputFilename = rw.makeFilename( output_template,
+                                                   "mEff_plat_fit_{}_{}" \
+                                                   + "_psq{}_{}configs_binSize{}",
+                                                   particle, mEff_plat_fit_str, 
+                                                   0, configNum, binSize )
+            rw.writeFitDataFile( mEff_outputFilename, mEff_fit_avg[ ismr ],
+                                 mEff_fit_err, mEff_rangeStart, rangeEnd )
+
+        # End not first process
+
+    mEff_fit = comm.bcast( mEff_fit, root=0 )
+    mEff_fit_avg = comm.bcast( mEff_fit_avg, root=0 )
+
+    # End loop over smear
+
+
+    ###############################
+    # Boosted two-point functions #
+    ###############################
+
+
+    if momSq > 0:
+
+        twop_boost_fold_p = np.zeros( ( smearNum_boost, 
+                                        momOrbitNum, 
+                                        binNum, T_fold ) )
+
+        # Loop over smear
+        for smr, ismr in zip( smear_str_list_boost, range( smearNum_boost ) ):
+
+            twop_template_smr = twop_boost_template[ ismr ].format( smr )
+
+            # twop_boost[ p, c, t ]
+
+            twop_boost = rw.readTwopFile_zeroQ( twopDir[ ismr ], 
+                                                configList_loc, 
+                                                configNum,
+                                                twop_template_smr, 
+                                                srcNum, momSq,
+                                                dataFormat_twop[ ismr ], 
+                                                mpi_confs_info )
+
+            # Average over momentum orbits
+            # twop_boost[ p, c, t ] -> twop_boost[ orbit, c, t ]
+
+            twop_boost = orb.averageOverOrbits( twop_boost, momOrbit_where,
+                                                axis=0 )
+
+            # Loop over momentum orbits
+            for imom in range( momOrbitNum ):
+
+                if binNum_loc:
+
+                    twop_boost_jk_loc = fncs.jackknifeBinSubset( twop_boost[imom],
+                                                                 binSize,
+                                                                 binList_loc )
+
+                    twop_boost_fold_loc = fncs.fold( twop_boost_jk_loc )
+
+                else:
+
+                    twop_boost_fold_loc = np.array( [] )
+
+                comm.Allgatherv( twop_boost_fold_loc, 
+                                 [ twop_boost_fold_p[ ismr, imom ],
+                                   recvCount * T_fold,
+                                   recvOffset * T_fold, 
+                                   MPI.DOUBLE ] )
+
+    analysis_info[ 'T' ] = T
+    analysis_info[ 'fitResults' ] = fitResults
+    analysis_info[ 'fitType' ] = fitType
+    analysis_info[ 'mEff' ] = mEff
+    analysis_info[ 'mEff_fit' ] = mEff_fit
+    analysis_info[ 'mEff_fit_avg' ] = mEff_fit_avg
+    analysis_info[ 'rangeEnd' ] = rangeEnd
+    analysis_info[ 'rangeStart' ] = rangeStart
+    analysis_info[ 'twop_fold' ] = twop_fold
+
+    if momSq > 0:
+
+        analysis_info[ 'twop_boost_fold_p' ] = twop_boost_fold_p
+
+
+# Fits two-point functions and writes the fit parameters and curves
+
+# analysis_info: Dictionary of analysis information from
+#                chargesAndMomentsSetup() and earlier stages
+# mpi_confs_info: Dictionary of MPI configuration information
+
+def fitTwop( analysis_info, mpi_confs_info ):
+
+    binNum = mpi_confs_info[ 'binNum_glob' ]
+    comm = mpi_confs_info[ 'comm' ]
+    rank = mpi_confs_info[ 'rank' ]
+
+    momSq = analysis_info[ 'momSq' ]
+    smearNum_boost = analysis_info[ 'smearNum_boost' ]
+    smear_str_list_boost = analysis_info[ 'smear_str_list_boost' ]
+    smearNum = analysis_info[ 'smearNum' ]
+    smear_str_list = analysis_info[ 'smear_str_list' ]
+    momOrbitCount = analysis_info[ 'momOrbitCount' ]
+    L = analysis_info[ 'L' ]
+    tsf = analysis_info[ 'tsf' ]
+    tsf_fitStart = analysis_info[ 'tsf_fitStart' ]
+    plat_fitStart = analysis_info[ 'plat_fitStart' ]
+    checkFit = analysis_info[ 'checkFit' ]
+    fitType = analysis_info[ 'fitType' ]
+    mEff = analysis_info[ 'mEff' ]
+    mEff_fit_avg = analysis_info[ 'mEff_fit_avg' ]
+    T = analysis_info[ 'T' ]
+    twop_fold = analysis_info[ 'twop_fold' ]
+    rangeStart = analysis_info[ 'rangeStart' ]
+    rangeEnd = analysis_info[ 'rangeEnd' ]
+    fitResults = analysis_info[ 'fitResults' ]
+    output_template = analysis_info[ 'output_template' ]
+    particle = analysis_info[ 'particle' ]
+    configNum = analysis_info[ 'configNum' ]
+    binSize = analysis_info[ 'binSize' ]
+
+    if momSq > 0:
+
+        twop_boost_fold_p = analysis_info[ 'twop_boost_fold_p' ]
+
+    ###########################
+    # Fit two-point functions #
+    ###########################
+
+
+    if momSq > 0:
+
+        c0 = np.zeros( ( smearNum_boost, binNum ) )
+        c1 = np.zeros( ( smearNum_boost, binNum ) )
+        E0 = np.zeros( ( smearNum_boost, binNum ) )
+        E1 = np.zeros( ( smearNum_boost, binNum ) )
+
+        smear_to_loop_over = zip( smear_str_list_boost, range( smearNum_boost ) )
+        twopFit_str = [ [] for smr in smear_str_list_boost ]
+
+    else:
+
+        c0 = np.zeros( ( smearNum, binNum ) )
+        c1 = np.zeros( ( smearNum, binNum ) )
+        E0 = np.zeros( ( smearNum, binNum ) )
+        E1 = np.zeros( ( smearNum, binNum ) )
+
+        smear_to_loop_over = zip( smear_str_list, range( smearNum ) )
+        twopFit_str = [ [] for smr in smear_str_list ]
+
+    # Loop over smear
+    for smr, ismr in smear_to_loop_over:
+
+        if momSq > 0: # Boosted two-point functions
+
+            # Average over momenta
+
+            twop_to_fit = np.average( twop_boost_fold_p[ ismr ], axis=0,
+                                      weights=momOrbitCount )
+            mEff_to_fit = pq.mEffFromSymTwop( twop_to_fit )
+
+            if np.any( np.isnan( mEff_to_fit ) ):
+
+                rangeEnd = min( np.where( np.isnan( mEff_to_fit ) )[-1] ) - 1
+
+            # End nan in mEff_to_fit
+
+            try:
+
+                fitResults_twop \
+                    = fit.effEnergyTwopFit( mEff_to_fit, twop_to_fit,
+                                            rangeEnd, momSq, L, tsf,
+                                            mpi_confs_info,
+                                            tsf_t_low_range=[tsf_fitStart],
+                                            plat_t_low_range=[plat_fitStart],
+                                            checkFit=checkFit,
+                                            fitType="twop" )
+
+                fitParams_twop = fitResults_twop[ 0 ]
+                twop_rangeStart = fitResults_twop[ 3 ]
+
+                mpi_fncs.mpiPrint( fitResults_twop[ 4 ], mpi_confs_info )
+
+            except fit.lqcdjk_BadFitError as error:
+
+                mpi_fncs.mpiPrint( error + " Will try fit on effective energy." )
+
+                try:
+
+                    fitResults_tmp \
+                        = fit.effEnergyTwopFit( mEff_to_fit, twop_to_fit,
+                                                rangeEnd, momSq, L, tsf,
+                                                mpi_confs_info,
+                                                tsf_t_low_range=[tsf_fitStart],
+                                                plat_t_low_range=[plat_fitStart],
+                                                checkFit=checkFit,
+                                                fitType="effEnergy" )
+
+                except fit.lqcdjk_BadFitError as error:
+
+                    mpi_fncs.mpiPrintError( "ERROR (lqcdjk_fitting.mEffTwopFit):"
+                                          + str( error ), mpi_confs_info )
+
+                # End bad mEff fit
+
+                twop_rangeStart = fitResults_tmp[ 3 ]
+
+                twop_rangeStart = comm.bcast( twop_rangeStart, root=0 )
+
+                E_guess = np.sqrt( mEff_fit_avg[ ismr ] ** 2 
+                                   + ( 2.0 * np.pi / L ) ** 2 * momSq )
+
+                fitParams_twop,chiSq=fit.twoStateFit_twop( twop_to_fit,
+                                                           twop_rangeStart,
+                                                           rangeEnd, 
+                                                           E_guess, T,
+                                                           mpi_confs_info )
+
+            # End bad twop fit
+
+        else: # Zero momentum two-point functions
+
+            twop_to_fit = twop_fold[ ismr ]
+
+            if fitType == "effEnergy":
+
+                try:
+
+                    fitResults_twop \
+                        = fit.effEnergyTwopFit( mEff[ ismr ], 
+                                                twop_to_fit[ ismr ],
+                                                rangeEnd, momSq, L, tsf,
+                                                mpi_confs_info,
+                                                tsf_t_low_range=[tsf_fitStart],
+                                                plat_t_low_range=[plat_fitStart],
+                                                checkFit=checkFit,
+                                                fitType="twop" )
+
+                    twop_rangeStart = fitResults_twop[ 3 ]
+                    fitParams_twop = fitResults_twop[ 0 ]
+
+                except fit.lqcdjk_BadFitError as error:
+
+                    mpi_fncs.mpiPrint( error, mpi_confs_info )
+                    mpi_fncs.mpiPrint( " Will use fit start from fitting "
+                                       + "effective energy.", mpi_confs_info )
+
+                    twop_rangeStart = rangeStart
+
+                    if tsf:
+
+                        E_guess = mEff_fit_avg[ ismr ]
+
+                        fitParams_twop, chiSq \
+                            = fit.twoStateFit_twop( twop_to_fit,
+                                                    twop_rangeStart,
+                                                    rangeEnd, 
+                                                    E_guess, T,
+                                                    mpi_confs_info )
+
+                    else: # One-state fit
+
+                        fitParams_twop,chiSq \
+                            = fit.oneStateFit_twop( twop_to_fit,
+                                                    twop_rangeStart,
+                                                    rangeEnd, T )
+
+            elif fitType == "twop":
+
+                fitParams_twop = fitResults[ ismr ][ 0 ]
+                twop_rangeStart = fitResults[ ismr ][ 3 ]
+
+        # End if zero momentum boost
+
+        if tsf:
+
+            c0[ ismr ] = np.asarray( fitParams_twop[ :, 0 ],
+                                     order='c', dtype=float )
+            c1[ ismr ] = np.asarray( fitParams_twop[ :, 1 ],
+                                     order='c', dtype=float )
+            E0[ ismr ] = np.asarray( fitParams_twop[ :, 2 ],
+                                     order='c', dtype=float )
+            E1[ ismr ] = np.asarray( fitParams_twop[ :, 3 ],
+                                     order='c', dtype=float )
+
+        else: # One-state Fit
+
+            c0[ ismr ] = np.asarray( fitParams_twop[ :, 0 ],
+                                     order='c', dtype=float )
+            E0[ ismr ] = np.asarray( fitParams_twop[ :, 1 ],
+                                     order='c', dtype=float )
+
+        # End one-state fit
+
+
+        ######################################################
+        # Write the two-point functions and their fit curves #
+        ######################################################
+
+
+        if rank == 0:
+
+            if tsf:
+
+                twop_curve, ts_twop \
+                    = fit.calcTwopTwoStateCurve( c0[ ismr ], c1[ ismr ], 
+                                                 E0[ ismr ], E1[ ismr ], T,
+                                                 twop_rangeStart, 
+                                                 rangeEnd )
+
+                twopFit_str[ ismr ] = "2s" + str( twop_rangeStart ) \
+                                      + ".2e" + str( rangeEnd )
+
+                twopParams_filename = rw.makeFilename( output_template,
+                                                       "twop_2sf_params_per_bin"
+                                                       + "_{}_{}_psq{}_"
+                                                       + "{}configs_binSize{}{}",
+                                                       particle, twopFit_str[ ismr ],
+                                                       momSq, configNum, 
+                                                       binSize, smr )
+
+                rw.writeDataFile( twopParams_filename, fitParams_twop )
+
+                fitParams_twop_avg \
+                    = np.concatenate( ( [ 0, 0, 0 ], \
+                                        np.average( fitParams_twop, \
+                                                    axis=0 ) ) )
+                fitParams_twop_err \
+                    = np.concatenate( ( [ 0, 0, 0 ], \
+                                        fncs.calcError( fitParams_twop, \
+                                                        binNum ) ) )
+
+                fitParams_twopOutputFilename \
+                    = rw.makeFilename( output_template,
+                                       "twop_2sf_params_{}_{}" \
+                                       + "_psq{}_{}configs_binSize{}{}",
+                                       particle, twopFit_str[ ismr ], 
+                                       momSq, configNum, binSize, smr )
+                rw.writeTSFParamsFile( fitParams_twopOutputFilename, \
+                                       fitParams_twop_avg, fitParams_twop_err )
+
+            else: # One-state fit
+
+                twop_curve, ts_twop \
+                    = fit.calcTwopOneStateCurve( c0[ ismr ], E0[ ismr ], T,
+                                                 twop_rangeStart, 
+                                                 rangeEnd )
+
+            # End one-state fit
+
+            # Average over bins
+
+            twop_avg = np.average( twop_to_fit, axis=-2 )
+            twop_err = fncs.calcError( twop_to_fit, binNum, axis=-2 )
+
+            twop_curve_avg = np.average( twop_curve, axis=-2 )
+            twop_curve_err = fncs.calcError( twop_curve, binNum, axis=-2 )
+
+            # Write twop output file for each momentum
+
+            twop_outFilename = rw.makeFilename( output_template,
+                                                "twop_{}_psq{}" \
+                                                + "_{}configs_binSize{}{}",
+                                                particle, momSq,
+                                                configNum, binSize, smr )
+
+            rw.writeAvgDataFile( twop_outFilename, twop_avg, twop_err )
+
+            twop_curve_outFilename = rw.makeFilename( output_template,
+                                                      "twop_2sf_curve_{}_psq{}" \
+                                                      + "_{}configs_binSize{}{}",
+                                                      particle, momSq,
+                                                      configNum, binSize, smr )
+
+            rw.writeAvgDataFile_wX( twop_curve_outFilename, ts_twop,
+                                    twop_curve_avg, twop_curve_err )
+
+        # End first process
+    # End loop over smear
+
+    if particle == "pion" or particle == "nucleon":
+
+        ismr_flav = [ 0 ]
+
+    else:
+
+        if momSq == 0:
+
+            ismr_flav = [ 1, 2 ]
+
+        else:
+
+            ismr_flav = [ 0, 1 ]
+
+    analysis_info[ 'E0' ] = E0
+    analysis_info[ 'E1' ] = E1
+    analysis_info[ 'c0' ] = c0
+    analysis_info[ 'c1' ] = c1
+    analysis_info[ 'ismr_flav' ] = ismr_flav
+    analysis_info[ 'twopFit_str' ] = twopFit_str
+
+
+# Reads three-point functions, averages them over momentum orbits,
+# and jackknifes them
+
+# analysis_info: Dictionary of analysis information from
+#                chargesAndMomentsSetup() and earlier stages
+# mpi_confs_info: Dictionary of MPI configuration information
+
+def readThreep( analysis_info, mpi_confs_info ):
+
+    binNum = mpi_confs_info[ 'binNum_glob' ]
+    configList_loc = mpi_confs_info[ 'configList_loc' ]
+    binList_loc = mpi_confs_info[ 'binList_loc' ]
+    comm = mpi_confs_info[ 'comm' ]
+    recvCount = mpi_confs_info[ 'recvCount' ]
+    recvOffset = mpi_confs_info[ 'recvOffset' ]
+
+    momOrbitNum = analysis_info[ 'momOrbitNum' ]
+    flavNum = analysis_info[ 'flavNum' ]
+    tsinkNum = analysis_info[ 'tsinkNum' ]
+    T = analysis_info[ 'T' ]
+    tsink = analysis_info[ 'tsink' ]
+    momBoostNum = analysis_info[ 'momBoostNum' ]
+    whichRatio = analysis_info[ 'whichRatio' ]
+    threepDir = analysis_info[ 'threepDir' ]
+    configNum = analysis_info[ 'configNum' ]
+    threep_tokens = analysis_info[ 'threep_tokens' ]
+    srcNum = analysis_info[ 'srcNum' ]
+    momList = analysis_info[ 'momList' ]
+    particle = analysis_info[ 'particle' ]
+    dataFormat_threep = analysis_info[ 'dataFormat_threep' ]
+    L = analysis_info[ 'L' ]
+    momOrbit_where = analysis_info[ 'momOrbit_where' ]
+    binSize = analysis_info[ 'binSize' ]
+    momOrbitCount = analysis_info[ 'momOrbitCount' ]
+
+    ##############################
+    # Read three-point functions #
+    ##############################
+
+
+    # threep_p_jk[ orbit, flav, ts, b, t ]
+
+    threep_p_jk = np.zeros( ( momOrbitNum, flavNum,
+                              tsinkNum, binNum, T ) )
+
+    # Loop over tsink
+    for ts, its in zip( tsink, range( tsinkNum ) ) :
+
+        # Sum over the momenta of each orbit, to which each momentum 
+        # is added when read so that only one momentum is held at once
+        # threep_orbitSum[ orbit, iflav, c, t ]
+
+        threep_orbitSum = None
+
+        # Loop over momenta
+        for imom in range( momBoostNum ):
+
+            if whichRatio in mellin_list:
+
+                threep_mom = rw.getMellinMomentThreep( threepDir, 
+                                                       configList_loc,
+                                                       configNum, 
+                                                       threep_tokens,
+                                                       srcNum, ts,
+                                                       momList[ imom ],
+                                                       particle, 
+                                                       dataFormat_threep, 
+                                                       whichRatio, L, T, 
+                                                       mpi_confs_info )
+
+            elif whichRatio in GE_list:
+
+                if whichRatio == "GE0_local":
+
+                    insType = "local"
+
+                elif whichRatio == "GE0_noether":
+
+                    insType = "noether"
+
+                threep_mom = rw.readEMFile( threepDir, 
+                                            configList_loc,
+                                            configNum,
+                                            threep_tokens, 
+                                            srcNum, ts, momList[ imom ], 
+                                            particle, dataFormat_threep, 
+                                            insType, T, 
+                                            mpi_confs_info )
+
+            # threep_mom[ iflav, c, t ]
+
+            threep_mom = np.asarray( threep_mom )
+
+            if threep_orbitSum is None:
+
+                threep_orbitSum = np.zeros( ( momOrbitNum, ) 
+                                            + threep_mom.shape )
+
+            threep_orbitSum[ momOrbit_where[ imom ] ] += threep_mom
+
+        # End loop over momenta
+
+        # Average over momentum orbits before jackknifing
+        # threep_p[ orbit, iflav, c, t ]
+
+        threep_p = threep_orbitSum \
+                   / np.reshape( momOrbitCount,
+                                 ( -1, ) + ( 1, ) * threep_mom.ndim )
+
+        # Loop over momentum orbits
+        for imom in range( momOrbitNum ):
+
+            # Loop over flavor
+            for iflav in range( flavNum ):
+
+                # Jackknife
+
+                threep_p_jk_loc \
+                    = fncs.jackknifeBinSubset( threep_p[ imom, iflav ],
+                                               binSize, binList_loc )
+
+                comm.Allgatherv( threep_p_jk_loc,
+                                 [ threep_p_jk[ imom, iflav, its ],
+                                   recvCount * T,
+                                   recvOffset * T,
+                                   MPI.DOUBLE ] )
+
+            # End loop over flavor
+        # End loop over momentum orbits
+    # End loop over tsink
+
+    # Average threep over momenta
+    # threep_jk[ flav, ts, b, t ]
+
+    threep_jk = np.average( threep_p_jk, axis=0, weights=momOrbitCount )
+
+    analysis_info[ 'threep_jk' ] = threep_jk
+
+
+# Calculates ratios of three- and two-point functions and fits their
+# plateaus
+
+# analysis_info: Dictionary of analysis information from
+#                chargesAndMomentsSetup() and earlier stages
+# mpi_confs_info: Dictionary of MPI configuration information
+
+def chargesAndMomentsFromRatio( analysis_info, mpi_confs_info ):
+
+    rank = mpi_confs_info[ 'rank' ]
+    binNum = mpi_confs_info[ 'binNum_glob' ]
+
+    flavNum = analysis_info[ 'flavNum' ]
+    tsinkNum = analysis_info[ 'tsinkNum' ]
+    T = analysis_info[ 'T' ]
+    tsink = analysis_info[ 'tsink' ]
+    threep_jk = analysis_info[ 'threep_jk' ]
+    c0 = analysis_info[ 'c0' ]
+    ismr_flav = analysis_info[ 'ismr_flav' ]
+    E0 = analysis_info[ 'E0' ]
+    whichRatio = analysis_info[ 'whichRatio' ]
+    Z = analysis_info[ 'Z' ]
+    mEff_fit = analysis_info[ 'mEff_fit' ]
+    momSq = analysis_info[ 'momSq' ]
+    L = analysis_info[ 'L' ]
+    particle = analysis_info[ 'particle' ]
+    output_template = analysis_info[ 'output_template' ]
+    flav_str = analysis_info[ 'flav_str' ]
+    configNum = analysis_info[ 'configNum' ]
+    binSize = analysis_info[ 'binSize' ]
+
+    ####################
+    # Calculate ratio #
+    ####################
+
+
+    if rank == 0:
+
+        # ratio[ flav, ts, b, t ]
+
+        ratio = np.zeros( ( flavNum, tsinkNum, binNum, T ) )
+
+        # Loop over flavor
+        for iflav in range( flavNum ):
+            # Loop over tsink
+            for ts, its in zip( tsink, range( tsinkNum ) ) :
+
+                #mpi_fncs.mpiPrint(threep_jk[iflav,its][0],
+                #                  mpi_confs_info)
+                #mpi_fncs.mpiPrint(np.average(c0[ismr_flav[iflav]],
+                #                             axis=0),
+                #                  mpi_confs_info)
+                #mpi_fncs.mpiPrint(np.average(E0[ismr_flav[iflav]],
+                #                             axis=0),
+                #                  mpi_confs_info)
+
+                if whichRatio in mellin_list:
+
+                    ratio[ iflav, its ] \
+                        = Z * pq.calcMellin_twopFit( threep_jk[ iflav, its ],
+                                                     ts, mEff_fit[ 0 ],
+                                                     momSq, L, 
+                                                     c0[ ismr_flav[ iflav ] ],
+                                                     E0[ ismr_flav[ iflav ] ], 
+                                                     whichRatio,
+                                                     mpi_confs_info )
+
+                elif whichRatio in GE_list:
+
+                    ratio[ iflav, its] \
+                        = Z * pq.calcMatrixElemEM_twopFit( threep_jk[iflav, its],
+                                                           ts, 
+                                                           c0[ismr_flav[iflav]], 
+                                                           E0[ismr_flav[iflav]] ) 
+
+            # End loop over tsink
+        # End loop over flavor
+
+        if whichRatio in GE_list and particle == "kaon":
+
+            ratio = np.array( [ 2. / 3. * ratio[ 0 ] - 1. / 3. * ratio[ 1 ] ] )
+
+            flavNum = 1
+
+        # End if kaon GE(0) 
+
+        # Average over bins
+        # ratio_avg[ flav, ts, t ]
+
+        ratio_avg = np.average( ratio, axis=-2 )
+        ratio_err = fncs.calcError( ratio, binNum, axis=-2 )
+
+        threep_avg = np.average( threep_jk, axis=-2 )
+        threep_err = fncs.calcError( threep_jk, binNum, axis=-2 )
+
+        # Loop over flavor
+        for iflav in range( flavNum ):
+            # Loop over tsink
+            for ts, its in zip( tsink, range( tsinkNum ) ) :
+
+                # Write threep output file
+
+                threep_outFilename = rw.makeFilename( output_template,
+                                                      "{}_threep_{}{}_tsink{}" \
+                                                      + "_psq{}_{}configs_binSize{}",
+                                                      whichRatio, particle, 
+                                                      flav_str[ iflav ], ts,
+                                                      momSq, configNum, binSize )
+                rw.writeAvgDataFile( threep_outFilename,
+                                     threep_avg[ iflav, its ],
+                                     threep_err[ iflav, its ] )
+
+                # Write ratio output file
+
+                ratio_outFilename \
+                    = rw.makeFilename( output_template,
+                                       "{}_{}{}_tsink{}" \
+                                       + "_psq{}_{}configs_binSize{}",
+                                       whichRatio, particle, 
+                                       flav_str[ iflav ], ts,
+                                       momSq, configNum, binSize )
+                rw.writeAvgDataFile( ratio_outFilename, ratio_avg[ iflav, its ],
+                                     ratio_err[ iflav, its ] )
+
+                # Fit plateau
+
+                rangeStart_plat = [ ts // 2 - 1, ts // 2 - 2,
+                                    ts // 2 - 3, ts // 2 - 4 ]
+
+                fitEnd_plat = [ ts // 2 + 1, ts // 2 + 2,
+                                ts // 2 + 3, ts // 2 + 4 ]
+
+                #mpi_fncs.mpiPrint(np.average(ratio[iflav,its],axis=0),
+                #                  mpi_confs_info)
+
+                # Loop over fit ranges
+                for irange in range( len( rangeStart_plat ) ):
+
+                    ratio_fit, chiSq = fit.fitPlateau( ratio[ iflav, its ],
+                                                       ratio_err[iflav, its ],
+                                                       rangeStart_plat[ irange ],
+                                                       fitEnd_plat[ irange ] )
+
+                    #mpi_fncs.mpiPrint((rangeStart_plat[irange],
+                    #                   fitEnd_plat[irange]),
+                    #                  mpi_confs_info)
+                    #mpi_fncs.mpiPrint(np.average(ratio_fit,axis=0),
+                    #                  mpi_confs_info)
+
+                    # Write fit per bin
+
+                    ratio_fit_outFilename \
+                        = rw.makeFilename( output_template,\
+                                           "{}_plat_fit_per_bin_{}_{}" \
+                                           + "_{}{}_tsink{}" \
+                                           + "_psq{}_{}configs_binSize{}",
+                                           whichRatio, 
+                                           rangeStart_plat[ irange ],
+                                           fitEnd_plat[ irange ],
+                                           particle, flav_str[ iflav ], 
+                                           ts, momSq, configNum, binSize )
+
+                    rw.writeAvgDataFile( ratio_fit_outFilename, 
+                                         ratio_fit, 
+                                         np.zeros( ratio_fit.shape ) )
+
+                    # Average over bins
+
+                    ratio_fit_avg = np.average( ratio_fit )
+                    ratio_fit_err = fncs.calcError( ratio_fit, 
+                                                     binNum )
+
+                    # Write output files
+
+                    ratio_fit_outFilename \
+                        = rw.makeFilename( output_template,\
+                                           "{}_plat_fit_{}_{}" \
+                                           + "_{}{}_tsink{}" \
+                                           + "_psq{}_{}configs_binSize{}",
+                                           whichRatio, 
+                                           rangeStart_plat[ irange ],
+                                           fitEnd_plat[ irange ],
+                                           particle, flav_str[ iflav ], 
+                                           ts, momSq, configNum, binSize )
+                    rw.writeFitDataFile( ratio_fit_outFilename, ratio_fit_avg,
+                                         ratio_fit_err, rangeStart_plat[ irange ],
+                                         fitEnd_plat[ irange ] )
+
+    # GE of kaons is written for one flavor
+
+    analysis_info[ 'flavNum' ] = flavNum
+
+
+# Calculates charges or moments from two-state fits of the three-point
+# functions, if the two-state fit is on
+
+# analysis_info: Dictionary of analysis information from
+#                chargesAndMomentsSetup() and earlier stages
+# mpi_confs_info: Dictionary of MPI configuration information
+
+def chargesAndMomentsFromTwoStateFit( analysis_info, mpi_confs_info ):
+
+    rank = mpi_confs_info[ 'rank' ]
+    binNum = mpi_confs_info[ 'binNum_glob' ]
+
+    tsf = analysis_info[ 'tsf' ]
+    flavNum = analysis_info[ 'flavNum' ]
+    tsink = analysis_info[ 'tsink' ]
+    threep_jk = analysis_info[ 'threep_jk' ]
+    E0 = analysis_info[ 'E0' ]
+    ismr_flav = analysis_info[ 'ismr_flav' ]
+    E1 = analysis_info[ 'E1' ]
+    tsinkNum = analysis_info[ 'tsinkNum' ]
+    T = analysis_info[ 'T' ]
+    c0 = analysis_info[ 'c0' ]
+    c1 = analysis_info[ 'c1' ]
+    whichRatio = analysis_info[ 'whichRatio' ]
+    mEff_fit = analysis_info[ 'mEff_fit' ]
+    momSq = analysis_info[ 'momSq' ]
+    L = analysis_info[ 'L' ]
+    Z = analysis_info[ 'Z' ]
+    twopFit_str = analysis_info[ 'twopFit_str' ]
+    output_template = analysis_info[ 'output_template' ]
+    particle = analysis_info[ 'particle' ]
+    flav_str = analysis_info[ 'flav_str' ]
+    ts_range_str = analysis_info[ 'ts_range_str' ]
+    configNum = analysis_info[ 'configNum' ]
+    binSize = analysis_info[ 'binSize' ]
+
+    ##################
+    # Two-state Fit  #
+    ##################
+
+
+    if tsf:
+
+        mpi_fncs.mpiPrint( "Will perform the two-state fit", mpi_confs_info )
+
+        # Fit each flavor and number of neglected three-point functions
+        # in its own group of processes. Each unit returns without 
+        # waiting for its fit to be gathered so that the gather 
+        # overlaps with the group's next unit.
+
+        tsf_units = [ ( iflav, neglect ) for iflav in range( flavNum )
+                      for neglect in ( 2, 3 ) ]
+
+        def twoStateFit_unit( unit, group_info ):
+
+            iflav, neglect = unit
+
+            ti_to_fit = [ np.arange( neglect, ts - neglect + 1 ) 
+                          for ts in tsink ]
+
+            return fit.twoStateFit_threep( threep_jk[ iflav ],
+                                           ti_to_fit, tsink,
+                                           E0[ ismr_flav[ iflav ] ],
+                                           E1[ ismr_flav[ iflav ] ],
+                                           group_info, wait=False )
+
+        tsf_results = mpi_fncs.groupTasks( tsf_units, twoStateFit_unit,
+                                           mpi_confs_info )
+
+        # Loop over flavors
+        for iflav in range( flavNum ):
+
+            # Loop over number of neglected three-point functions
+            for neglect in 2,3:
+
+                ti_to_fit = fncs.initEmptyList( tsinkNum, 1 )
+
+                # Loop over tsink
+                for its, ts in zip( range( tsinkNum ), tsink ):
+
+                    ti_to_fit[ its ] = np.arange( neglect, ts - neglect + 1 )
+
+                    """
+                    ti_to_fit[ ts ] = np.concatenate( ( range( neglect,
+                    tsink[ ts ]
+                    - neglect
+                    + 1 ),
+                    range( tsink[ ts ]
+                    + neglect
+                    + 5,
+                    T -
+                    neglect
+                    - 5 + 1 ) ) )
+                    ti_to_fit[ ts ] = range( tsink[ ts ] + neglect + 5,
+                    T - neglect - 5 + 1 )
+                    """
+
+                # End loop over tsink
+
+                fitParams_threep, \
+                    chiSq = tsf_results[ tsf_units.index( ( iflav, neglect ) ) ]
+
+                if rank == 0:
+
+                    a00 = fitParams_threep[ :, 0 ]
+                    a01 = fitParams_threep[ :, 1 ]
+                    a11 = fitParams_threep[ :, 2 ]
+
+                    fitParams = np.stack( ( a00, a01, a11,
+                                            c0[ ismr_flav[ iflav ] ],
+                                            c1[ ismr_flav[ iflav ] ],
+                                            E0[ ismr_flav[ iflav ] ],
+                                            E1[ ismr_flav[ iflav ] ] ),
+                                          axis=1 )
+
+                    # ratio[ b ]
+
+                    if whichRatio =="avgX":
+
+                        ratio = pq.calcAvgX_twoStateFit( a00,
+                                                         c0[ ismr_flav[ iflav ] ],
+                                                         mEff_fit[ 0 ], 
+                                                         momSq, L, Z )
+
+                    elif whichRatio in mellin_list:
+
+                        ratio = -Z * a00 / c0[ ismr_flav[ iflav ] ]
+
+                    elif whichRatio in GE_list:
+
+                        ratio = Z * a00 / c0[ ismr_flav[ iflav ] ]
+
+                    # Average over bins
+
+                    ratio_avg = np.average( ratio )
+                    ratio_err = fncs.calcError( ratio, binNum )
+
+                    fitParams_avg = np.average( fitParams, axis=0 )
+                    fitParams_err = fncs.calcError( fitParams, binNum )
+
+                    chiSq_avg = np.average( chiSq, axis=0 )
+                    chiSq_err = fncs.calcError( chiSq, binNum )
+
+                    tsf_threep_range_str = twopFit_str[ ismr_flav[ iflav ] ] \
+                                           + ".3n" + str( neglect )
+
+                    # Write fit per bin
+
+                    ratioOutputFilename \
+                        = rw.makeFilename( output_template,
+                                           "{}_2sf_per_bin_{}{}_{}_{}" \
+                                           + "_psq{}_{}configs_binSize{}",
+                                           whichRatio, 
+                                           particle, flav_str[ iflav ],
+                                           tsf_threep_range_str,
+                                           ts_range_str,
+                                           momSq, configNum, binSize )
+
+                    rw.writeAvgDataFile( ratioOutputFilename, 
+                                         ratio,
+                                         np.zeros( ratio.shape ) )
+
+                    # Write ratio output file
+
+                    ratioOutputFilename \
+                        = rw.makeFilename( output_template,
+                                           "{}_2sf_{}{}_{}_{}" \
+                                           + "_psq{}_{}configs_binSize{}",
+                                           whichRatio, 
+                                           particle, flav_str[ iflav ],
+                                           tsf_threep_range_str,
+                                           ts_range_str,
+                                           momSq, configNum, binSize )
+                    rw.writeFitDataFile( ratioOutputFilename,
+                                         ratio_avg, ratio_err, 0, 0 )
+
+                    # Write chi^2 output file
+
+                    chiSqOutputFilename \
+                        = rw.makeFilename( output_template,
+                                           "{}_2sf_threep_chiSq_{}{}_{}_{}" \
+                                           + "_psq{}_{}configs_binSize{}",
+                                           whichRatio, 
+                                           particle, flav_str[ iflav ],
+                                           tsf_threep_range_str,
+                                           ts_range_str,
+                                           momSq, configNum, binSize )
+
+                    rw.writeFitDataFile( chiSqOutputFilename,
+                                         chiSq_avg, chiSq_err, 0, 0 )
+
+                    # Write tsf paramater output file
+
+                    ratioParamsOutputFilename \
+                        = rw.makeFilename( output_template,
+                                           "{}_2sf_params_{}{}_{}_{}" \
+                                           + "_psq{}_{}configs_binSize{}",
+                                           whichRatio, 
+                                           particle, flav_str[ iflav ],
+                                           tsf_threep_range_str,
+                                           ts_range_str,
+                                           momSq, configNum, binSize )
+
+                    rw.writeTSFParamsFile( ratioParamsOutputFilename,
+                                           fitParams_avg, fitParams_err )
+
+                    if whichRatio in mellin_list:
+
+                        # Calculate curve with constant tsink
+
+                        # curve[ b, ts, t ]
+                        # ti[ ts, t ]
+
+                        threep_curve, ti_threep \
+                            = fit.calcThreepTwoStateCurve( a00, a01,
+                                                           a11, E0[ ismr_flav[ iflav ] ],
+                                                           E1[ ismr_flav[ iflav ] ], T,
+                                                           tsink,
+                                                           ti_to_fit,
+                                                           neglect )
+
+                        ratio_curve_const_ts, ti_ratio \
+                            = fit.calcAvgXTwoStateCurve_const_ts( a00, 
+                                                                  a01, 
+                                                                  a11,
+                                                                  c0[ismr_flav[iflav]], 
+                                                                  c1[ismr_flav[iflav]], 
+                                                                  E0[ismr_flav[iflav]], 
+                                                                  E1[ismr_flav[iflav]],
+                                                                  mEff_fit[ 0 ],
+                                                                  momSq, 
+                                                                  L, T, 
+                                                                  Z, 
+                                                                  tsink,
+                                                                  ti_to_fit,
+                                                                  neglect,
+                                                                  whichRatio )
+
+                        ratio_curve_const_ti, ts_ratio \
+                            = fit.calcAvgXTwoStateCurve_const_ti( a00, 
+                                                                  a01, a11,
+                                                                  c0[ismr_flav[iflav]], 
+                                                                  c1[ismr_flav[iflav]],
+                                                                  E0[ismr_flav[iflav]], 
+                                                                  E1[ismr_flav[iflav]],
+                                                                  mEff_fit[ 0 ],
+                                                                  momSq,
+                                                                  L, T, Z,
+                                                                  tsink[0]
+                                                                  -2,
+                                                                  tsink[-1]
+                                                                  +5,
+                                                                  whichRatio )
+
+                        threep_curve_avg = np.average( threep_curve, axis=0 )
+                        threep_curve_err = fncs.calcError( threep_curve, 
+                                                           binNum )
+
+                        ratio_curve_const_ts_avg \
+                            = np.average( ratio_curve_const_ts, axis=0 )
+                        ratio_curve_const_ts_err \
+                            = fncs.calcError( ratio_curve_const_ts, binNum )
+
+                        ratio_curve_const_ti_avg \
+                            = np.average( ratio_curve_const_ti, axis=0 )
+                        ratio_curve_const_ti_err \
+                            = fncs.calcError( ratio_curve_const_ti, binNum )
+
+                        curveOutputFilename \
+                            = rw.makeFilename( output_template,
+                                               "{}_2sf_curve_{}{}_{}_{}" \
+                                               + "_psq{}_{}configs_binSize{}",
+                                               whichRatio, 
+                                               particle, flav_str[ iflav ],
+                                               tsf_threep_range_str,
+                                               ts_range_str,
+                                               momSq, configNum, binSize )
+                        rw.writeAvgDataFile_wX( curveOutputFilename,
+                                                ts_ratio,
+                                                ratio_curve_const_ti_avg,
+                                                ratio_curve_const_ti_err )
+
+                        for ts in range( tsinkNum ):
+
+                            threep_curveOutputFilename \
+                                = rw.makeFilename( output_template,
+                                                   "{}_2sf_threep_curve_"
+                                                   + "{}{}_tsink{}_{}_{}"
+                                                   + "_psq{}_{}configs_binSize{}",
+                                                   whichRatio, 
+                                                   particle, flav_str[ iflav ],
+                                                   tsink[ ts ],
+                                                   tsf_threep_range_str,
+                                                   ts_range_str,
+                                                   momSq, configNum, binSize )
+                            rw.writeAvgDataFile_wX( threep_curveOutputFilename,
+                                                    ti_threep[ ts ],
+                                                    threep_curve_avg[ ts ],
+                                                    threep_curve_err[ ts ] )
+
+                            curveOutputFilename \
+                                = rw.makeFilename( output_template,
+                                                   "{}_2sf_curve_"
+                                                   + "{}{}_tsink{}_{}_{}"
+                                                   + "_psq{}_{}configs_binSize{}",
+                                                   whichRatio, 
+                                                   particle, flav_str[ iflav ],
+                                                   tsink[ ts ],
+                                                   tsf_threep_range_str,
+                                                   ts_range_str,
+                                                   momSq, configNum, binSize )
+                            rw.writeAvgDataFile_wX( curveOutputFilename,
+                                                    ti_ratio[ ts ],
+                                                    ratio_curve_const_ts_avg[ ts ],
+                                                    ratio_curve_const_ts_err[ ts ] )
+
+
+# Function of each stage
+
+stageFunctions = { "read_twop": readTwop,
+                   "fit_twop": fitTwop,
+                   "read_threep": readThreep,
+                   "ratio": chargesAndMomentsFromRatio,
+                   "two_state_fit": chargesAndMomentsFromTwoStateFit }
+
+
+# Runs the stages of an analysis. Stages whose data is already in
+# analysis_info, e.g., from another analysis of the same ensemble, can
+# be skipped with firstStage.
+
+# analysis_info: Dictionary of analysis information from
+#                chargesAndMomentsSetup()
+# mpi_confs_info: Dictionary of MPI configuration information
+# firstStage (Optional): First stage to run
+
+# Returns analysis_info with the data of each stage
+
+def chargesAndMoments( analysis_info, mpi_confs_info, firstStage=None ):
+
+    istart = stageList.index( firstStage ) if firstStage else 0
+
+    for stage in stageList[ istart: ]:
+
+        stageFunctions[ stage ]( analysis_info, mpi_confs_info )
+
+    return analysis_info
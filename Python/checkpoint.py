@@ -0,0 +1,293 @@
+import os
+import pickle
+import hashlib
+import numpy as np
+import mpi_functions as mpi_fncs
+
+# Checkpointing of analyses made of named stages which store their data
+# in a namespace dictionary, e.g., the analysis_info of
+# formFactorsPipeline. After each stage, the data variables which were
+# created or reassigned since the setup of the analysis are written to
+# a directory for that stage by rank 0: variables which are equal on all
+# processes once in shared.pkl, and the rest for each process in
+# rank{r}.pkl. Variables not reassigned since an earlier checkpoint
+# are written as links to that checkpoint. When resuming from a stage,
+# the stages before it are skipped and every process loads the
+# checkpoint of the stage before it.
+
+# Types of variables written to checkpoints. Lists, tuples and
+# dictionaries are written if everything they contain is.
+
+dataTypes = ( np.ndarray, np.generic, int, float, complex, str, bytes,
+              bool, type( None ) )
+
+
+# Whether a variable holds only data which can be checkpointed, which
+# excludes, e.g., modules, functions, MPI communicators and windows
+
+# value: Variable to check
+
+def isCheckpointData( value ):
+
+    if isinstance( value, dataTypes ):
+
+        return not ( isinstance( value, np.ndarray )
+                     and value.dtype == object )
+
+    if isinstance( value, ( list, tuple ) ):
+
+        return all( isCheckpointData( v ) for v in value )
+
+    if isinstance( value, dict ):
+
+        return all( isinstance( k, str ) and isCheckpointData( v )
+                    for k, v in value.items() )
+
+    return False
+
+
+# Hash of a variable used to find variables which are equal on all
+# processes
+
+# value: Variable to hash
+
+def dataHash( value ):
+
+    if isinstance( value, np.ndarray ):
+
+        h = hashlib.sha1( "{}{}".format( value.dtype.str,
+                                         value.shape ).encode() )
+
+        h.update( np.ascontiguousarray( value ).reshape( -1 ).view( np.uint8 ) )
+
+        return h.hexdigest()
+
+    return hashlib.sha1( pickle.dumps( value, protocol=5 ) ).hexdigest()
+
+
+# Writes an object to a pickle file through a temporary file so that
+# a failure while writing never leaves a partial checkpoint
+
+# filename: Name of file to write
+# obj: Object to write
+
+def writePickle( filename, obj ):
+
+    tmpFilename = filename + ".tmp"
+
+    with open( tmpFilename, "wb" ) as pickleFile:
+
+        pickle.dump( obj, pickleFile, protocol=5 )
+
+    os.replace( tmpFilename, filename )
+
+
+def readPickle( filename ):
+
+    with open( filename, "rb" ) as pickleFile:
+
+        return pickle.load( pickleFile )
+
+
+# Sets up checkpointing after the setup of an analysis and, if
+# resuming, loads the checkpoint of the stage before the one resumed
+# from into its namespace
+
+# checkpointDir: Directory to write checkpoints to, or None to not
+#                write checkpoints
+# stageList: Names of the stages of the analysis in order
+# resumeFrom: Name of stage to resume from, or None to run all stages
+# namespace: Dictionary of variables of the analysis
+# mpi_info: Dictionary of MPI information
+
+# Returns dictionary of checkpoint information
+
+def lqcdjk_checkpoint_init( checkpointDir, stageList, resumeFrom,
+                            namespace, mpi_info ):
+
+    if resumeFrom and not checkpointDir:
+
+        mpi_fncs.mpiPrintError( "Error (checkpoint.lqcdjk_checkpoint_init): "
+                                + "a checkpoint directory must be given "
+                                + "to resume.", mpi_info )
+
+    if resumeFrom and resumeFrom not in stageList:
+
+        mpi_fncs.mpiPrintError( "Error (checkpoint.lqcdjk_checkpoint_init): "
+                                + "stage {} not in ".format( resumeFrom )
+                                + ", ".join( stageList ) + ".", mpi_info )
+
+    # Variables of the setup are kept so that later changes to them
+    # can be found. Unchanged setup variables, e.g., options which are
+    # being tuned, are never overwritten by a checkpoint.
+
+    ckpt_info = { 'dir': checkpointDir,
+                  'stages': stageList,
+                  'resume': stageList.index( resumeFrom ) if resumeFrom else 0,
+                  'setup': dict( namespace ),
+                  'saved': {} }
+
+    if ckpt_info[ 'resume' ] > 0:
+
+        stage = stageList[ ckpt_info[ 'resume' ] - 1 ]
+
+        namespace.update( loadStage( stage, ckpt_info, mpi_info ) )
+
+        mpi_fncs.mpiPrint( "Resuming from stage {} ".format( resumeFrom )
+                           + "with checkpoint of stage {}".format( stage ),
+                           mpi_info )
+
+    return ckpt_info
+
+
+# Whether a stage should be run
+
+# stage: Name of stage
+# ckpt_info: Dictionary of checkpoint information
+
+def runStage( stage, ckpt_info ):
+
+    return ckpt_info[ 'stages' ].index( stage ) >= ckpt_info[ 'resume' ]
+
+
+# Writes the checkpoint of a stage
+
+# stage: Name of stage which has finished
+# namespace: Dictionary of variables of the analysis
+# ckpt_info: Dictionary of checkpoint information
+# mpi_info: Dictionary of MPI information
+
+def saveStage( stage, namespace, ckpt_info, mpi_info ):
+
+    if not ckpt_info[ 'dir' ]:
+
+        return
+
+    comm = mpi_info[ 'comm' ]
+    rank = mpi_info[ 'rank' ]
+
+    setup = ckpt_info[ 'setup' ]
+    saved = ckpt_info[ 'saved' ]
+
+    # Data variables created or reassigned since setup
+
+    variables = { name: value for name, value in namespace.items()
+                  if not name.startswith( "_" )
+                  and not ( name in setup and setup[ name ] is value )
+                  and isCheckpointData( value ) }
+
+    # Variables unchanged since an earlier checkpoint are linked to it
+
+    links = { name: saved[ name ][ 0 ] for name in variables
+              if name in saved and saved[ name ][ 1 ] is variables[ name ] }
+
+    # Variables with the same hash on all processes are written once
+
+    hashes = { name: dataHash( value ) for name, value in variables.items()
+               if name not in links }
+
+    hashes_all = comm.allgather( hashes )
+
+    shared = [ name for name in hashes_all[ 0 ]
+               if all( h.get( name ) == hashes_all[ 0 ][ name ]
+                       for h in hashes_all ) ]
+
+    local = { 'variables': { name: value
+                             for name, value in variables.items()
+                             if name not in links and name not in shared },
+              'links': links }
+
+    local_all = comm.gather( local, root=0 )
+
+    if rank == 0:
+
+        stageDir = os.path.join( ckpt_info[ 'dir' ], stage )
+
+        os.makedirs( stageDir, exist_ok=True )
+
+        writePickle( os.path.join( stageDir, "shared.pkl" ),
+                     { 'stage': stage,
+                       'procNum': mpi_info[ 'procNum' ],
+                       'variables': { name: variables[ name ]
+                                      for name in shared } } )
+
+        for r, local_r in enumerate( local_all ):
+
+            writePickle( os.path.join( stageDir,
+                                       "rank{}.pkl".format( r ) ),
+                         local_r )
+
+    del local_all
+
+    for name, value in variables.items():
+
+        if name not in links:
+
+            saved[ name ] = ( stage, value )
+
+    comm.Barrier()
+
+    mpi_fncs.mpiPrint( "Wrote checkpoint of stage {} to {}".format( stage,
+                                                                    ckpt_info[ 'dir' ] ),
+                       mpi_info )
+
+
+# Reads the variables of a stage's checkpoint for this process,
+# following links to earlier checkpoints
+
+# stage: Name of stage
+# ckpt_info: Dictionary of checkpoint information
+# mpi_info: Dictionary of MPI information
+
+# Returns dictionary of variables
+
+def loadStage( stage, ckpt_info, mpi_info ):
+
+    rank = mpi_info[ 'rank' ]
+
+    stageDir = os.path.join( ckpt_info[ 'dir' ], stage )
+
+    if not os.path.isfile( os.path.join( stageDir, "shared.pkl" ) ):
+
+        mpi_fncs.mpiPrintError( "Error (checkpoint.loadStage): no "
+                                + "checkpoint of stage {} in {}.".format( stage,
+                                                                          ckpt_info[ 'dir' ] ),
+                                mpi_info )
+
+    shared = readPickle( os.path.join( stageDir, "shared.pkl" ) )
+
+    if shared[ 'procNum' ] != mpi_info[ 'procNum' ]:
+
+        mpi_fncs.mpiPrintError( "Error (checkpoint.loadStage): checkpoint "
+                                + "of stage {} was written ".format( stage )
+                                + "by {} processes ".format( shared[ 'procNum' ] )
+                                + "but there are {}.".format( mpi_info[ 'procNum' ] ),
+                                mpi_info )
+
+    local = readPickle( os.path.join( stageDir,
+                                      "rank{}.pkl".format( rank ) ) )
+
+    variables = shared[ 'variables' ]
+
+    variables.update( local[ 'variables' ] )
+
+    # Load each linked stage once
+
+    for linkedStage in set( local[ 'links' ].values() ):
+
+        linked = loadStage( linkedStage, ckpt_info, mpi_info )
+
+        for name, s in local[ 'links' ].items():
+
+            if s == linkedStage:
+
+                variables[ name ] = linked[ name ]
+
+    # Variables loaded from a stage are linked to it when later
+    # stages are written
+
+    for name, value in variables.items():
+
+        ckpt_info[ 'saved' ][ name ] = ( stage, value )
+
+    return variables
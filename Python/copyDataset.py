@@ -1,115 +1,577 @@
-import math
+import os
+import hashlib
 import h5py
 import numpy as np
 import argparse as argp
-from os import listdir as ls
+from glob import glob
+from time import time
+import mpi_functions as mpi_fncs
 import readWrite as rw
 import functions as fncs
-from glob import glob
 
-#########################
-# Parse input arguments #
-#########################
+# Copies the datasets which contain all given keywords from each
+# source file of each configuration to its own output file, e.g., to
+# take a subset of an ensemble. Output files are named
+# <output_dir>/<configuration>/<output_template with configuration for
+# '*'><source coordinates separated by '.'>.h5. Datasets keep their
+# names. Without rechunking or compression, datasets are copied with
+# HDF5 object copies, which copy the stored data without reading it
+# into memory, decompressing or recompressing it. Configurations are
+# split between processes, and datasets which already exist in an
+# output file are not copied again, so an interrupted run continues
+# where it stopped when run again. Datasets are copied under a
+# temporary name and renamed when complete, so a dataset left partly
+# copied is copied again. Every copied dataset is checked to have the
+# shape and type of its input and, for object copies, its storage
+# size or, otherwise, the checksum of its values.
+
+# Maximum size of blocks of datasets read at once when rechunking or
+# compressing
+
+blockSize = 64 * 1024 ** 2
+
+# Suffix of datasets being copied
+
+tmpSuffix = ".tmp"
+
+
+# Returns the names of the datasets in an HDF5 file which contain all
+# keywords
+
+# dataFile: Open HDF5 file
+# keyword: List of keywords
+
+def copyDatasetNames( dataFile, keyword ):
+
+    dsetname = []
+
+    dataFile.visititems( lambda name,obj: \
+                         rw.filterDsetname( dsetname, name, keyword ) \
+                         if type( obj ) is h5py.Dataset \
+                         else None )
+
+    return dsetname
+
+
+# Returns the chunk shape of an output dataset
+
+# shape: Shape of dataset
+# chunks: List of chunk sizes of the first dimensions, which are
+#         limited to the dataset shape, with the full extent of the
+#         other dimensions, or True for chunks chosen by h5py. If
+#         None, chunks are not changed.
+# chunks_in: Chunk shape of the input dataset, or None if it is not
+#            chunked
+
+def outputChunks( shape, chunks, chunks_in ):
+
+    if chunks is None or not shape:
+
+        return chunks_in
+
+    if chunks is True:
+
+        return True
+
+    return tuple( min( c, s ) for c, s in zip( chunks, shape ) ) \
+        + tuple( shape[ len( chunks ): ] )
+
+
+# Returns the slices of the blocks of the first dimension of a 
+# dataset read at once, which are multiples of chunkRows if possible
+
+# dset: Dataset which is not scalar
+# chunkRows (Optional): Size of the first dimension of chunks
+
+def blockSlices( dset, chunkRows=None ):
+
+    rowSize = max( dset.dtype.itemsize
+                   * int( np.prod( dset.shape[ 1: ] ) ), 1 )
+
+    rowNum = max( blockSize // rowSize, 1 )
+
+    if chunkRows and rowNum > chunkRows:
+
+        rowNum -= rowNum % chunkRows
+
+    return [ slice( start, min( start + rowNum, dset.shape[ 0 ] ) )
+             for start in range( 0, dset.shape[ 0 ], rowNum ) ]
+
+
+# Adds values read from a dataset to a checksum
+
+# checksum: hashlib checksum
+# data: Array of values
+
+def updateChecksum( checksum, data ):
+
+    data = np.asarray( data )
+
+    if data.dtype.kind == "O":
+
+        # Variable length data, e.g., strings
+
+        checksum.update( repr( data.tolist() ).encode() )
+
+    else:
+
+        checksum.update( np.ascontiguousarray( data ).tobytes() )
+
+
+# Returns a checksum of the values of a dataset, reading blocks of the
+# first dimension at a time
+
+# dset: Dataset
+
+def datasetChecksum( dset ):
+
+    checksum = hashlib.sha1()
+
+    if not dset.shape:
+
+        updateChecksum( checksum, dset[ () ] )
+
+    else:
+
+        for block in blockSlices( dset ):
+
+            updateChecksum( checksum, dset[ block ] )
+
+    return checksum.hexdigest()
+
+
+# Copies a dataset to a new dataset with given chunks and compression,
+# reading blocks of the first dimension at a time. Attributes are
+# copied too. Returns the checksum of the input values as given by 
+# datasetChecksum().
+
+# dset_in: Input dataset
+# outputFile: Open output file
+# name: Name of output dataset
+# create_info: Dictionary of 'chunks' as given to outputChunks(),
+#              'compression' and 'compression_opts' as given to
+#              create_dataset(), or None to keep the compression of the
+#              input and False for none, and 'shuffle'
+
+def copyDatasetBlocks( dset_in, outputFile, name, create_info ):
+
+    chunks = outputChunks( dset_in.shape, create_info[ 'chunks' ],
+                           dset_in.chunks )
+
+    if create_info[ 'compression' ] is None:
+
+        compression = dset_in.compression
+        compression_opts = dset_in.compression_opts
+        shuffle = create_info[ 'shuffle' ] or dset_in.shuffle
+
+    else:
+
+        compression = create_info[ 'compression' ] or None
+        compression_opts = create_info[ 'compression_opts' ] \
+                           if compression else None
+        shuffle = create_info[ 'shuffle' ]
+
+    # Filters need chunked datasets and scalar datasets cannot have them
+
+    filtered = bool( dset_in.shape ) \
+               and ( compression is not None or shuffle )
+
+    dset_out \
+        = outputFile.create_dataset( name, shape=dset_in.shape,
+                                     dtype=dset_in.dtype,
+                                     chunks=chunks if chunks or filtered
+                                     else None,
+                                     compression=compression
+                                     if filtered else None,
+                                     compression_opts=compression_opts
+                                     if filtered else None,
+                                     shuffle=shuffle and filtered )
+
+    for key, val in dset_in.attrs.items():
+
+        dset_out.attrs[ key ] = val
+
+    checksum = hashlib.sha1()
+
+    if not dset_in.shape:
+
+        data = dset_in[ () ]
+
+        dset_out[ () ] = data
+
+        updateChecksum( checksum, data )
+
+        return checksum.hexdigest()
+
+    # Blocks are multiples of the output chunks if possible
+
+    for block in blockSlices( dset_in, 
+                              dset_out.chunks[ 0 ] if dset_out.chunks
+                              else None ):
+
+        data = dset_in[ block ]
+
+        dset_out[ block ] = data
+
+        updateChecksum( checksum, data )
+
+    return checksum.hexdigest()
+
+
+# Checks that an output dataset has the shape and type of its input
+# and, if objectCopy is True, its storage size or, otherwise, the 
+# checksum of its values. Returns the storage size of the output 
+# dataset.
+
+# dset_in: Input dataset
+# dset_out: Output dataset
+# objectCopy: If True, the output is an object copy of the input
+# checksum_in (Optional): Checksum of the input values from 
+#                         copyDatasetBlocks(). If not given, it is 
+#                         calculated when needed.
+
+def verifyDataset( dset_in, dset_out, objectCopy, checksum_in=None ):
+
+    assert dset_out.shape == dset_in.shape \
+        and dset_out.dtype == dset_in.dtype, \
+        "Dataset {} in file {} has shape {} and type {} ".format( dset_out.name,
+                                                                 dset_out.file.filename,
+                                                                 dset_out.shape,
+                                                                 dset_out.dtype ) \
+        + "but its input has shape {} and type {}".format( dset_in.shape,
+                                                          dset_in.dtype )
+
+    size_out = dset_out.id.get_storage_size()
+
+    assert not objectCopy or size_out == dset_in.id.get_storage_size(), \
+        "Dataset {} in file {} has storage size {} ".format( dset_out.name,
+                                                            dset_out.file.filename,
+                                                            size_out ) \
+        + "but its input has {}".format( dset_in.id.get_storage_size() )
+
+    if not objectCopy:
+
+        if checksum_in is None:
+
+            checksum_in = datasetChecksum( dset_in )
+
+        assert datasetChecksum( dset_out ) == checksum_in, \
+            "Values of dataset {} in file {} ".format( dset_out.name,
+                                                      dset_out.file.filename ) \
+            + "do not match its input"
+
+    return size_out
+
+
+# Copies datasets of one source file to its output file. A new output
+# file is written under a temporary name and renamed when complete, 
+# and each dataset is copied under a temporary name and renamed when
+# complete, so that an existing output file only misses datasets 
+# which were not copied yet.
+
+# inputFilename: Name of source file
+# outputFilename: Name of output file
+# keyword: List of keywords
+# create_info: Dictionary of output dataset options from copyDataset(),
+#              or None for object copies
+
+# Returns the number of datasets copied and storage sizes of the
+# input and output datasets
+
+def copyFile( inputFilename, outputFilename, keyword, create_info ):
+
+    dsetNum = 0
+    size_in = 0
+    size_out = 0
+
+    exists = os.path.isfile( outputFilename )
+
+    filename = outputFilename if exists else outputFilename + ".tmp"
+
+    with h5py.File( inputFilename, "r" ) as inputFile, \
+         h5py.File( filename, "a" ) as outputFile:
+
+        # Loop over datasets
+        for name in copyDatasetNames( inputFile, keyword ):
+
+            dset_in = inputFile[ name ]
+
+            checksum_in = None
+
+            # Copy datasets which do not already exist in output file
+
+            if name not in outputFile:
+
+                tmpName = name + tmpSuffix
+
+                # Remove a dataset left partly copied by an 
+                # interrupted run
+
+                if tmpName in outputFile:
+
+                    del outputFile[ tmpName ]
+
+                if create_info is None:
+
+                    outputFile.copy( dset_in, outputFile, name=tmpName )
+
+                else:
+
+                    checksum_in = copyDatasetBlocks( dset_in, outputFile,
+                                                     tmpName, create_info )
+
+                outputFile.move( tmpName, name )
+
+                dsetNum += 1
+
+            size_in += dset_in.id.get_storage_size()
+            size_out += verifyDataset( dset_in, outputFile[ name ],
+                                       create_info is None, checksum_in )
+
+        # End loop over datasets
+
+    # Close files
+
+    if not exists:
+
+        os.replace( filename, outputFilename )
+
+    return dsetNum, size_in, size_out
+
+
+# Copies the datasets of one configuration
+
+# config: Configuration
+# copy_info: Dictionary of directories, templates, keywords and
+#            output dataset options from copyDataset()
+
+# Returns the number of datasets copied and storage sizes of the
+# input and output datasets
+
+def copyConfig( config, copy_info ):
+
+    filename = sorted( glob( os.path.join( copy_info[ 'input_dir' ], config,
+                                           copy_info[ 'input_template' ] ) ) )
+
+    assert filename, \
+        "No files matching {} were found in {}".format( copy_info[ 'input_template' ],
+                                                        os.path.join( copy_info[ 'input_dir' ],
+                                                                      config ) )
+
+    outputDir = os.path.join( copy_info[ 'output_dir' ], config )
+
+    os.makedirs( outputDir, exist_ok=True )
+
+    total = np.zeros( 3, dtype=int )
+
+    # Loop over source files
+    for fn in filename:
+
+        with h5py.File( fn, "r" ) as inputFile:
+
+            dsetname = copyDatasetNames( inputFile, copy_info[ 'keywords' ] )
+
+        if not dsetname:
+
+            print( "WARNING: No datasets containing all keywords "
+                   + ", ".join( copy_info[ 'keywords' ] )
+                   + " in file " + fn )
+
+            continue
+
+        # Set output filename from source position in source (2nd) group
+
+        srcPos = rw.getSourcePositions( dsetname[ 0 ].split( "/" )[ 1 ] )
+
+        outputFilename = os.path.join( outputDir,
+                                       copy_info[ 'output_template' ].replace( "*",
+                                                                               config )
+                                       + "".join( s + "." for s in srcPos )
+                                       + "h5" )
+
+        total += copyFile( fn, outputFilename, copy_info[ 'keywords' ],
+                           copy_info[ 'create' ] )
+
+    # End loop over source files
+
+    return total
+
+
+# Copies datasets of configurations split between processes. Returns
+# the configurations which failed and the number of datasets copied
+# and storage sizes of the input and output datasets of all processes.
+
+# mpi_info: MPI info dictionary from mpi_functions.lqcdjk_mpi_init()
+#           or mpi_functions.lqcdjk_pool_run()
+# configList: List of configurations
+# copy_info: Dictionary of 'input_dir', 'input_template', 'output_dir',
+#            'output_template', 'keywords' and 'create', the
+#            dictionary of output dataset options given to
+#            copyDatasetBlocks() or None for object copies
+
+def copyDataset( mpi_info, configList, copy_info ):
+
+    rank = mpi_info[ 'rank' ]
+    procNum = mpi_info[ 'procNum' ]
+
+    failed = []
+
+    total = np.zeros( 3, dtype=int )
+
+    # Configurations are assigned to processes in turn
+
+    # Loop over configurations of this process
+    for ic in range( rank, len( configList ), procNum ):
+
+        config = configList[ ic ]
+
+        try:
+
+            total += copyConfig( config, copy_info )
+
+        except Exception as e:
+
+            print( "Error copying configuration {}: {}".format( config, e ),
+                   flush=True )
+
+            failed.append( config )
+
+    # End loop over configurations
+
+    results = mpi_info[ 'comm' ].allgather( ( failed, total ) )
+
+    failed = [ config for failed_p, total_p in results
+               for config in failed_p ]
+
+    total = sum( total_p for failed_p, total_p in results )
+
+    return failed, total
+
+
+# Copy datasets from the command line
+
+if __name__ == "__main__":
+
+    #########################
+    # Parse input arguments #
+    #########################
 
-parser = argp.ArgumentParser( description="Average Sources" )
+    parser = argp.ArgumentParser( description="Copy datasets" )
 
-parser.add_argument( "input_dir", action='store', type=str )
+    parser.add_argument( "input_dir", action='store', type=str )
 
-parser.add_argument( "input_template", action='store', type=str )
+    parser.add_argument( "input_template", action='store', type=str )
 
-parser.add_argument( "output_dir", action='store', type=str )
+    parser.add_argument( "output_dir", action='store', type=str )
 
-parser.add_argument( "output_template", action='store', type=str )
+    parser.add_argument( "output_template", action='store', type=str )
 
-parser.add_argument( "config_list", action='store', type=str )
+    parser.add_argument( "config_list", action='store', type=str )
 
-parser.add_argument( "keywords", action='store', nargs=argp.REMAINDER )
+    parser.add_argument( "keywords", action='store', nargs=argp.REMAINDER )
 
-args = parser.parse_args()
+    parser.add_argument( "-np", "--processes", action='store', type=int,
+                         help="Number of processes of this node to copy "
+                         + "configurations with, without MPI. If not "
+                         + "given, configurations are split between MPI "
+                         + "processes." )
 
-inputDir = args.input_dir
+    parser.add_argument( "--chunks", action='store', type=str,
+                         help="Chunk shape of output datasets. Either "
+                         + "'auto' or a comma seperated list of chunk "
+                         + "sizes of the first dimensions, with the "
+                         + "full extent of the other dimensions. If "
+                         + "not given, chunks are not changed." )
 
-input_template = args.input_template
+    parser.add_argument( "--compression", action='store', type=str,
+                         help="Compression filter of output datasets, "
+                         + "e.g., 'gzip' or 'lzf'. 'none' removes "
+                         + "compression. If not given, compression is "
+                         + "not changed." )
 
-outputDir = args.output_dir
+    parser.add_argument( "--compression_opts", action='store', type=int,
+                         help="Compression level, e.g., 0-9 for gzip." )
 
-output_template = args.output_template
+    parser.add_argument( "--shuffle", action='store_true',
+                         help="Apply the shuffle filter to output "
+                         + "datasets, which helps compression." )
 
-configList = fncs.getConfigList( args.config_list, inputDir )
+    # Options must come before the keywords
 
-keywords = args.keywords
+    args = parser.parse_args()
 
-configNum = len( configList )
+    configList = list( fncs.getConfigList( args.config_list, args.input_dir ) )
 
-###################################################
-# Fill matrices with values from input data files #
-###################################################
+    copy_info = { 'input_dir': args.input_dir,
+                  'input_template': args.input_template,
+                  'output_dir': args.output_dir,
+                  'output_template': args.output_template,
+                  'keywords': args.keywords,
+                  'create': None }
 
-dataset, datasetName = rw.getHDF5File_wNames( inputDir, configList, input_template, *keywords )
+    # Datasets are copied through memory if chunks or filters change
 
-print "Read data from HDF5 files"
+    if args.chunks or args.compression or args.shuffle:
 
-##################################
-# Write datasets to output files #
-##################################
+        if args.chunks is None:
 
-# Loop over insertion currents
+            chunks = None
 
-for dset_curr, dsetName_curr in zip( dataset, datasetName ):
+        elif args.chunks == "auto":
 
-    # Loop through configurations
+            chunks = True
 
-    #for c in range( configNum ):
-    for conf, dset_c, dsetName_c in zip( configList, dset_curr, dsetName_curr ):
+        else:
 
-        # Loop through sources
+            chunks = [ int( c ) for c in args.chunks.split( "," ) ]
 
-        #for src in range( dsetDatasetName[ c ].shape[ 0 ] ):
-        for dset_src, dsetName_src in zip( dset_c, dsetName_c ):
+        compression = False if args.compression == "none" \
+                      else args.compression
 
-            #srcPos = rw.getSourcePostitions( dsetDatasetName[ c ][ src ][ 0 ][ 1 ] )
-            srcPos = rw.getSourcePositions( dsetName_src[ 0 ][ 1 ] )
+        copy_info[ 'create' ] = { 'chunks': chunks,
+                                  'compression': compression,
+                                  'compression_opts': args.compression_opts,
+                                  'shuffle': args.shuffle }
 
-            # Set output filename
+    #################################
+    # Copy datasets to output files #
+    #################################
 
-            outputFilename = outputDir + "/" + conf + "/" \
-                             + output_template.replace( "*", conf ) \
+    start = time()
 
-            for s in srcPos:
+    if args.processes:
 
-                outputFilename = outputFilename + s + "."
+        failed, total = mpi_fncs.lqcdjk_pool_run( copyDataset,
+                                                  args.processes,
+                                                  configList,
+                                                  copy_info )[ 0 ]
 
-            outputFilename = outputFilename + "h5"
-                
-            with h5py.File( outputFilename, "a" ) as outputFile:
-            
-                # Loop over datasets
+        rank = 0
 
-                for dset, dsetName in zip( dset_src, dsetName_src ):
-                
-                    dset = np.array( dset )
+    else:
 
-                    outputDataset = ""
+        mpi_info = mpi_fncs.lqcdjk_mpi_init()
 
-                    for grp in dsetName:
+        failed, total = copyDataset( mpi_info, configList, copy_info )
 
-                        outputDataset += "/" + grp
-                    
-                    # Write three-point functions to output file if it
-                    # does not already exist
+        rank = mpi_info[ 'rank' ]
 
-                    if outputDataset not in outputFile:
+    if rank == 0:
 
-                        outputFile.create_dataset( outputDataset, data=dset )
-                    
-                # End loop over datasets
+        dsetNum, size_in, size_out = total
 
-            # Close file
+        print( "Copied {} datasets of {} configurations ".format( dsetNum,
+                                                                  len( configList )
+                                                                  - len( failed ) )
+               + "in {:.1f} s. Input size: {:.1f} MB, ".format( time() - start,
+                                                                size_in / 1024 ** 2 )
+               + "output size: {:.1f} MB".format( size_out / 1024 ** 2 ) )
 
-        # End loop over sources
+        if failed:
 
-    # End loop over configs
+            print( "Failed to copy {} configurations: ".format( len( failed ) )
+                   + ", ".join( failed ) )
 
-# End loop over insertion currents
+    if failed:
 
-print "Copied dataset to output file"
+        exit( 1 )
@@ -2,7 +2,6 @@ import sys
 import time
 import numpy as np
 import argparse as argp
-from scipy.optimize import curve_fit
 import functions as fncs
 import readWrite as rw
 import physQuants as pq
@@ -40,7 +39,10 @@ parser = argp.ArgumentParser( description="Calculate form factors for "
 # Set input arguments
 
 parser.add_argument( "data_dir", action='store', type=str,
-                     help="Directory containing form factor data." )
+                     help="Directory containing form factor data. "
+                     + "Data in results files of formFactors.py are "
+                     + "read with '<results file>.h5/<name>' in place "
+                     + "of a filename." )
 
 parser.add_argument( "formFactor_filename_template", action='store',
                      type=lambda s: [str(item) for item in s.split(',')],
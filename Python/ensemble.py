@@ -0,0 +1,178 @@
+import json
+import functions as fncs
+
+# Information on an ensemble which is shared by all of its analyses:
+# the lattice spacing and spatial extent, the directories and filename
+# templates of its two- and three-point functions, and its
+# configurations. The analysis pipelines, e.g., formFactorsPipeline,
+# take this dictionary so that many analyses can be run on an ensemble
+# in one process.
+#
+# Ensembles can be kept in a registry file, which is a JSON dictionary
+# of the information of each ensemble by name, e.g.,
+#
+# { "cA2.09.48": { "a": 0.093, "L": 48,
+#                  "scaleConvertFactor": [ 0.880, 0.821, 0.782 ],
+#                  "threep_dir": "/data/cA2.09.48/threep",
+#                  "threep_tokens": [ "threep.", ".h5" ],
+#                  "twop_dir": [ "/data/cA2.09.48/twop" ],
+#                  "twop_template": [ "twop.*.h5" ],
+#                  "config_list": "/data/cA2.09.48/configs.txt" } }
+#
+# Lattice parameters not given are set to their defaults. Directories
+# and templates are only needed to run analyses from the registry,
+# e.g., with runEnsembles.py.
+
+# Lattice spacing in fm and spatial extent of the ensembles analyzed
+# so far, used if not given
+
+a_default = 0.093
+L_default = 32.0
+
+# Factors which convert the Mellin moments <x>, <x^2> and <x^3> to the
+# scale of the reconstructed PDF, used if not given
+
+scaleConvertFactor_default = [ 0.88006465263859557,
+                               0.82124624619025055,
+                               0.78205608925074033 ]
+#scaleConvertFactor_default = [ 1.0,
+#                               1.0,
+#                               1.0 ]
+#scaleConvertFactor_default = [ 0.64385830344721184,
+#                               0.51453823194515136,
+#                               0.43934940901402392 ]
+
+# Lattice parameters of an ensemble in the registry
+
+parameterList = [ 'a', 'L', 'scaleConvertFactor' ]
+
+
+# Makes a dictionary of ensemble information
+
+# threepDir: Directory containing subdirectories of three-point
+#            functions for each configuration
+# threep_tokens: List of three-point function filename tokens
+# twopDir: List of directories containing subdirectories of two-point
+#          functions for each particle/flavor combination
+# twop_template: List of two-point function filename templates with
+#                the same order as twopDir
+# configList (Optional): List of configurations or name of file with a
+#                        list of configurations. Defaults to all
+#                        configurations in threepDir.
+# a (Optional): Lattice spacing in fm
+# L (Optional): Spatial extent of lattice
+# scaleConvertFactor (Optional): Factors which convert the scale of
+#                                the Mellin moments
+
+# Returns dictionary of ensemble information
+
+def lqcdjk_ensemble_info( threepDir, threep_tokens, twopDir, twop_template,
+                          configList="", a=a_default, L=L_default,
+                          scaleConvertFactor=scaleConvertFactor_default ):
+
+    if isinstance( configList, str ):
+
+        configList = fncs.getConfigList( configList, threepDir )
+
+    ensemble_info = { 'threepDir': threepDir,
+                      'threep_tokens': threep_tokens,
+                      'twopDir': twopDir,
+                      'twop_template': twop_template,
+                      'configList': list( configList ),
+                      'a': a,
+                      'L': L,
+                      'scaleConvertFactor': scaleConvertFactor }
+
+    return ensemble_info
+
+
+# Reads an ensemble registry file
+
+# filename: Name of registry file
+
+# Returns dictionary of the information of each ensemble by name
+
+def readEnsembleRegistry( filename ):
+
+    with open( filename, "r" ) as registryFile:
+
+        registry = json.load( registryFile )
+
+    assert isinstance( registry, dict ) \
+        and all( isinstance( entry, dict ) for entry in registry.values() ), \
+        "Error: ensemble registry " + filename + " must be a dictionary " \
+        + "of the information of each ensemble by name."
+
+    return registry
+
+
+# Lattice parameters of an ensemble from a registry file, or their
+# defaults if no ensemble is given
+
+# registryFilename: Name of registry file
+# name: Name of ensemble, or None for the defaults
+
+# Returns dictionary of lattice parameters
+
+def lqcdjk_ensemble_parameters( registryFilename, name ):
+
+    parameters = { 'a': a_default,
+                   'L': L_default,
+                   'scaleConvertFactor': scaleConvertFactor_default }
+
+    if name is None:
+
+        return parameters
+
+    assert registryFilename, \
+        "Error: an ensemble registry must be given with ensemble " \
+        + name + "."
+
+    registry = readEnsembleRegistry( registryFilename )
+
+    assert name in registry, \
+        "Error: ensemble " + name + " not in " + registryFilename + ". " \
+        + "Ensembles: " + ", ".join( registry )
+
+    for key in parameterList:
+
+        if key in registry[ name ]:
+
+            parameters[ key ] = registry[ name ][ key ]
+
+    return parameters
+
+
+# Makes the dictionary of information of an ensemble in a registry
+
+# registry: Dictionary of ensembles from readEnsembleRegistry()
+# name: Name of ensemble
+
+# Returns dictionary of ensemble information
+
+def lqcdjk_registry_ensemble_info( registry, name ):
+
+    assert name in registry, \
+        "Error: ensemble " + name + " not in registry. " \
+        + "Ensembles: " + ", ".join( registry )
+
+    entry = registry[ name ]
+
+    for key in 'threep_dir', 'threep_tokens', 'twop_dir', 'twop_template':
+
+        assert key in entry, \
+            "Error: " + key + " of ensemble " + name + " not in registry."
+
+    ensemble_info = lqcdjk_ensemble_info( entry[ 'threep_dir' ],
+                                          entry[ 'threep_tokens' ],
+                                          entry[ 'twop_dir' ],
+                                          entry[ 'twop_template' ],
+                                          entry.get( 'config_list', "" ),
+                                          entry.get( 'a', a_default ),
+                                          entry.get( 'L', L_default ),
+                                          entry.get( 'scaleConvertFactor',
+                                                     scaleConvertFactor_default ) )
+
+    ensemble_info[ 'name' ] = name
+
+    return ensemble_info
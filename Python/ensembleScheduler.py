@@ -0,0 +1,173 @@
+import json
+import mpi_functions as mpi_fncs
+import readWrite as rw
+import ensemble as ens
+import batchPipeline as bp
+
+# Runs the analyses of several ensembles at once. The processes are
+# split into groups, each of which runs the batches of analyses of
+# some of the ensembles, one after another, with batchPipeline. Small
+# ensembles, which do not use many processes well, then run alongside
+# each other and the larger ensembles.
+
+
+# Assigns ensembles to groups and processes to groups. Each ensemble
+# is assigned to the group with the least work so far, starting with
+# the ensembles with the most work, and each group gets a number of
+# processes proportional to its work.
+
+# costList: Work of each ensemble, e.g., its number of configurations
+#           times its number of analyses
+# procNum: Number of processes
+# groupNum: Number of groups. Must not be more than procNum.
+
+# Returns list of indices of ensembles in each group, in their
+# original order, and number of processes of each group
+
+def scheduleEnsembles( costList, procNum, groupNum ):
+
+    assert 0 < groupNum <= procNum, \
+        "Error: number of groups " + str( groupNum ) + " must be " \
+        + "between 1 and the number of processes " + str( procNum ) + "."
+
+    groupEnsembles = [ [] for g in range( groupNum ) ]
+    groupCost = [ 0 ] * groupNum
+
+    # Loop over ensembles from most to least work
+    for ie in sorted( range( len( costList ) ),
+                      key=lambda ie: costList[ ie ], reverse=True ):
+
+        g = groupCost.index( min( groupCost ) )
+
+        groupEnsembles[ g ].append( ie )
+        groupCost[ g ] += costList[ ie ]
+
+    # End loop over ensembles
+
+    for g in range( groupNum ):
+
+        groupEnsembles[ g ].sort()
+
+    # Give each group one process, then give each other process to the
+    # group with the most work per process
+
+    groupProcNum = [ 1 ] * groupNum
+
+    for p in range( procNum - groupNum ):
+
+        work = [ groupCost[ g ] / groupProcNum[ g ]
+                 for g in range( groupNum ) ]
+
+        groupProcNum[ work.index( max( work ) ) ] += 1
+
+    return groupEnsembles, groupProcNum
+
+
+# Runs the analyses of several ensembles. Output of each ensemble goes
+# to its own results file.
+
+# registry: Dictionary of ensembles from
+#           ensemble.readEnsembleRegistry()
+# schedule: List of dictionaries with the name of an ensemble in the
+#           registry under 'ensemble' and its list of analyses, as
+#           given to batchPipeline.batchAnalyses(), under 'analyses'
+# mpi_info: Dictionary of MPI information from
+#           mpi_functions.lqcdjk_mpi_init()
+# groupNum (Optional): Number of groups of processes. Defaults to the
+#                      number of ensembles or processes, whichever is
+#                      less.
+# options (Optional): Options used by all analyses which do not give
+#                     them. The output template of each ensemble is
+#                     output_template with the ensemble name
+#                     prefixed to the text replacing '*'.
+# asciiExport (Optional): If True, also export every output of the
+#                         results files as ASCII files
+
+def runEnsembles( registry, schedule, mpi_info, groupNum=None,
+                  options={}, asciiExport=False ):
+
+    procNum = mpi_info[ 'procNum' ]
+    rank = mpi_info[ 'rank' ]
+
+    ensembleNum = len( schedule )
+
+    if groupNum is None:
+
+        groupNum = min( ensembleNum, procNum )
+
+    ensemble_info_list = [ ens.lqcdjk_registry_ensemble_info( registry,
+                                                              entry[ 'ensemble' ] )
+                           for entry in schedule ]
+
+    costList = [ len( ensemble_info[ 'configList' ] )
+                 * len( entry[ 'analyses' ] )
+                 for ensemble_info, entry
+                 in zip( ensemble_info_list, schedule ) ]
+
+    groupEnsembles, groupProcNum = scheduleEnsembles( costList, procNum,
+                                                      groupNum )
+
+    # Groups are made of consecutive ranks, which keeps small groups
+    # on one node
+
+    groupStart = [ sum( groupProcNum[ :g ] ) for g in range( groupNum ) ]
+
+    color = max( g for g in range( groupNum ) if groupStart[ g ] <= rank )
+
+    for g in range( groupNum ):
+
+        mpi_fncs.mpiPrint( "Group {} with {} processes: ".format( g,
+                                                                 groupProcNum[ g ] )
+                           + ", ".join( schedule[ ie ][ 'ensemble' ]
+                                        for ie in groupEnsembles[ g ] ),
+                           mpi_info )
+
+    group_info = mpi_fncs.lqcdjk_mpi_split( mpi_info, color )
+
+    output_template = options.get( 'output_template', "./*.dat" )
+
+    # Loop over ensembles of this group
+    for ie in groupEnsembles[ color ]:
+
+        name = schedule[ ie ][ 'ensemble' ]
+        ensemble_info = ensemble_info_list[ ie ]
+
+        ensemble_options = dict( options,
+                                 output_template=rw.makeFilename( output_template,
+                                                                  "{}_*",
+                                                                  name ) )
+
+        if group_info[ 'rank' ] == 0:
+
+            results_filename \
+                = rw.makeResultsFilename( ensemble_options[ 'output_template' ],
+                                          "batch_results_{}configs",
+                                          len( ensemble_info[ 'configList' ] ) )
+
+            rw.lqcdjk_results_init( results_filename,
+                                    ensemble_options[ 'output_template' ],
+                                    { 'ensemble': name,
+                                      'analyses': json.dumps( schedule[ ie ][ 'analyses' ] ),
+                                      'a': ensemble_info[ 'a' ],
+                                      'L': ensemble_info[ 'L' ],
+                                      'configNum': len( ensemble_info[ 'configList' ] ),
+                                      'procNum': group_info[ 'procNum' ] } )
+
+            rw.lqcdjk_write_queue_init()
+
+        mpi_fncs.mpiPrint( "Ensemble {} on {} processes".format( name,
+                                                                group_info[ 'procNum' ] ),
+                           group_info )
+
+        bp.batchAnalyses( ensemble_info, schedule[ ie ][ 'analyses' ],
+                          group_info, ensemble_options )
+
+        if group_info[ 'rank' ] == 0:
+
+            rw.lqcdjk_results_finalize( asciiExport )
+
+    # End loop over ensembles
+
+    mpi_fncs.lqcdjk_mpi_free( group_info )
+
+    mpi_info[ 'comm' ].Barrier()
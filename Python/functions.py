@@ -1,10 +1,14 @@
 import math
-import h5py
 import numpy as np
 import re
 from os import listdir as ls
 from glob import glob
 import mpi_functions as mpi_fncs
+import lazyImport as lazy
+
+# Imported when first used
+
+h5py = lazy.lazyImport( "h5py" )
 
 
 def particleList():
@@ -203,11 +207,13 @@ def signToString( val ):
 
 
 # Combines the different final momentum three-point functions for <x>. 
-# It is obsolete, however, because the combination is just an average.
-# Will keep for now  in case a different combination is needed for a
-# future quantity.
+# The combination is just an average over the momentum boosts, which 
+# all lie in the same orbit under the cubic group for the supported 
+# p^2. Will keep for now in case a different combination is needed 
+# for a future quantity.
 
-# threep: Three-point functions to be combined 
+# threep: Three-point functions to be combined with momentum boost in 
+#         the first dimension
 # momSq: Value of mometum squared which determines which momenta we have
 
 def combineMomBoosts(threep, momSq):
@@ -218,50 +224,9 @@ def combineMomBoosts(threep, momSq):
 
         return threep
 
-    elif momSq == 2:
-
-        # Momentum boosts should be ordered as:
-
-        # [ +1, +1,  0],
-        # [ +1,  0, +1],
-        # [  0, +1, +1],
-        # [ +1, -1,  0],
-        # [ +1,  0, -1],
-        # [  0, +1, -1],
-        # [ -1, +1,  0],
-        # [ -1,  0, +1],
-        # [  0, -1, +1],
-        # [ -1, -1,  0],
-        # [ -1,  0, -1],
-        # [  0, -1, -1]
-
-        return threep[0, ...] + threep[1, ...] + threep[2, ...] \
-            + threep[3, ...] + threep[4, ...] + threep[5, ...] \
-            + threep[6, ...] + threep[7, ...] + threep[8, ...] \
-            + threep[9, ...] + threep[10, ...] + threep[11, ...] / 12
-
-    elif momSq == 3:
-
-        # Momentum boosts should be ordered as:
-
-        # [ +1, +1, +1],
-        # [ -1, +1, +1],
-        # [ +1, -1, +1],
-        # [ +1, +1, -1],
-        # [ +1, -1, -1],
-        # [ -1, +1, -1],
-        # [ -1, -1, +1],
-        # [ -1, -1, -1]
-
-        return threep[0, ...] + threep[1, ...] \
-            + threep[2, ...] + threep[3, ...] \
-            + threep[4, ...] + threep[5, ...] \
-            + threep[6, ...] + threep[7, ...] / 8
-
     else:
 
-        print( "Error: momentum boost squared value " \
-               + momSq + " is not supported.\n" )
+        return np.average( threep, axis=0 )
 
 
 # Initializes a list of empty lists of the given order with the same
@@ -306,28 +271,27 @@ def initEmptyList( list_in, list_out_order ):
 # of the data array.
 
 # data: Data to be folded
+# axis (Optional): Axis to fold along. Defaults to the last axis.
 
-def fold( data ):
-
-    timestepNum = data.shape[ -1 ]
-
-    out = np.zeros( data.shape[ :-1 ] + ( timestepNum // 2 + 1, ) )
+def fold( data, axis=-1 ):
 
-    # First data point is unchanged
+    data = np.moveaxis( np.asarray( data ), axis, -1 )
 
-    out[ ..., 0 ] = data[ ..., 0 ]
-
-    for t in range( 1, timestepNum // 2 ):
-        
-        # Average opposite points
-
-        out[ ..., t ] = ( data[ ..., t ] + data[ ..., -t ] ) / 2
+    timestepNum = data.shape[ -1 ]
 
-    # Data point at center is unchanged
+    # First data point and data point at center are unchanged,
+    # points in between are averaged with their opposite point
 
-    out[ ..., timestepNum // 2 ] = data[ ..., timestepNum // 2 ]
+    out = np.concatenate( ( data[ ..., :1 ],
+                            ( data[ ..., 1 : timestepNum // 2 ]
+                              + data[ ...,
+                                      : timestepNum - timestepNum // 2
+                                      : -1 ] ) / 2,
+                            data[ ..., timestepNum // 2
+                                  : timestepNum // 2 + 1 ] ),
+                          axis=-1 )
 
-    return out
+    return np.moveaxis( out, -1, axis )
 
 
 # Reads a configuration list from file if given, else writes a list from
@@ -410,20 +374,14 @@ def getConfigList( configListFilename, configDir ):
 
 def processMomList( QLists ):
 
-    if QLists.ndim > 2:
-
-        if len( QLists ) > 1:
+    QLists = np.asarray( QLists )
 
-            # Check that momenta lists are the same across configurations
-
-            Q_0 = QLists[ 0 ].flat
-
-            for ml in QLists[ 1: ]:
+    if QLists.ndim > 2:
 
-                for i in range( ml.size ):
+        # Check that momenta lists are the same across configurations
 
-                    assert ml.flat[ i ] == Q_0[ i ], \
-                        "Momenta lists do not match."
+        assert np.all( QLists[ 1: ] == QLists[ 0 ] ), \
+            "Momenta lists do not match."
 
         Q = QLists[ 0 ]
 
@@ -431,78 +389,63 @@ def processMomList( QLists ):
 
         Q = QLists
 
-    # List of indices where each Q^2 begins and ends
+    Qsq = np.round( np.sum( np.asarray( Q, dtype=float ) ** 2, axis=-1 ) )
 
-    Qsq_start = []
+    assert np.all( np.diff( Qsq ) >= 0 ), \
+        "Momentum list not in assending order."
 
-    Qsq_end = []
+    # Unique Q^2's, index where each Q^2 begins, index of Q^2 
+    # for each Q, and number of Q for each Q^2
 
-    # List of indices where Q^2 value is in Q
+    Qsq, Qsq_start, Qsq_where, Qsq_count = np.unique( Qsq,
+                                                      return_index=True,
+                                                      return_inverse=True,
+                                                      return_counts=True )
 
-    Qsq_where = []
+    # Index where each Q^2 ends
 
-    Qsq = np.round( ( np.apply_along_axis( np.linalg.norm, 1, \
-                                           np.array( Q ) ) ) ** 2 )
-
-    q_last = -1
-    iq_where = -1
-
-    for q in Qsq:
-
-        if q != q_last:
-
-            assert q > q_last, "Momentum list not in assending order."
-
-            Qsq_start.append( np.where( Qsq == q )[0][0] )
-
-            Qsq_end.append( np.where( Qsq == q )[0][-1] )
-
-            q_last = q
-
-            iq_where += 1
-            
-        # End if q > q_last
-
-        Qsq_where.append( iq_where )
-
-    # End loop over Q^2
-
-    # Remove duplicate Q^2's
-
-    Qsq = sorted( list( set( Qsq ) ) )
+    Qsq_end = Qsq_start + Qsq_count - 1
 
     return np.array( Q, dtype=int ), \
         np.array( Qsq, dtype=int ), \
-        np.array( Qsq_start ), \
-        np.array( Qsq_end ), \
-        np.array( Qsq_where )
+        Qsq_start, \
+        Qsq_end, \
+        Qsq_where.reshape( -1 )
 
 
-# Averages over equal Q^2 for numpy array whose last dimension is Q and 
-# returns averaged data as a numpy array whose first dimension is Q^2
+# Averages over equal Q^2 for numpy array whose second to last dimension 
+# is Q and returns averaged data as a numpy array whose second to last 
+# dimension is Q^2
 
 # data: Data to be averaged with Q in the second to last dimension
 # Qsq_start: List of the starting index for each Q^2 to be averaged over
 # Qsq_end: List of the ending index for each Q^2 to be averaged over
+# axis (Optional): Axis of Q. Defaults to the second to last axis.
+
+def averageOverQsq( data, Qsq_start, Qsq_end, axis=-2 ):
 
-def averageOverQsq( data, Qsq_start, Qsq_end ):
+    Qsq_start = np.asarray( Qsq_start, dtype=int )
+    Qsq_end = np.asarray( Qsq_end, dtype=int )
 
     QsqNum = len( Qsq_start )
 
     assert len( Qsq_end ) == QsqNum, "Error( averageOverQsq ): " \
         + "Qsq_start and Qsq_end have different lengths " \
-        + QsqNum + " and " + len( Qsq_end ) + "."
+        + str( QsqNum ) + " and " + str( len( Qsq_end ) ) + "."
+
+    assert np.all( Qsq_start[ 1: ] == Qsq_end[ :-1 ] + 1 ), \
+        "Error( averageOverQsq ): Q^2 groups are not contiguous."
 
-    avg = np.zeros( data.shape[ :-2 ] + ( QsqNum, data.shape[ -1 ] ) )
+    data = np.moveaxis( np.asarray( data ), axis, -1 )
 
-    for q in range( QsqNum ):
+    # Sum over each Q^2 group, excluding any Q after the last group,
+    # and divide by the number of Q in each group
 
-        avg[ ..., q, : ] \
-            = np.average( data[ ...,
-                                Qsq_start[ q ] : Qsq_end[ q ] + 1, : ],
-                          axis=-2 )
+    avg = np.add.reduceat( data[ ..., : Qsq_end[ -1 ] + 1 ],
+                           Qsq_start, axis=-1 ) \
+        / ( Qsq_end - Qsq_start + 1 )
 
-    return avg
+    return np.moveaxis( avg, -1, axis )
 
 
 # Checks that there are the correct number of source files, that the 
@@ -0,0 +1,40 @@
+import importlib
+
+# Lazy imports of modules which are slow to import or have side
+# effects when imported, e.g., mpi4py.MPI, which initializes MPI. A
+# module imported with
+#
+#   MPI = lazyImport( "mpi4py.MPI" )
+#
+# is used as if imported with 'from mpi4py import MPI' but is only
+# imported when one of its attributes is first used, so that scripts
+# which never use it, e.g., serial post-processing scripts, do not pay
+# for it. Attributes must not be used at import time, e.g., in default
+# arguments or base classes, or the module is imported anyway.
+
+
+# Module which is imported when one of its attributes is first used
+
+class lqcdjk_LazyModule:
+    def __init__( self, name ):
+        self._name = name
+        self._module = None
+
+    def __getattr__( self, attr ):
+        if self._module is None:
+            self._module = importlib.import_module( self._name )
+        return getattr( self._module, attr )
+
+    def __repr__( self ):
+        state = "imported" if self._module is not None else "not imported"
+        return "<lazy module '{}' ({})>".format( self._name, state )
+
+
+# Returns a module which is imported when one of its attributes is
+# first used
+
+# name: Full name of module, e.g., "scipy.optimize"
+
+def lazyImport( name ):
+
+    return lqcdjk_LazyModule( name )
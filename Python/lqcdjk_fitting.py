@@ -2,10 +2,12 @@ import numpy as np
 import functions as fncs
 import physQuants as pq
 import mpi_functions as mpi_fncs
-from mpi4py import MPI
-from scipy.optimize import least_squares, minimize, \
-    differential_evolution, curve_fit
-from scipy.special import beta
+import lazyImport as lazy
+
+# Imported when first used
+
+optimize = lazy.lazyImport( "scipy.optimize" )
+special = lazy.lazyImport( "scipy.special" )
 
 # Exception thrown if good fit cannot be found.
 # The definition of a good fit can vary on fitting routine.
@@ -48,7 +50,7 @@ def fitPlateau( data, err, start, end ):
         x = range( start,
                    rangeEnd + 1 )
 
-        fit[ b ], chiSq[ b ], \
+        fit_b, chiSq_b, \
             dum, dum, dum = np.polyfit( x,
                                         data[ b,
                                               start \
@@ -57,6 +59,10 @@ def fitPlateau( data, err, start, end ):
                                                : rangeEnd + 1 ] ** -1,
                                         full=True )
 
+        # polyfit returns arrays of one coefficient and residual
+
+        fit[ b ], chiSq[ b ] = fit_b[ 0 ], chiSq_b[ 0 ]
+
     # End loop over bin
 
     chiSq = chiSq / dof
@@ -66,17 +72,18 @@ def fitPlateau( data, err, start, end ):
 
 # Wrapper for numpy.polyfit to fit a plateau line to data in parallel
 
-def fitPlateau_parallel( data, start, end, mpi_confs_info ):
+# wait (Optional): If False, return a lqcdjk_CollectiveFuture whose
+#                  wait() returns the fit and chi^2 so that gathering 
+#                  them overlaps with the caller's next fit
+
+def fitPlateau_parallel( data, start, end, mpi_confs_info, wait=True ):
 
     # data[ b, x ]
     # err[ b ]
     # start
     # end
 
-    comm = mpi_confs_info[ 'comm' ]
     binNum = mpi_confs_info[ 'binNum_glob' ]
-    recvCount = mpi_confs_info[ 'recvCount' ]
-    recvOffset = mpi_confs_info[ 'recvOffset' ]
     binList_loc = mpi_confs_info[ 'binList_loc' ]
     binNum_loc = mpi_confs_info[ 'binNum_loc' ]
 
@@ -93,8 +100,9 @@ def fitPlateau_parallel( data, start, end, mpi_confs_info ):
 
     err = fncs.calcError( data, binNum )
 
-    # Loop over bins
-    for b, ib in zip( binList_loc, range( binNum_loc ) ):
+    # Fit a single bin
+
+    def fitBin( b ):
 
         if np.any( np.isnan( err[ start : end + 1 ] ) ):
 
@@ -110,7 +118,7 @@ def fitPlateau_parallel( data, start, end, mpi_confs_info ):
         x = range( start, \
                    rangeEnd + 1 )
 
-        fit_loc[ ib ], chiSq_loc[ ib ], \
+        fit_b, chiSq_b, \
             dum, dum, dum = np.polyfit( x,
                                         data[ b,
                                               start \
@@ -118,20 +126,32 @@ def fitPlateau_parallel( data, start, end, mpi_confs_info ):
                                         w=err[ start \
                                                : rangeEnd + 1 ] ** -1,
                                         full=True )
+
+        # polyfit returns arrays of one coefficient and residual
+
+        return fit_b[ 0 ], chiSq_b[ 0 ]
+
+    # Loop over bins
+    for ( fit_b, chiSq_b ), ib in zip( mpi_fncs.mapBins( fitBin, 
+                                                         binList_loc,
+                                                         mpi_confs_info ),
+                                       range( binNum_loc ) ):
+
+        fit_loc[ ib ], chiSq_loc[ ib ] = fit_b, chiSq_b
         
     # End loop over bin
 
-    fit = np.zeros( binNum )
-    chiSq = np.zeros( binNum )
+    future = mpi_fncs.iallgathervBins( [ fit_loc, chiSq_loc ],
+                                       [ ( binNum, ), ( binNum, ) ],
+                                       mpi_confs_info )
 
-    comm.Allgatherv( fit_loc, 
-                     [ fit, recvCount, recvOffset, MPI.DOUBLE ] )
-    comm.Allgatherv( chiSq_loc, 
-                     [ chiSq, recvCount, recvOffset, MPI.DOUBLE ] )
+    future.then( lambda fit, chiSq: ( fit, chiSq / dof ) )
 
-    chiSq = chiSq / dof
+    if wait:
 
-    return fit, chiSq
+        return future.wait()
+
+    return future
 
 
 def testEffEnergyTwopFit( effEnergy, twop, rangeEnd, pSq, L, particle, 
@@ -155,26 +175,27 @@ def testEffEnergyTwopFit( effEnergy, twop, rangeEnd, pSq, L, particle,
     twop_tsf_results = []
     effEnergy_tsf_results = []
 
-    # Loop over plateau fit range starts
-    for plat_rangeStart in range( 5, rangeEnd - 5 ):
+    plat_rangeStart_list = range( 5, rangeEnd - 5 )
 
-        plat_fit = np.zeros( binNum )
-        plat_chiSq = np.zeros( binNum )
+    # Perform the plateau fits, gathering each fit while the next
+    # one runs
 
-        # Perform the plateau fit
+    plat_futures = [ fitPlateau_parallel( effEnergy,
+                                          plat_rangeStart, rangeEnd, 
+                                          mpi_confs_info, wait=False )
+                     for plat_rangeStart in plat_rangeStart_list ]
+
+    # Loop over plateau fit range starts
+    for plat_rangeStart, plat_future in zip( plat_rangeStart_list,
+                                             plat_futures ):
 
-        plat_fit, plat_chiSq, \
-            = fitPlateau_parallel( effEnergy,
-                                   plat_rangeStart, rangeEnd, 
-                                   mpi_confs_info )
+        plat_fit, plat_chiSq = plat_future.wait()
             
         if rank == 0:
 
             plat_results.append( ( plat_fit, plat_chiSq,
                                    plat_rangeStart ) )
 
-        # Average over bins
-
     # End loop over effective mass fit start
 
     for twop_rangeStart in range( 1, 8 ):
@@ -481,23 +502,177 @@ def effEnergyTwopFit( effEnergy, twop, rangeEnd, pSq, L, tsf,
     return -1
 
 
+# Wrapper for scipy.optimize.differential_evolution which evaluates
+# the population of each generation in parallel across processes
+# instead of on one process while the others wait. Must be called by
+# every process with the same arguments. Returns the result on every
+# process, or raises the error of a failed fit on every process.
+
+# func: Cost function to be minimized
+# bounds: Ranges to search for each parameter
+# args: Extra arguments passed to func
+# mpi_info: MPI info dictionary containing communicator
+# vectorizedFunc (Optional): Version of func which takes a population
+#                            of parameter vectors with shape
+#                            [ paramNum, S ] and returns S values. If
+#                            given, it is used to evaluate each
+#                            population in one call.
+# vectorizedArgs (Optional): Extra arguments passed to vectorizedFunc
+#                            instead of args, e.g., values which only
+#                            need to be computed once per fit
+# kwargs (Optional): Keyword arguments passed to differential_evolution
+
+def differential_evolution_parallel( func, bounds, args, mpi_info, 
+                                     vectorizedFunc=None, 
+                                     vectorizedArgs=None, **kwargs ):
+
+    comm = mpi_info[ 'comm' ]
+    rank = mpi_info[ 'rank' ]
+    procNum = mpi_info[ 'procNum' ]
+
+    if vectorizedArgs is None:
+
+        vectorizedArgs = args
+
+    if procNum == 1:
+
+        if vectorizedFunc is None:
+
+            return optimize.differential_evolution( func, bounds, args, 
+                                                    **kwargs )
+
+        else:
+
+            return optimize.differential_evolution( vectorizedFunc, bounds,
+                                                    vectorizedArgs,
+                                                    vectorized=True,
+                                                    updating="deferred",
+                                                    **kwargs )
+
+    # Evaluate this process's share of the population. Errors are
+    # returned so that every process still takes part in the gather,
+    # and are raised by the first process.
+
+    def evaluate( population ):
+
+        population_loc = np.array_split( population, procNum )[ rank ]
+
+        try:
+
+            if vectorizedFunc is None:
+
+                return [ func( x, *args ) for x in population_loc ]
+
+            elif len( population_loc ):
+
+                return list( vectorizedFunc( population_loc.T, 
+                                             *vectorizedArgs ) )
+
+            else:
+
+                return []
+
+        except Exception as e:
+
+            return e
+
+    if rank == 0:
+
+        # Map used by differential_evolution to evaluate a population
+
+        def mpiMap( f, population ):
+
+            population = np.array( list( population ) )
+
+            comm.bcast( population, root=0 )
+
+            values = comm.gather( evaluate( population ), root=0 )
+
+            for values_r in values:
+
+                if isinstance( values_r, Exception ):
+
+                    raise values_r
+
+            return [ v for values_r in values for v in values_r ]
+
+        result = None
+        error = None
+
+        try:
+
+            result = optimize.differential_evolution( func, bounds, args, 
+                                                      workers=mpiMap,
+                                                      updating="deferred",
+                                                      **kwargs )
+
+        except Exception as e:
+
+            error = e
+
+        # Tell other processes to stop
+
+        comm.bcast( None, root=0 )
+
+    else:
+
+        while True:
+
+            population = comm.bcast( None, root=0 )
+
+            if population is None:
+
+                break
+
+            comm.gather( evaluate( population ), root=0 )
+
+        result = None
+        error = None
+
+    result, error = comm.bcast( ( result, error ), root=0 )
+
+    if error is not None:
+
+        raise error
+
+    return result
+
+
 # Fit two-point functions to a two-state fit.
 
 # twop: Two-point functions to be fit
 # twop_rangeStart: Starting t value to include in fit range
 # twop_rangeEnd: Ending t value to include in fit range
 # T: Time dimension length for ensemble
+# kwargs (Optional): 'method' for the fit method
 
 def twoStateFit_twop( twop, rangeStart, rangeEnd, E_guess, T, 
                       mpi_confs_info, **kwargs ):
 
+    task = twoStateFitTask_twop( twop, rangeStart, rangeEnd, E_guess, T, 
+                                 mpi_confs_info, **kwargs )
+
+    fit, chiSq = mpi_fncs.binTasks( [ task ], mpi_confs_info )[ 0 ]
+
+    return fit, chiSq
+
+
+# Find the initial guess for a two-state fit of two-point functions
+# from their mean values and return a task which fits a single bin
+# and its number of fit parameters. The pair can be run with 
+# mpi_functions.binTasks() along with other tasks.
+
+# twop: Two-point functions to be fit
+# twop_rangeStart: Starting t value to include in fit range
+# twop_rangeEnd: Ending t value to include in fit range
+# T: Time dimension length for ensemble
+
+def twoStateFitTask_twop( twop, rangeStart, rangeEnd, E_guess, T, 
+                          mpi_confs_info, **kwargs ):
+
     comm = mpi_confs_info[ 'comm' ]
     rank = mpi_confs_info[ 'rank' ]
     binNum = mpi_confs_info[ 'binNum_glob' ]
-    binNum_loc = mpi_confs_info[ 'binNum_loc' ]
-    binList_loc = mpi_confs_info[ 'binList_loc' ]
-    recvCount = mpi_confs_info[ 'recvCount' ]
-    recvOffset = mpi_confs_info[ 'recvOffset' ]
 
     assert twop.shape[ 0 ] == binNum, \
         "First dimension size of two-point functions " \
@@ -520,11 +695,6 @@ def twoStateFit_twop( twop, rangeStart, rangeEnd, E_guess, T,
     twop_to_fit = twop[ :, rangeStart : \
                         rangeEnd + 1 ]
 
-    # fit[b]
-
-    fit_loc = np.zeros( ( binNum_loc, paramNum ) )
-    chiSq_loc = np.zeros( binNum_loc )
-
     # Find fit parameters of mean values to use as initial guess
 
     if method == "BFGS":
@@ -551,51 +721,60 @@ def twoStateFit_twop( twop, rangeStart, rangeEnd, E_guess, T,
     twop_err = np.linalg.inv( np.cov( twop_to_fit, rowvar=False ) 
                               * ( binNum - 1 ) )
 
-    if rank == 0:
+    # twop_avg[ts]
 
-        # twop_avg[ts]
-
-        twop_avg = np.average( twop_to_fit, axis=0 )
+    twop_avg = np.average( twop_to_fit, axis=0 )
     
-        #leastSq_avg = least_squares( twoStateErrorFunction_twop, fitParams,
-        #                             args = ( tsink, T,
-        #                                      twop_avg, twop_err ),
-        #                             method="lm" )
+    #leastSq_avg = least_squares( twoStateErrorFunction_twop, fitParams,
+    #                             args = ( tsink, T,
+    #                                      twop_avg, twop_err ),
+    #                             method="lm" )
 
-        if method == "BFGS":
+    # Cost function evaluated for a population at once
+
+    costFunction_vectorized = twoStateCostFunction_twop_vectorized
 
-            leastSq_avg = minimize( twoStateCostFunction_twop, fitParams, \
-                                    args = ( tsink, T,
-                                             twop_avg, twop_err ), \
-                                    method="BFGS" )
+    if method == "BFGS":
+
+        if rank == 0:
+
+            leastSq_avg = optimize.minimize( twoStateCostFunction_twop, 
+                                             fitParams,
+                                             args = ( tsink, T,
+                                                      twop_avg, twop_err ), \
+                                             method="BFGS" )
         
             fitParams = leastSq_avg.x
 
-        else:
+        comm.Bcast( fitParams, root=0 )
 
-            leastSq_avg = differential_evolution( twoStateCostFunction_twop, 
-                                                  fitParams, ( tsink, T, 
-                                                               twop_avg, 
-                                                               twop_err ),
-                                                  tol=0.01 )
-        
-            fitParams = np.array( [ [ max( leastSq_avg.x[ 0 ] - 10**-4,
-                                           0.0 ), 
-                                      leastSq_avg.x[ 0 ] + 10**-4 ],
-                                    [ max( leastSq_avg.x[ 1 ] - 10**-4,
-                                           0.0 ),
-                                      leastSq_avg.x[ 1 ] + 10**-4 ],
-                                    [ max( leastSq_avg.x[ 2 ] - 0.1, 0.0 ),
-                                      leastSq_avg.x[ 2 ] + 0.1 ],
-                                    [ max( leastSq_avg.x[ 3 ] - 0.1, 0.0 ),
-                                      leastSq_avg.x[ 3 ] + 0.1 ] ] )
+    else:
 
-    comm.Bcast( fitParams, root=0 )
+        # Population is evaluated across all processes
 
-    # Find fit parameters for each bins
+        leastSq_avg \
+            = differential_evolution_parallel( twoStateCostFunction_twop, 
+                                               fitParams, ( tsink, T, 
+                                                            twop_avg, 
+                                                            twop_err ),
+                                               mpi_confs_info,
+                                               costFunction_vectorized,
+                                               tol=0.01 )
+        
+        fitParams = np.array( [ [ max( leastSq_avg.x[ 0 ] - 10**-4,
+                                       0.0 ), 
+                                  leastSq_avg.x[ 0 ] + 10**-4 ],
+                                [ max( leastSq_avg.x[ 1 ] - 10**-4,
+                                       0.0 ),
+                                  leastSq_avg.x[ 1 ] + 10**-4 ],
+                                [ max( leastSq_avg.x[ 2 ] - 0.1, 0.0 ),
+                                  leastSq_avg.x[ 2 ] + 0.1 ],
+                                [ max( leastSq_avg.x[ 3 ] - 0.1, 0.0 ),
+                                  leastSq_avg.x[ 3 ] + 0.1 ] ] )
 
-    # Loop over bins
-    for b, ib in zip( binList_loc, range( binNum_loc ) ):
+    # Find fit parameters for a single bin
+
+    def task( b ):
         
         #leastSq = least_squares( twoStateErrorFunction_twop, fitParams, \
         #                         args = ( tsink, T, twop_to_fit[ b, : ], \
@@ -604,59 +783,51 @@ def twoStateFit_twop( twop, rangeStart, rangeEnd, E_guess, T,
 
         if method == "BFGS":
 
-            leastSq = minimize( twoStateCostFunction_twop, fitParams, \
-                                args = ( tsink, T, twop_to_fit[ b, : ], 
-                                         twop_err ), \
-                                method="BFGS" )
+            leastSq = optimize.minimize( twoStateCostFunction_twop, 
+                                         fitParams,
+                                         args = ( tsink, T, 
+                                                  twop_to_fit[ b, : ], 
+                                                  twop_err ), \
+                                         method="BFGS" )
 
-            fit_loc[ ib ] = np.abs( leastSq.x )
+            fit = np.abs( leastSq.x )
 
         else:
 
-            leastSq = differential_evolution( twoStateCostFunction_twop, 
-                                              fitParams, ( tsink, T, 
-                                                           twop_to_fit[ b,
-                                                                        : ], 
-                                                           twop_err ),
-                                              tol=0.0001 )
+            leastSq = optimize.differential_evolution( costFunction_vectorized, 
+                                                       fitParams, 
+                                                       ( tsink, T, 
+                                                         twop_to_fit[ b, : ], 
+                                                         twop_err ),
+                                                       tol=0.0001,
+                                                       vectorized=True,
+                                                       updating="deferred" )
 
-            fit_loc[ ib ] = leastSq.x
+            fit = leastSq.x
 
-        chiSq_loc[ ib ] = leastSq.fun
-        #chiSq_loc[ ib ] = leastSq.cost
+        return fit, leastSq.fun / dof
 
-    # End loop over bins
+    return task, paramNum
 
-    fit = np.zeros( ( binNum, ) + fit_loc.shape[ 1: ] )
-    chiSq = np.zeros( ( binNum, ) + chiSq_loc.shape[ 1: ] )
 
-    comm.Allgatherv( fit_loc, [ fit, 
-                                recvCount * np.prod( fit.shape[ 1: ] ),
-                                recvOffset * np.prod( fit.shape[ 1: ] ),
-                                MPI.DOUBLE ] )
-    comm.Allgatherv( chiSq_loc, [ chiSq, 
-                                  recvCount * np.prod( chiSq.shape[ 1: ] ),
-                                  recvOffset * np.prod( chiSq.shape[ 1: ] ),
-                                  MPI.DOUBLE ] )
-
-    chiSq = np.array( chiSq ) / dof
-
-    return fit, chiSq
+# Fit two-point functions to a two-state fit with the ground state 
+# energy given by the dispersion relation.
 
+# wait (Optional): If False, return a lqcdjk_CollectiveFuture whose
+#                  wait() returns the fit parameters and chi^2, as 
+#                  in fitPlateau_parallel()
 
 def twoStateFit_twop_dispersionRelation( twop,
                                          rangeStart, rangeEnd,
                                          E_ground,
                                          pSq, L,
-                                         mpi_confs_info ):
+                                         mpi_confs_info, wait=True ):
 
     comm = mpi_confs_info[ 'comm' ]
     rank = mpi_confs_info[ 'rank' ]
     binNum = mpi_confs_info[ 'binNum_glob' ]
     binNum_loc = mpi_confs_info[ 'binNum_loc' ]
     binList_loc = mpi_confs_info[ 'binList_loc' ]
-    recvCount = mpi_confs_info[ 'recvCount' ]
-    recvOffset = mpi_confs_info[ 'recvOffset' ]
 
     assert twop.shape[ 0 ] == binNum, \
         "First dimension size of two-point functions " \
@@ -725,13 +896,13 @@ def twoStateFit_twop_dispersionRelation( twop,
         #                        [ max( leastSq_avg.x[ 2 ] - 0.1, 0.0 ),
         #                          leastSq_avg.x[ 2 ] + 0.1 ] ] )
         
-        leastSq_avg = minimize( twoStateCostFunction_twop_dispRel, 
-                                fitParams,
-                                args = ( E0_avg, tsink, T, 
-                                         twop_avg, 
-                                         twop_err ),
-                                tol=0.01,
-                                method="BFGS" )
+        leastSq_avg = optimize.minimize( twoStateCostFunction_twop_dispRel, 
+                                         fitParams,
+                                         args = ( E0_avg, tsink, T, 
+                                                  twop_avg, 
+                                                  twop_err ),
+                                         tol=0.01,
+                                         method="BFGS" )
         
         fitParams = np.abs( leastSq_avg.x )
         
@@ -765,13 +936,13 @@ def twoStateFit_twop_dispersionRelation( twop,
         #                                    twop_to_fit[ b, : ], 
         #                                    twop_err ),
         #                                  tol=0.0001 )
-        leastSq = minimize( twoStateCostFunction_twop_dispRel, 
-                            fitParams,
-                            args = ( E0[ b ], tsink, T, 
-                                     twop_to_fit[ b, : ], 
-                                     twop_err ),
-                            tol=0.0001,
-                            method="BFGS" )
+        leastSq = optimize.minimize( twoStateCostFunction_twop_dispRel, 
+                                     fitParams,
+                                     args = ( E0[ b ], tsink, T, 
+                                              twop_to_fit[ b, : ], 
+                                              twop_err ),
+                                     tol=0.0001,
+                                     method="BFGS" )
 
         fit_loc[ ib ] = np.abs( leastSq.x )
         chiSq_loc[ ib ] = leastSq.fun
@@ -779,33 +950,42 @@ def twoStateFit_twop_dispersionRelation( twop,
 
     # End loop over bins
 
-    fit = np.zeros( ( binNum, ) + fit_loc.shape[ 1: ] )
-    chiSq = np.zeros( ( binNum, ) + chiSq_loc.shape[ 1: ] )
+    future = mpi_fncs.iallgathervBins( [ fit_loc, chiSq_loc ],
+                                       [ ( binNum, ) + fit_loc.shape[ 1: ],
+                                         ( binNum, ) ],
+                                       mpi_confs_info )
 
-    comm.Allgatherv( fit_loc, [ fit, 
-                                recvCount * np.prod( fit.shape[ 1: ] ),
-                                recvOffset * np.prod( fit.shape[ 1: ] ),
-                                MPI.DOUBLE ] )
-    comm.Allgatherv( chiSq_loc, [ chiSq, 
-                                  recvCount * np.prod( chiSq.shape[ 1: ] ),
-                                  recvOffset * np.prod( chiSq.shape[ 1: ] ),
-                                  MPI.DOUBLE ] )
+    future.then( lambda fit, chiSq: ( fit, chiSq / dof ) )
 
-    chiSq = np.array( chiSq ) / dof
+    if wait:
 
-    return fit, chiSq
+        return future.wait()
+
+    return future
 
 
 def twoStateFit_effEnergy( effEnergy, rangeStart, rangeEnd, E_guess, T, 
-                           mpi_confs_info ):
+                           mpi_confs_info, **kwargs ):
+
+    task = twoStateFitTask_effEnergy( effEnergy, rangeStart, rangeEnd, 
+                                      E_guess, T, mpi_confs_info )
+
+    fit, chiSq = mpi_fncs.binTasks( [ task ], mpi_confs_info )[ 0 ]
+
+    return fit, chiSq
+
+
+# Find the initial guess for a two-state fit of the effective energy
+# from its mean values and return a task which fits a single bin and
+# its number of fit parameters. The pair can be run with 
+# mpi_functions.binTasks() along with other tasks.
+
+def twoStateFitTask_effEnergy( effEnergy, rangeStart, rangeEnd, E_guess, T, 
+                               mpi_confs_info ):
 
     comm = mpi_confs_info[ 'comm' ]
     rank = mpi_confs_info[ 'rank' ]
     binNum = mpi_confs_info[ 'binNum_glob' ]
-    binNum_loc = mpi_confs_info[ 'binNum_loc' ]
-    binList_loc = mpi_confs_info[ 'binList_loc' ]
-    recvCount = mpi_confs_info[ 'recvCount' ]
-    recvOffset = mpi_confs_info[ 'recvOffset' ]
 
     assert effEnergy.shape[ 0 ] == binNum, \
         "First dimension size of effective mass " \
@@ -820,11 +1000,6 @@ def twoStateFit_effEnergy( effEnergy, rangeStart, rangeEnd, E_guess, T,
     effEnergy_to_fit = effEnergy[ :, rangeStart : \
                         rangeEnd + 1 ]
 
-    # fit[b]
-
-    fit_loc = np.zeros( ( binNum_loc, paramNum ) )
-    chiSq_loc = np.zeros( binNum_loc )
-
     # Find fit parameters of mean values to use as initial guess
     
     #c = 0.5
@@ -844,38 +1019,45 @@ def twoStateFit_effEnergy( effEnergy, rangeStart, rangeEnd, E_guess, T,
     effEnergy_err = np.linalg.inv( np.cov( effEnergy_to_fit, rowvar=False ) 
                                    * ( binNum - 1 ) )
 
-    if rank == 0:
-
-        # effEnergy_avg[t]
+    # effEnergy_avg[t]
 
-        effEnergy_avg = np.average( effEnergy_to_fit, axis=0 )
+    effEnergy_avg = np.average( effEnergy_to_fit, axis=0 )
     
-        #leastSq_avg = least_squares( twoStateErrorFunction_effEnergy, fitParams,
-        #                             args = ( t_to_fit, T, effEnergy_avg, effEnergy_err ),
-        #                             method="lm" )
-        #leastSq_avg = minimize( twoStateCostFunction_effEnergy, fitParams,
-        #                        args = ( t_to_fit, T, effEnergy_avg, effEnergy_err ),
-        #                        method="BFGS" )
-        leastSq_avg = differential_evolution( twoStateCostFunction_effEnergy, 
-                                              fitParams, ( t_to_fit, T, 
-                                                           effEnergy_avg, 
-                                                           effEnergy_err ),
-                                              tol=0.01 )
-
-        #fitParams = leastSq_avg.x
-        fitParams = np.array( [ [ max( leastSq_avg.x[ 0 ] - 0.1, 0.0 ),
-                                  min( leastSq_avg.x[ 0 ] + 0.1, 1.0 ) ],
-                                [ max( leastSq_avg.x[ 1 ] - 0.1, 0.0 ),
-                                  leastSq_avg.x[ 1 ] + 0.1 ],
-                                [ max( leastSq_avg.x[ 2 ] - 0.1, 0.0 ),
-                                  leastSq_avg.x[ 2 ] + 0.1 ] ] )
-
-    comm.Bcast( fitParams, root=0 )
-
-    # Find fit parameters for each bins
-
-    # Loop over bins
-    for b, ib in zip( binList_loc, range( binNum_loc ) ):
+    #leastSq_avg = least_squares( twoStateErrorFunction_effEnergy, fitParams,
+    #                             args = ( t_to_fit, T, effEnergy_avg, 
+    #                                      effEnergy_err ),
+    #                             method="lm" )
+    #leastSq_avg = minimize( twoStateCostFunction_effEnergy, fitParams,
+    #                        args = ( t_to_fit, T, effEnergy_avg, 
+    #                                 effEnergy_err ),
+    #                        method="BFGS" )
+
+    # Cost function evaluated for a population at once
+
+    costFunction_vectorized = twoStateCostFunction_effEnergy_vectorized
+
+    # Population is evaluated across all processes
+
+    leastSq_avg \
+        = differential_evolution_parallel( twoStateCostFunction_effEnergy, 
+                                           fitParams, ( t_to_fit, T, 
+                                                        effEnergy_avg, 
+                                                        effEnergy_err ),
+                                           mpi_confs_info,
+                                           costFunction_vectorized,
+                                           tol=0.01 )
+
+    #fitParams = leastSq_avg.x
+    fitParams = np.array( [ [ max( leastSq_avg.x[ 0 ] - 0.1, 0.0 ),
+                              min( leastSq_avg.x[ 0 ] + 0.1, 1.0 ) ],
+                            [ max( leastSq_avg.x[ 1 ] - 0.1, 0.0 ),
+                              leastSq_avg.x[ 1 ] + 0.1 ],
+                            [ max( leastSq_avg.x[ 2 ] - 0.1, 0.0 ),
+                              leastSq_avg.x[ 2 ] + 0.1 ] ] )
+
+    # Find fit parameters for a single bin
+
+    def task( b ):
 
         #leastSq = least_squares( twoStateErrorFunction_effEnergy, fitParams,
         #                         args = ( t_to_fit, T, effEnergy_to_fit[ b, : ],
@@ -885,36 +1067,18 @@ def twoStateFit_effEnergy( effEnergy, rangeStart, rangeEnd, E_guess, T,
         #                        args = ( t_to_fit, T, effEnergy_to_fit[ b, : ], 
         #                                 effEnergy_err ),
         #                        method="BFGS" )
-        leastSq = differential_evolution( twoStateCostFunction_effEnergy, 
-                                          fitParams, ( t_to_fit, T, 
-                                                       effEnergy_to_fit[ b, : ], 
-                                                       effEnergy_err ),
-                                          tol=0.0001 )
-
-        fit_loc[ ib ] = np.array( leastSq.x )
-        
-        #chiSq_loc[ ib ] = leastSq.cost
-        chiSq_loc[ ib ] = leastSq.fun
-
-    # End loop over bins
-
-    fit = np.zeros( ( binNum, ) + fit_loc.shape[ 1: ] )
-    chiSq = np.zeros( ( binNum, ) + chiSq_loc.shape[ 1: ] )
+        leastSq = optimize.differential_evolution( costFunction_vectorized, 
+                                                   fitParams, 
+                                                   ( t_to_fit, T, 
+                                                     effEnergy_to_fit[ b, : ], 
+                                                     effEnergy_err ),
+                                                   tol=0.0001,
+                                                   vectorized=True,
+                                                   updating="deferred" )
 
-    comm.Allgatherv( fit_loc, 
-                     [ fit, 
-                       recvCount * np.prod( fit.shape[ 1: ] ),
-                       recvOffset * np.prod( fit.shape[ 1: ] ),
-                       MPI.DOUBLE ] )
-    comm.Allgatherv( chiSq_loc, 
-                     [ chiSq, 
-                       recvCount * np.prod( chiSq.shape[ 1: ] ),
-                       recvOffset * np.prod( chiSq.shape[ 1: ] ),
-                       MPI.DOUBLE ] )
+        return np.array( leastSq.x ), leastSq.fun / dof
 
-    chiSq = chiSq / dof
-
-    return fit, chiSq
+    return task, paramNum
 
 
 # Fit three-point functions to a two-state fit.
@@ -925,9 +1089,12 @@ def twoStateFit_effEnergy( effEnergy, rangeStart, rangeEnd, E_guess, T,
 # E0: ground state energy value calculated from two-state function fit
 # E1: first excited state energy value calculated from two-state function fit
 # T: Time dimension length for ensemble
+# wait (Optional): If False, return a lqcdjk_CollectiveFuture whose
+#                  wait() returns the fit parameters and chi^2, as
+#                  in fitPlateau_parallel()
 
 def twoStateFit_threep( threep, ti_to_fit, tsink, E0, E1,
-                        mpi_confs_info ):
+                        mpi_confs_info, wait=True ):
 
     # Set mpi info
 
@@ -936,8 +1103,6 @@ def twoStateFit_threep( threep, ti_to_fit, tsink, E0, E1,
     binNum = mpi_confs_info[ 'binNum_glob' ]
     binNum_loc = mpi_confs_info[ 'binNum_loc' ]
     binList_loc = mpi_confs_info[ 'binList_loc' ]
-    recvCount = mpi_confs_info[ 'recvCount' ]
-    recvOffset = mpi_confs_info[ 'recvOffset' ]
 
     # Set and check array dimensions
 
@@ -1037,45 +1202,62 @@ def twoStateFit_threep( threep, ti_to_fit, tsink, E0, E1,
 
     fitParams = np.array( [ a00, a01, a11 ] )
 
-    if rank == 0:
-
-        threep_flat = np.array( [] )
+    threep_flat = np.array( [] )
 
-        # Loop over tsink
-        for its in range( tsinkNum ):
+    # Loop over tsink
+    for its in range( tsinkNum ):
 
-            # Flatten threep for each tsink
+        # Flatten threep for each tsink
 
-            threep_flat = np.append( threep_flat, 
-                                     threep_to_fit_avg[ its ] )
+        threep_flat = np.append( threep_flat, 
+                                 threep_to_fit_avg[ its ] )
 
-        # End loop over tsink
+    # End loop over tsink
 
-        # Calculate fit parameters by minimizing chi^2
+    # Calculate fit parameters by minimizing chi^2
+
+    #leastSq_avg = least_squares( twoStateErrorFunction_threep, 
+    #                             fitParams,
+    #                             args = ( ti_flat,
+    #                                      tsink_flat,
+    #                                      threep_flat,
+    #                                      threep_err_flat,
+    #                                      E0_avg, E1_avg ),
+    #                             method="lm" )
+    #leastSq_avg = minimize( twoStateCostFunction_threep, 
+    #                    fitParams,
+    #                    args = ( ti_flat, 
+    #                             tsink_flat,
+    #                             threep_flat,
+    #                             threep_err_flat,
+    #                             E0_avg, E1_avg ),
+    #                    method="BFGS" )
+
+    # Cost function evaluated for a population at once
+
+    costFunction_vectorized = twoStateCostFunction_threep_vectorized
+
+    # Exponentials of the fit, which are fixed by the energies
+
+    exps_avg = twoStateThreepExps( ti_flat, tsink_flat, E0_avg, E1_avg )
+
+    # Population is evaluated across all processes
+
+    leastSq_avg \
+        = differential_evolution_parallel( twoStateCostFunction_threep,
+                                           fitParams, ( ti_flat, 
+                                                        tsink_flat,
+                                                        threep_flat,
+                                                        threep_err_flat,
+                                                        E0_avg, E1_avg ),
+                                           mpi_confs_info,
+                                           costFunction_vectorized,
+                                           ( exps_avg,
+                                             threep_flat,
+                                             threep_err_flat ),
+                                           tol=0.01 )
 
-        #leastSq_avg = least_squares( twoStateErrorFunction_threep, 
-        #                             fitParams,
-        #                             args = ( ti_flat,
-        #                                      tsink_flat,
-        #                                      threep_flat,
-        #                                      threep_err_flat,
-        #                                      E0_avg, E1_avg ),
-        #                             method="lm" )
-        #leastSq_avg = minimize( twoStateCostFunction_threep, 
-        #                    fitParams,
-        #                    args = ( ti_flat, 
-        #                             tsink_flat,
-        #                             threep_flat,
-        #                             threep_err_flat,
-        #                             E0_avg, E1_avg ),
-        #                    method="BFGS" )
-        leastSq_avg = differential_evolution( twoStateCostFunction_threep,
-                                              fitParams, ( ti_flat, 
-                                                           tsink_flat,
-                                                           threep_flat,
-                                                           threep_err_flat,
-                                                           E0_avg, E1_avg ),
-                                              tol=0.01 )
+    if rank == 0:
 
         # Set fit parameters from average threep from fitting results
 
@@ -1184,13 +1366,16 @@ def twoStateFit_threep( threep, ti_to_fit, tsink, E0, E1,
         #                             threep_err_flat,
         #                             E0[ b ], E1[ b ] ),
         #                    method="BFGS" )
-        leastSq = differential_evolution( twoStateCostFunction_threep, 
-                                          fitParams,
-                                          args = ( ti_flat, tsink_flat,
-                                                   threep_flat,
-                                                   threep_err_flat,
-                                                   E0[ b ], E1[ b ] ),
-                                          tol=0.0001 )
+        exps = twoStateThreepExps( ti_flat, tsink_flat, E0[ b ], E1[ b ] )
+
+        leastSq = optimize.differential_evolution( costFunction_vectorized, 
+                                                   fitParams,
+                                                   args = ( exps,
+                                                            threep_flat,
+                                                            threep_err_flat ),
+                                                   tol=0.0001,
+                                                   vectorized=True,
+                                                   updating="deferred" )
 
         # Set fit parameters and chi^2 for each bin
 
@@ -1203,25 +1388,20 @@ def twoStateFit_threep( threep, ti_to_fit, tsink, E0, E1,
     # Gather fit parameters and chi^2
     # fit[ b, param ]
 
-    fit = np.zeros( ( binNum, ) + fit_loc.shape[ 1: ] )
-    chiSq = np.zeros( ( binNum, ) + chiSq_loc.shape[ 1: ] )
-
-    comm.Allgatherv( fit_loc, 
-                     [ fit, 
-                       recvCount * np.prod( fit.shape[ 1: ] ),
-                       recvOffset * np.prod( fit.shape[ 1: ] ),
-                       MPI.DOUBLE ] )
-    comm.Allgatherv( chiSq_loc, 
-                     [ chiSq, 
-                       recvCount * np.prod( chiSq.shape[ 1: ] ),
-                       recvOffset * np.prod( chiSq.shape[ 1: ] ),
-                       MPI.DOUBLE ] )
+    future = mpi_fncs.iallgathervBins( [ fit_loc, chiSq_loc ],
+                                       [ ( binNum, paramNum ),
+                                         ( binNum, ) ],
+                                       mpi_confs_info )
 
     # Calculate chi^2 / d.o.f.
     
-    chiSq = np.array( chiSq ) / dof
-    
-    return fit, chiSq
+    future.then( lambda fit, chiSq: ( fit, chiSq / dof ) )
+
+    if wait:
+
+        return future.wait()
+
+    return future
 
 
 # Fit three-point functions to a two-state fit.
@@ -1308,11 +1488,17 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
     paramNum = 4
     dof = len( ti_flat ) - paramNum
 
+    costFunction = twoStateCostFunction_threep_momTransfer
+
     # Resulting fit parameters
     # results[ b, p, q, r, [ A00, A01, A10, A11 ]  ]
 
     results = np.zeros( ( binNum, pNum, qNum, ratioNum, paramNum ) )
 
+    # Gathers of fits with q > 0 which are still in progress
+
+    futures = []
+
     # Loop over final momenta
     for p, ip in fncs.zipXandIndex( pList ):
 
@@ -1349,17 +1535,23 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
                          * np.prod( threep_loc.shape[ 4: ] ),
                          recvOffset \
                          * np.prod( threep_loc.shape[ 4: ] ),
-                         MPI.DOUBLE ] )
+                         mpi_fncs.mpiType( comm ) ] )
 
         # End loop over tsink
 
+        # Loop over ratios, gathering the fit of each ratio while the
+        # next one runs
+
+        futures_q = [ twoStateFit_threep( threep_q[ :, :, ir, : ],
+                                          ti_to_fit, tsink,
+                                          E0_fin, E1_fin, mpi_info,
+                                          wait=False )
+                      for ir in range( ratioNum ) ]
+
         # Loop over ratios
         for ir in range( ratioNum ):
 
-            fitParams_q, dummy \
-                = twoStateFit_threep( threep_q[ :, :, ir, : ],
-                                      ti_to_fit, tsink,
-                                      E0_fin, E1_fin, mpi_info )
+            fitParams_q, dummy = futures_q[ ir ].wait()
 
             results[ :, ip, 0, ir, 0 ] = fitParams_q[ :, 0 ]
             results[ :, ip, 0, ir, 1 ] = fitParams_q[ :, 1 ]
@@ -1402,37 +1594,39 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
                                    * np.prod( threep_loc.shape[ 4: ] ),
                                    recvOffset \
                                    * np.prod( threep_loc.shape[ 4: ] ),
-                                   MPI.DOUBLE ] )
+                                   mpi_fncs.mpiType( comm ) ] )
                 
             # End loop over tsink
 
-            for ir in range( ratioNum ):
+            # threep_to_fit[ r ][ ts ][ b, t_to_fit ]
+            # threep_err_flat[ r ][ ts * t_to_fit ]
 
-                # threep_to_fit[ ts, b_loc, q, r, t_to_fit ]
+            threep_to_fit = fncs.initEmptyList( ratioNum, 1 )
+            threep_err_flat = fncs.initEmptyList( ratioNum, 1 )
+
+            for ir in range( ratioNum ):
 
-                threep_to_fit = fncs.initEmptyList( tsinkNum, 1 )
-                threep_to_fit_err = fncs.initEmptyList( tsinkNum, 1 )
-                threep_err_flat = np.array( [] )
-                
                 # Set three-point functions to fit based on ti_to_fit
 
-                for its, ts in zip( range( tsinkNum ), tsink ):
-                        
-                    threep_to_fit[ its ] \
-                        = threep_q[ its, :, ir ].take( ti_to_fit[ its ], 
-                                                       axis=-1 )
-                    threep_to_fit_err[ its ] \
-                        = fncs.calcError( threep_to_fit[ its ],
-                                          binNum )
-
-                    threep_err_flat = np.append( threep_err_flat,
-                                                 threep_to_fit_err[ its ] )
-                    
-                # End loop over tsink
+                threep_to_fit[ ir ] \
+                    = [ threep_q[ its, :, ir ].take( ti_to_fit[ its ], 
+                                                     axis=-1 )
+                        for its in range( tsinkNum ) ]
 
-                if rank == 0:
+                threep_err_flat[ ir ] \
+                    = np.concatenate( [ fncs.calcError( threep_to_fit[ ir ]\
+                                                        [ its ],
+                                                        binNum )
+                                        for its in range( tsinkNum ) ] )
 
-                    # Find fit parameters of mean values to use as initial guess
+            # Find fit parameters of mean values on the first process 
+            # to use as initial guess
+
+            def initialGuess( ir ):
+
+                fitParams = np.zeros( 4 )
+
+                if rank == 0:
 
                     a00 = 10.0 ** -5
                     a01 = 10.0 ** -6
@@ -1441,19 +1635,11 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
 
                     fitParams = np.array( [ a00, a01, a10, a11 ] )
 
-                    threep_flat = np.array( [] )
-
-                    # Loop over tsink
-                    for its in range( tsinkNum ):
-
-                        threep_to_fit_avg \
-                            = np.average( threep_to_fit[ its ],
-                                          axis=0 )
-
-                        threep_flat = np.append( threep_flat, 
-                                                 threep_to_fit_avg )
-
-                    # End loop over tsink
+                    threep_flat \
+                        = np.concatenate( [ np.average( threep_to_fit[ ir ]\
+                                                        [ its ],
+                                                        axis=0 )
+                                            for its in range( tsinkNum ) ] )
                     
                     #leastSq_avg = least_squares( twoStateErrorFunction_threep, 
                     #                             fitParams,
@@ -1464,23 +1650,35 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
                     #                                      E0_avg, E1_avg ),
                     #                             method="lm" )
                     leastSq_avg \
-                        = minimize( twoStateCostFunction_threep_momTransfer, 
-                                    fitParams,
-                                    args = ( ti_flat, 
-                                             tsink_flat,
-                                             threep_flat,
-                                             threep_err_flat,
-                                             E0_ini_avg, E0_fin_avg,
-                                             E1_ini_avg, E1_fin_avg ),
-                                    method="BFGS" )
+                        = optimize.minimize( costFunction, 
+                                             fitParams,
+                                             args = ( ti_flat, 
+                                                      tsink_flat,
+                                                      threep_flat,
+                                                      threep_err_flat[ ir ],
+                                                      E0_ini_avg, E0_fin_avg,
+                                                      E1_ini_avg, E1_fin_avg ),
+                                             method="BFGS" )
                 
                     fitParams = leastSq_avg.x
 
-                else: # not first process
+                return fitParams
+
+            guess_future = mpi_fncs.ibcastArrays( [ initialGuess( 0 ) ],
+                                                  mpi_info )
 
-                    fitParams = np.zeros( 4 )
+            for ir in range( ratioNum ):
+
+                fitParams, = guess_future.wait()
+
+                # Broadcast the initial guess of the next ratio while 
+                # the bins of this one are fit
 
-                comm.Bcast( fitParams, root=0 )
+                if ir + 1 < ratioNum:
+
+                    guess_future \
+                        = mpi_fncs.ibcastArrays( [ initialGuess( ir + 1 ) ],
+                                                 mpi_info )
 
                 # Find fit parameters for each bin
             
@@ -1492,15 +1690,9 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
                 # Loop over bins
                 for b, ib in zip( binList_loc, range( binNum_loc ) ):
 
-                    threep_flat = np.array( [] )
-
-                    # Loop over tsink
-                    for its in range( tsinkNum ):
-
-                        threep_flat = np.append( threep_flat, 
-                                                 threep_to_fit[ its ][ b, : ] )
-
-                    # End loop over tsink
+                    threep_flat \
+                        = np.concatenate( [ threep_to_fit[ ir ][ its ][ b, : ]
+                                            for its in range( tsinkNum ) ] )
 
                     #leastSq = least_squares( twoStateErrorFunction_threep, 
                     #                         fitParams,
@@ -1511,15 +1703,17 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
                     #                         method="lm" )
 
                     leastSq \
-                        = minimize( twoStateCostFunction_threep_momTransfer, 
-                                    fitParams,
-                                    args = ( ti_flat, 
-                                             tsink_flat,
-                                             threep_flat,
-                                             threep_err_flat,
-                                             E0_ini[ b ], E0_fin[ b ],
-                                             E1_ini[ b ], E1_fin[ b ] ),
-                                    method="BFGS" )
+                        = optimize.minimize( costFunction, 
+                                             fitParams,
+                                             args = ( ti_flat, 
+                                                      tsink_flat,
+                                                      threep_flat,
+                                                      threep_err_flat[ ir ],
+                                                      E0_ini[ b ], 
+                                                      E0_fin[ b ],
+                                                      E1_ini[ b ], 
+                                                      E1_fin[ b ] ),
+                                             method="BFGS" )
 
                     fit_loc[ ib ] = leastSq.x
                     chiSq_loc[ ib ] = leastSq.fun
@@ -1527,27 +1721,23 @@ def twoStateFit_threep_momTransfer( threep_loc, tsink, m0E0, E1,
 
                 # End loop over bins
 
-                #fit_loc = np.array( fit_loc, order='c' )
-
-                results_buffer = np.zeros( results[ :, ip, iq, ir, : ].shape,
-                                           order='c' )
-
-                comm.Allgatherv( fit_loc, 
-                                 [ results_buffer,
-                                   recvCount * np.prod( fit_loc.shape[ 1: ] ),
-                                   recvOffset * np.prod( fit_loc.shape[ 1: ] ),
-                                   MPI.DOUBLE ] )
+                # Gather while the next ratio or q is fit
 
-                results[ :, ip, iq, ir, : ] = results_buffer
+                futures.append( ( iq, ir,
+                                  mpi_fncs.iallgathervBins( [ fit_loc ],
+                                                            [ ( binNum, 
+                                                                paramNum ) ],
+                                                            mpi_info ) ) )
 
-                #mpi_fncs.mpiPrint( "Fit two-point functions to two-state fit " \
-                    #                   + "at q=({:+},{:+},{:+})".format( q[ 0 ],
-                #                                                     q[ 1 ],
-                #                                                     q[ 2 ] ),
-                #                   mpi_info )
-            
             # End loop over ratio
         # End loop over q
+
+        for iq, ir, future in futures:
+
+            results[ :, ip, iq, ir, : ], = future.wait()
+
+        futures = []
+
     # End loop over final momentum
 
     return results
@@ -1573,6 +1763,48 @@ def twoStateCostFunction_twop( fitParams, tsink, T, twop, sigma ):
         return
 
     
+# Calculate chi^2 of the two-state fit to two-point functions for a
+# population of parameter vectors at once, for use with
+# differential_evolution( ..., vectorized=True ) and other batched
+# solvers
+
+# fitParams: Parameters of fit (c0, c1, E0, E1) with shape [ 4 ] or 
+#            [ 4, S ] for S sets of parameters
+# tsink: tsink values to fit over
+# T: time dimension length of ensemble
+# twop: two-point functions to fit
+# sigma: Jackknife errors or inverse covariance matrix of two-point 
+#        functions
+
+# Returns chi^2 with shape [ S ], or a float if fitParams has shape [ 4 ]
+
+def twoStateCostFunction_twop_vectorized( fitParams, tsink, T, twop, sigma ):
+
+    # c0, c1, E0, E1[ S, 1 ]
+
+    c0, c1, E0, E1 = populationParams( fitParams )
+
+    if sigma.ndim == 1: # sigma is standard deviations
+
+        # r[ S, ts ]
+
+        r = ( twoStateTwop( tsink, T, c0, c1, E0, E1 ) - twop ) / sigma
+
+        chiSq = np.sum( r ** 2, axis=-1 )
+
+    elif sigma.ndim == 2: # sigma is inverse covariant matrix
+
+        r = twoStateTwop_forcePositive( tsink, T, c0, c1, E0, E1 ) - twop
+
+        chiSq = np.einsum( "si,ij,sj->s", r, sigma, r )
+
+    else: # Unsupported
+
+        return
+
+    return populationResult( chiSq, fitParams )
+
+    
 def twoStateCostFunction_twop_dispRel( fitParams, E0, tsink, T, twop, sigma ):
 
     if sigma.ndim == 1: # sigma is standard deviations
@@ -1674,6 +1906,44 @@ def twoStateCostFunction_effEnergy( fitParams, tsink, T,
         return
     
 
+# Calculate chi^2 of the two-state fit to effective energies for a
+# population of parameter vectors at once
+
+# fitParams: Parameters of fit (c, E0, E1) with shape [ 3 ] or [ 3, S ]
+# tsink: tsink values to fit over
+# T: time dimension length of ensemble
+# effEnergy: effective energies to fit
+# sigma: Jackknife errors or inverse covariance matrix of effective
+#        energies
+
+# Returns chi^2 with shape [ S ], or a float if fitParams has shape [ 3 ]
+
+def twoStateCostFunction_effEnergy_vectorized( fitParams, tsink, T, 
+                                               effEnergy, sigma ):
+
+    # c, E0, E1[ S, 1 ]
+
+    c, E0, E1 = populationParams( fitParams )
+
+    # r[ S, t ]
+
+    r = twoStateEffEnergy( tsink, T, c, E0, E1 ) - effEnergy
+
+    if sigma.ndim == 1: # sigma is standard deviations
+
+        chiSq = np.sum( ( r / sigma ) ** 2, axis=-1 )
+
+    elif sigma.ndim == 2: # sigma is inverse covariant matrix
+
+        chiSq = np.einsum( "si,ij,sj->s", r, sigma, r )
+
+    else: # Unsupported
+
+        return
+
+    return populationResult( chiSq, fitParams )
+    
+
 def twoStateErrorFunction_effEnergy( fitParams, tsink, T,
                                      effEnergy, effEnergy_err ):
 
@@ -1707,6 +1977,33 @@ def twoStateCostFunction_threep( fitParams, ti, tsink,
                                                  E0, E1 ) ** 2 )
 
 
+# Calculate chi^2 of the two-state fit to three-point functions for a
+# population of parameter vectors at once. The energies are fixed 
+# during a fit, so the exponentials are computed once per fit by the
+# caller with twoStateThreepExps() and the fit function is linear in
+# the fit parameters.
+
+# fitParams: Parameters of fit (a00, a01, a11) with shape [ 3 ] or 
+#            [ 3, S ]
+# exps: Exponentials from twoStateThreepExps() for the ti, tsink and
+#       energies of the fit with shape [ 3, ts * ti ]
+# threep: three-point functions to fit
+# threep_err: jacckife errors associated with three-point functions
+
+# Returns chi^2 with shape [ S ], or a float if fitParams has shape [ 3 ]
+
+def twoStateCostFunction_threep_vectorized( fitParams, exps,
+                                            threep, threep_err ):
+
+    # threepErr[ S, ts * ti ]
+
+    threepErr = ( np.reshape( fitParams, ( 3, -1 ) ).T @ exps - threep ) \
+        / threep_err
+
+    return populationResult( np.sum( threepErr ** 2, axis=-1 ), 
+                             fitParams )
+
+
 def twoStateCostFunction_threep_momTransfer( fitParams, ti, tsink,
                                              threep, threep_err,
                                              E0_ini, E0_fin,
@@ -1775,6 +2072,23 @@ def twoStateThreep( ti, tsink, a00, a01, a11, E0, E1 ):
         + a11 * np.exp( -E1 * tsink )
 
 
+# Calculate the exponentials multiplying each amplitude of the
+# two-state three-point function so that
+# twoStateThreep = [ a00, a01, a11 ] @ twoStateThreepExps
+
+# ti: insertion time value
+# tsink: tsink value
+# E0: ground state energy value calculated from two-state function fit
+# E1: first excited state energy value calculated from two-state function fit
+
+def twoStateThreepExps( ti, tsink, E0, E1 ):
+
+    return np.array( [ np.exp( -E0 * tsink ),
+                       np.exp( -E0 * ( tsink - ti ) - E1 * ti ) \
+                       + np.exp( -E1 * ( tsink - ti ) - E0 * ti ),
+                       np.exp( -E1 * tsink ) ] )
+
+
 def twoStateThreep_momTransfer( ti, tsink,
                                 a00, a01, a10, a11,
                                 E0_ini, E0_fin,
@@ -1867,12 +2181,12 @@ def fitMellinMoments( moments, paramNum ):
 
         bounds = ( ( None, 0 ), ( None, None ), ( None, None ) )
 
-    leastSq_avg = minimize( mellinMomentCostFunction, 
-                            fitParams_init,
-                            args = ( moments_avg,
-                                     moments_err ),
-                            method=method,
-                            bounds=bounds )
+    leastSq_avg = optimize.minimize( mellinMomentCostFunction, 
+                                     fitParams_init,
+                                     args = ( moments_avg,
+                                              moments_err ),
+                                     method=method,
+                                     bounds=bounds )
     
     fitParams_avg = leastSq_avg.x
 
@@ -1884,12 +2198,12 @@ def fitMellinMoments( moments, paramNum ):
     # Loop over bins
     for ib in range( binNum ):
 
-        leastSq = minimize( mellinMomentCostFunction, 
-                            fitParams_avg,
-                            args = ( moments[ :, ib ],
-                                     moments_err ),
-                            method=method,
-                            bounds=bounds )
+        leastSq = optimize.minimize( mellinMomentCostFunction, 
+                                     fitParams_avg,
+                                     args = ( moments[ :, ib ],
+                                              moments_err ),
+                                     method=method,
+                                     bounds=bounds )
         
         fitParams[ ib ] = leastSq.x
         chiSq[ ib ] = leastSq.fun
@@ -2070,19 +2384,23 @@ def oneStateFit_twop( twop, twop_rangeStart, twop_rangeEnd, T ):
         
     fitParams = np.array( [ G, E ] )
 
-    leastSq_avg = least_squares( oneStateErrorFunction_twop, fitParams, \
-                             args = ( t, T, twop_avg, twop_err ), \
-                             method="lm" )
+    leastSq_avg = optimize.least_squares( oneStateErrorFunction_twop, 
+                                          fitParams, \
+                                          args = ( t, T, twop_avg, 
+                                                   twop_err ), \
+                                          method="lm" )
     
 
     fitParams = leastSq_avg.x
 
     for b in range( binNum ):
 
-        leastSq = least_squares( oneStateErrorFunction_twop, fitParams, \
-                                 args = ( t, T, twop_to_fit[ b, : ], \
-                                          twop_err ), \
-                                 method="lm" )
+        leastSq = optimize.least_squares( oneStateErrorFunction_twop, 
+                                          fitParams, \
+                                          args = ( t, T, 
+                                                   twop_to_fit[ b, : ], \
+                                                   twop_err ), \
+                                          method="lm" )
     
         fit[ b ] = leastSq.x
 
@@ -2214,16 +2532,16 @@ def fitFormFactor_dipole( F, F_err, Qsq, paramNum, mpi_info ):
 
             F0 = F[ ib, 0 ]
 
-            leastSq = minimize( dipoleCostFunction,
-                                [ m ],
-                                args = ( F[ ib ],
-                                         F_err,
-                                         Qsq[ ib ],
-                                         F0 ),
-                                method="CG" )
+            leastSq = optimize.minimize( dipoleCostFunction,
+                                         [ m ],
+                                         args = ( F[ ib ],
+                                                  F_err,
+                                                  Qsq[ ib ],
+                                                  F0 ),
+                                         method="CG" )
 
             # m
-            fitParams[ ib, 0 ] = leastSq.x
+            fitParams[ ib, 0 ] = leastSq.x[ 0 ]
             # F0
             fitParams[ ib, 1 ] = F0
 
@@ -2231,13 +2549,13 @@ def fitFormFactor_dipole( F, F_err, Qsq, paramNum, mpi_info ):
 
             F0 = 1.0
 
-            leastSq = minimize( dipoleCostFunction,
-                                [ m, F0 ],
-                                args = ( F[ ib ],
-                                         F_err,
-                                         Qsq[ ib ],
-                                         None ),
-                                method="CG" )
+            leastSq = optimize.minimize( dipoleCostFunction,
+                                         [ m, F0 ],
+                                         args = ( F[ ib ],
+                                                  F_err,
+                                                  Qsq[ ib ],
+                                                  None ),
+                                         method="CG" )
 
             # [ m, F0 ]
             fitParams[ ib ] = leastSq.x
@@ -2268,6 +2586,31 @@ def dipoleCostFunction( fitParams, F, F_err, Qsq, F0_const ):
     return np.sum( errorFunction ** 2 )
 
 
+# Split a parameter vector with shape [ paramNum ] or population of
+# parameter vectors with shape [ paramNum, S ] into a list of 
+# parameters each with shape [ S, 1 ] to be broadcast against time
+# or Q^2 values
+
+def populationParams( fitParams ):
+
+    fitParams = np.asarray( fitParams )
+
+    return list( fitParams.reshape( len( fitParams ), -1, 1 ) )
+
+
+# Return a float if fitParams is a single parameter vector, as the
+# non-vectorized cost functions do, otherwise the array of chi^2 for
+# each member of the population
+
+def populationResult( chiSq, fitParams ):
+
+    if np.ndim( fitParams ) == 1:
+
+        return chiSq[ 0 ]
+
+    return chiSq
+
+
 def dipole( Qsq, m, F0 ):
 
     return F0 / ( 1 + Qsq / m ** 2 )
@@ -2562,9 +2905,9 @@ def calcPDFcurve( a, b, c, xNum ):
             curve[ ib, ix ] = x[ ix ] * x[ ix ] ** a[ ib ] \
                               * ( 1 - x[ ix ] ) ** b[ ib ] \
                               * ( 1 + c[ ib ] * x[ ix ] ) \
-                              / ( beta( a[ ib ] + 1, b[ ib ] + 1 ) 
-                                  + c[ ib ] * beta( a[ ib ] + 2,
-                                                    b[ ib ] + 1 ) )
+                              / ( special.beta( a[ ib ] + 1, b[ ib ] + 1 ) 
+                                  + c[ ib ] * special.beta( a[ ib ] + 2,
+                                                            b[ ib ] + 1 ) )
         
     return curve, x
 
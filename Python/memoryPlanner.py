@@ -0,0 +1,247 @@
+import os
+import numpy as np
+
+# Predicts the peak memory of each stage of formFactors.py from the
+# sizes of its data, which can be determined from metadata before any
+# correlators are read. Each stage has memory private to each process
+# and memory shared by the processes of a node, e.g., the two-point
+# functions gathered by mpi_functions.sharedAllgatherv().
+# Predictions count the largest numpy arrays alive in each stage and
+# not Python or MPI overhead.
+
+# Bytes of float and complex numbers
+
+floatBytes = 8
+complexBytes = 16
+
+
+# Memory of each stage of formFactors.py
+
+# configNum: Number of configurations
+# binSize: Size of jackknife bins
+# procNum: Number of processes
+# smearNum: Number of smears of two-point functions
+# qNum: Number of momentum transfers of two-point functions
+# qSqNum: Number of Q^2 of two-point functions
+# T: Time dimension length
+# tsinkNum: Number of tsinks
+# finalMomentaNum: Number of final momenta
+# flavNum: Number of flavors
+# projectorNum: Number of projectors
+# qNum_threep: Number of momentum transfers of three-point functions
+# ratioNum: Number of ratios
+
+# Returns list of ( stage name, bytes per process, shared bytes per node )
+
+def formFactorsMemory( configNum, binSize, procNum, smearNum, qNum,
+                       qSqNum, T, tsinkNum, finalMomentaNum, flavNum,
+                       projectorNum, qNum_threep, ratioNum ):
+
+    binNum = configNum // binSize
+
+    # Largest number of configurations and bins on a process
+
+    configNum_loc = -( -configNum // procNum )
+    binNum_loc = -( -binNum // procNum )
+
+    # Two-point functions of all configurations, kept until the end
+    # twop_q[ c, smr, q, t ], twop_qSq[ c, smr, qSq, t ]
+
+    twop_q = configNum * smearNum * qNum * T * floatBytes
+    twop_qSq = configNum * smearNum * qSqNum * T * floatBytes
+
+    # Local jackknifed two-point functions and effective energies
+
+    twop_jk_loc = 2 * binNum_loc * smearNum * qSqNum * T * floatBytes
+
+    # Gathered jackknifed two-point functions and effective energies
+
+    twop_jk = 2 * binNum * smearNum * qSqNum * T * floatBytes
+
+    # Three-point functions of all configurations for one tsink and
+    # final momentum read on each process, the complex data read from
+    # file, and the local jackknifed three-point functions
+
+    threep = configNum * flavNum * qNum_threep * ratioNum * T \
+             * floatBytes
+    threep_file_loc = configNum_loc * flavNum * projectorNum \
+                      * qNum_threep * 4 * T * complexBytes
+    threep_jk_loc = tsinkNum * finalMomentaNum * binNum_loc * flavNum \
+                    * qNum_threep * ratioNum * T * floatBytes
+
+    # Gathered ratios for one tsink and flavor
+
+    ratio = ( binNum + binNum_loc ) * finalMomentaNum * qNum_threep \
+            * ratioNum * T * floatBytes
+
+    stages = [ ( "read two-point functions",
+                 twop_q + configNum_loc * qNum * T
+                 * ( floatBytes + complexBytes ),
+                 0 ),
+               ( "fold, average, and jackknife two-point functions",
+                 twop_q + 2 * twop_qSq + twop_jk_loc,
+                 0 ),
+               ( "gather two-point functions",
+                 twop_q + twop_qSq + twop_jk_loc,
+                 twop_jk ),
+               ( "read and jackknife three-point functions",
+                 twop_q + twop_qSq + twop_jk_loc + threep_jk_loc
+                 + threep + threep_file_loc
+                 + configNum_loc * flavNum * qNum_threep * ratioNum * T
+                 * floatBytes,
+                 twop_jk ),
+               ( "ratios",
+                 twop_q + twop_qSq + twop_jk_loc + threep_jk_loc + ratio,
+                 twop_jk ) ]
+
+    return stages
+
+
+# Physical memory of this node in bytes
+
+def nodeMemory():
+
+    return os.sysconf( "SC_PAGE_SIZE" ) * os.sysconf( "SC_PHYS_PAGES" )
+
+
+# Formats a number of bytes in GB
+
+def GB( nbytes ):
+
+    return "{:.2f} GB".format( nbytes / 1024 ** 3 )
+
+
+# Makes a report of the predicted memory of each stage for the current
+# number of processes and of the peak for other numbers of processes,
+# with the largest number of processes per node which fits in node
+# memory.
+
+# memoryFunction: Function which takes a number of processes and
+#                 returns the stages from formFactorsMemory()
+# procNum: Current number of processes
+# nodeProcNum: Current number of processes on each node
+# binNum: Number of bins, which is the largest useful number of
+#         processes
+# memory (Optional): Memory of each node in bytes. Defaults to the
+#                    physical memory of this node.
+# readBytesPerConfig (Optional): Bytes of one configuration of the
+#                                largest data read at once. If given,
+#                                the number of configurations per read
+#                                chunk is recommended.
+
+def memoryPlan( memoryFunction, procNum, nodeProcNum, binNum,
+                memory=None, readBytesPerConfig=None ):
+
+    if memory is None:
+
+        memory = nodeMemory()
+
+    lines = [ "Predicted memory for {} processes ".format( procNum )
+              + "with {} per node ".format( nodeProcNum )
+              + "(node memory {})".format( GB( memory ) ), "" ]
+
+    lines.append( "{:<50} {:>14} {:>14} {:>14}".format( "stage",
+                                                       "per process",
+                                                       "shared",
+                                                       "per node" ) )
+
+    for stage, local, shared in memoryFunction( procNum ):
+
+        lines.append( "{:<50} {:>14} {:>14} {:>14}"\
+                      .format( stage, GB( local ), GB( shared ),
+                               GB( nodeProcNum * local + shared ) ) )
+
+    # End loop over stages
+
+    lines += [ "", "{:>10} {:>20} {:>20} {:>20}".format( "processes",
+                                                         "peak per process",
+                                                         "shared per node",
+                                                         "max per node" ) ]
+
+    # Numbers of processes to try: powers of 2, the current number,
+    # and the number of bins
+
+    procNumList = sorted( set( [ 2 ** i for i
+                                 in range( int( np.log2( binNum ) ) + 1 ) ]
+                               + [ procNum, binNum ] ) )
+
+    procNumList = [ n for n in procNumList if n <= binNum ]
+
+    recommend = None
+
+    for n in procNumList:
+
+        stages = memoryFunction( n )
+
+        # Peak over stages of the memory of a process and of the
+        # shared memory
+
+        local = max( stage[ 1 ] for stage in stages )
+        shared = max( stage[ 2 ] for stage in stages )
+
+        # Largest number of processes per node which fits
+
+        maxNodeProcNum = int( ( memory - shared ) // local ) \
+                         if memory > shared else 0
+
+        maxNodeProcNum = min( maxNodeProcNum, n )
+
+        lines.append( "{:>10} {:>20} {:>20} {:>20}".format( n, GB( local ),
+                                                            GB( shared ),
+                                                            maxNodeProcNum ) )
+
+        # Recommend the fewest processes, starting from the current
+        # number, which fit on a node
+
+        if maxNodeProcNum and recommend is None \
+           and n >= procNum:
+
+            recommend = ( n, maxNodeProcNum )
+
+    # End loop over numbers of processes
+
+    lines.append( "" )
+
+    if recommend is None:
+
+        lines.append( "No number of processes up to the number of "
+                      + "bins fits in node memory. Use more memory per "
+                      + "process, a larger bin size, or fewer tsinks or "
+                      + "momenta." )
+
+    else:
+
+        n, maxNodeProcNum = recommend
+
+        lines.append( "Recommended: {} processes ".format( n )
+                      + "with at most {} per node ".format( maxNodeProcNum )
+                      + "({} nodes).".format( -( -n // maxNodeProcNum ) ) )
+
+    if readBytesPerConfig:
+
+        # Memory left on each process at the current number of processes
+
+        stages = memoryFunction( procNum )
+
+        free = ( memory - max( stage[ 2 ] for stage in stages ) ) \
+               / nodeProcNum - max( stage[ 1 ] for stage in stages )
+
+        chunkSize = readChunkSize( readBytesPerConfig, max( free, 0 ) )
+
+        lines.append( "Recommended read chunk: at most "
+                      + "{} configurations per process.".format( chunkSize ) )
+
+    return "\n".join( lines )
+
+
+# Largest number of configurations which can be read by a process in
+# one chunk so that the read buffer uses at most a fraction of the
+# memory left per process
+
+# bytesPerConfig: Bytes of one configuration of the data being read
+# memory: Memory available to each process in bytes
+# fraction (Optional): Fraction of memory to use for the read buffer
+
+def readChunkSize( bytesPerConfig, memory, fraction=0.25 ):
+
+    return max( int( fraction * memory // bytesPerConfig ), 1 )
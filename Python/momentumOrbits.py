@@ -0,0 +1,81 @@
+import numpy as np
+
+# Functions for averaging data over orbits of momenta under the cubic
+# group, i.e., over all permutations and sign flips of the momentum
+# components. Two momenta are in the same orbit if and only if their
+# sorted absolute components are equal, so the orbit index of a
+# momentum list can be built once and then used to average any array
+# with a momentum axis.
+
+
+# Builds the orbit index for a momentum list. Orbits are ordered by
+# p^2 and then by their representative momentum.
+
+# momList: Momentum list with shape [ p, 3 ], as returned by
+#          readWrite.readMomentumTransferList() or
+#          readWrite.readMomentaList()
+
+# Returns:
+# orbit_where: Orbit index of each momentum in momList
+# orbitRep: Representative momentum of each orbit with its absolute
+#           components in descending order
+# orbitPSq: p^2 of each orbit
+# orbitCount: Number of momenta of momList in each orbit
+
+def orbitIndex( momList ):
+
+    momList = np.asarray( momList, dtype=int )
+
+    assert momList.ndim == 2 and momList.shape[ -1 ] == 3, \
+        "Error (momentumOrbits.orbitIndex): momentum list " \
+        + "should have shape [ p, 3 ], not " \
+        + "{}.".format( momList.shape )
+
+    # Sorted absolute components uniquely identify an orbit
+
+    rep = -np.sort( -np.abs( momList ), axis=-1 )
+
+    pSq = np.sum( rep ** 2, axis=-1 )
+
+    # Unique rows are sorted lexicographically, so putting p^2 first
+    # orders the orbits by p^2
+
+    key = np.column_stack( ( pSq, rep ) )
+
+    key, orbit_where, orbitCount = np.unique( key, axis=0,
+                                              return_inverse=True,
+                                              return_counts=True )
+
+    return orbit_where.reshape( -1 ), key[ :, 1: ], key[ :, 0 ], \
+        orbitCount
+
+
+# Averages data over momenta in the same orbit.
+
+# data: Data to be averaged with momentum in dimension given by axis
+# orbit_where: Orbit index of each momentum from orbitIndex()
+# axis (Optional): Axis of momentum. Defaults to the second to last axis.
+
+def averageOverOrbits( data, orbit_where, axis=-2 ):
+
+    orbit_where = np.asarray( orbit_where, dtype=int )
+
+    data = np.moveaxis( np.asarray( data ), axis, -1 )
+
+    assert data.shape[ -1 ] == len( orbit_where ), \
+        "Error (momentumOrbits.averageOverOrbits): momentum " \
+        + "dimension of data has length {}, ".format( data.shape[ -1 ] ) \
+        + "orbit index has length {}.".format( len( orbit_where ) )
+
+    orbitCount = np.bincount( orbit_where )
+
+    # Group momenta of each orbit together and sum each group
+
+    order = np.argsort( orbit_where, kind="stable" )
+
+    orbitStart = np.concatenate( ( [ 0 ], np.cumsum( orbitCount )[ :-1 ] ) )
+
+    avg = np.add.reduceat( data[ ..., order ], orbitStart, axis=-1 ) \
+        / orbitCount
+
+    return np.moveaxis( avg, -1, axis )
@@ -1,6 +1,71 @@
+import os
+import sys
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from queue import Empty
+from multiprocessing import shared_memory, resource_tracker
 from sys import stderr
-from mpi4py import MPI
 import numpy as np
+import lazyImport as lazy
+
+# Imported when first used. Importing mpi4py.MPI initializes MPI.
+
+MPI = lazy.lazyImport( "mpi4py.MPI" )
+dtlib = lazy.lazyImport( "mpi4py.util.dtlib" )
+
+# Stand-ins for MPI.ANY_SOURCE and MPI.ANY_TAG, which lqcdjk_PoolComm
+# accepts, and for MPI.COMM_NULL, which MPI info dictionaries hold 
+# instead of it, so that code which runs without MPI does not import 
+# mpi4py.MPI
+
+ANY_SOURCE = None
+ANY_TAG = None
+COMM_NULL = None
+
+# Result of a non-blocking collective. wait() blocks until the 
+# collective is complete and returns its unpacked result. then() 
+# adds a function applied to the unpacked result, e.g., to normalize
+# gathered chi^2 values.
+
+class lqcdjk_CollectiveFuture:
+    def __init__( self, request, unpack, *buffers ):
+        self.request = request
+        self.unpack = unpack
+        # Buffers must stay allocated until the collective is complete
+        self.buffers = buffers
+        self.result = None
+        self.complete = False
+
+    def done( self ):
+        if not self.complete:
+            self.complete = self.request.Test()
+        return self.complete
+
+    def wait( self ):
+        if self.result is None:
+            self.request.Wait()
+            self.complete = True
+            self.result = self.unpack()
+            self.buffers = None
+        return self.result
+
+    def then( self, func ):
+        unpack = self.unpack
+        self.unpack = lambda: func( *unpack() )
+        return self
+
+
+# Returns the result of a work unit, waiting for it first if it is a
+# lqcdjk_CollectiveFuture
+
+def waitResult( result ):
+
+    if isinstance( result, lqcdjk_CollectiveFuture ):
+
+        return result.wait()
+
+    return result
+
 
 def lqcdjk_mpi_init():
 
@@ -10,8 +75,73 @@ def lqcdjk_mpi_init():
     mpi_info[ 'procNum' ] = mpi_info[ 'comm' ].Get_size()
     mpi_info[ 'rank' ] = mpi_info[ 'comm' ].Get_rank()
 
+    lqcdjk_mpi_node_info( mpi_info )
+
     return mpi_info
 
+
+# Splits the communicator into communicators of processes on the same
+# node and a communicator of the first process on each node, used for
+# node-shared memory.
+
+# mpi_info: MPI info dictionary containing communicator
+
+def lqcdjk_mpi_node_info( mpi_info ):
+
+    comm = mpi_info[ 'comm' ]
+
+    if isinstance( comm, lqcdjk_PoolComm ):
+
+        # Node-shared memory is only used with MPI
+
+        return
+
+    rank = mpi_info[ 'rank' ]
+
+    nodeComm = comm.Split_type( MPI.COMM_TYPE_SHARED, key=rank )
+
+    mpi_info[ 'nodeComm' ] = nodeComm
+    mpi_info[ 'nodeRank' ] = nodeComm.Get_rank()
+    mpi_info[ 'nodeProcNum' ] = nodeComm.Get_size()
+
+    # Global ranks of processes on this node
+
+    mpi_info[ 'nodeRankList' ] = np.array( nodeComm.allgather( rank ),
+                                           dtype=int )
+
+    # Communicator of node leaders. COMM_NULL on other processes.
+
+    leaderComm \
+        = comm.Split( 0 if mpi_info[ 'nodeRank' ] == 0 else MPI.UNDEFINED,
+                      rank )
+
+    mpi_info[ 'leaderComm' ] = leaderComm \
+                               if leaderComm != MPI.COMM_NULL else COMM_NULL
+
+
+# Splits the processes into groups, e.g., to run the analyses of
+# several ensembles at once, and returns the MPI info dictionary of
+# the group of this process, which can be used like the one from
+# lqcdjk_mpi_init().
+
+# mpi_info: MPI info dictionary containing communicator
+# color: Group of this process. Processes keep their order in each
+#        group.
+
+def lqcdjk_mpi_split( mpi_info, color ):
+
+    group_info = {}
+
+    group_info[ 'comm' ] = mpi_info[ 'comm' ].Split( color,
+                                                     mpi_info[ 'rank' ] )
+    group_info[ 'procNum' ] = group_info[ 'comm' ].Get_size()
+    group_info[ 'rank' ] = group_info[ 'comm' ].Get_rank()
+
+    lqcdjk_mpi_node_info( group_info )
+
+    return group_info
+
+
 def lqcdjk_mpi_confs_info( mpi_confs_info ):
 
     configList = mpi_confs_info[ 'configList' ]
@@ -71,27 +201,7 @@ def lqcdjk_mpi_confs_info( mpi_confs_info ):
 
     mpi_confs_info[ 'configNum_loc' ] = len( configList_loc )
 
-    # Global index of first conf of bins for each process
-    binStart = np.array( [ np.array( [ cl for cl in iconf[ r ]
-                                       if cl % binSize == 0 ], 
-                                     dtype=int )
-                           for r in range( procNum ) ] )
-
-    # Global bin index for each process
-    bin_glob = binStart // binSize
-
-    # List of global bin indices on this process
-    binList_loc = bin_glob[ rank ]
-    mpi_confs_info[ 'binList_loc' ] = binList_loc
-
-    # Number of bins for each process
-    binNum = [ len( binStart[ r ] ) for r in range( procNum ) ]
-
-    # Number of bins for this process
-    binNum_loc = binNum[ rank ]
-    mpi_confs_info[ 'binNum_loc' ] = binNum_loc
-
-    # Number of configurations on each process and offset 
+    # Number of configurations on each process and offset
     # for gatherv functions
 
     configNum_loc_list = np.zeros( procNum, dtype=int )
@@ -104,16 +214,197 @@ def lqcdjk_mpi_confs_info( mpi_confs_info ):
         confOffset[ r ] = offsetSum
 
         offsetSum += configNum_loc_list[ r ]
-        
+
     mpi_confs_info[ 'configNum_loc_list' ] = configNum_loc_list
     mpi_confs_info[ 'confOffset' ] = confOffset
 
+    # Bins are distributed separately from configurations
+
+    lqcdjk_mpi_bins_info( mpi_confs_info )
+
+
+# Distributes bins across processes independently of how 
+# configurations are distributed and sets the bin information in 
+# mpi_confs_info
+
+# mpi_confs_info: MPI info dictionary containing 'binNum_glob'
+
+def lqcdjk_mpi_bins_info( mpi_confs_info ):
+
+    procNum = mpi_confs_info[ 'procNum' ]
+    rank = mpi_confs_info[ 'rank' ]
+
+    # Global bin indices for each process
+
+    binList = binDistribution( mpi_confs_info[ 'binNum_glob' ], procNum )
+
+    # List of global bin indices on this process
+    binList_loc = binList[ rank ]
+    mpi_confs_info[ 'binList_loc' ] = binList_loc
+
+    # Number of bins for each process
+    binNum = [ len( binList[ r ] ) for r in range( procNum ) ]
+
+    # Number of bins for this process
+    mpi_confs_info[ 'binNum_loc' ] = binNum[ rank ]
+
     # Number of bins on each process and offset for gatherv functions
     recvCount, recvOffset = recvCountOffset( procNum, binNum )
     mpi_confs_info[ 'recvCount' ] = recvCount
     mpi_confs_info[ 'recvOffset' ] = recvOffset
 
 
+# Returns a list of global bin indices for each process. Each process
+# gets a contiguous block of the same number of bins, give or take 
+# one, in order of rank, so that gathering with recvCountOffset() puts
+# bins in global order.
+
+# binNum: Total number of bins
+# procNum: Number of processes
+
+def binDistribution( binNum, procNum ):
+
+    # Give the first binNum % procNum processes one extra bin
+
+    binRank = np.repeat( np.arange( procNum ),
+                         [ binNum // procNum
+                           + ( 1 if r < binNum % procNum else 0 )
+                           for r in range( procNum ) ] )
+
+    return [ np.where( binRank == r )[ 0 ] for r in range( procNum ) ]
+
+
+# Splits processes into groups of contiguous ranks and returns an MPI 
+# info dictionary for the group of this process, with the bins 
+# distributed over the processes of the group. Configuration 
+# information is copied from mpi_confs_info and refers to the full 
+# communicator, so data should be read before splitting. With one 
+# group, mpi_confs_info itself is returned and no communicators are 
+# created. Otherwise, the group's communicators should be freed with
+# lqcdjk_mpi_free() when done.
+
+# mpi_confs_info: MPI info dictionary from lqcdjk_mpi_confs_info()
+# groupNum: Number of groups
+
+def lqcdjk_mpi_group_info( mpi_confs_info, groupNum ):
+
+    comm = mpi_confs_info[ 'comm' ]
+    procNum = mpi_confs_info[ 'procNum' ]
+    rank = mpi_confs_info[ 'rank' ]
+
+    if isinstance( comm, lqcdjk_PoolComm ):
+
+        # Groups are only supported with MPI
+
+        groupNum = 1
+
+    groupNum = max( 1, min( groupNum, procNum ) )
+
+    if groupNum == 1:
+
+        return mpi_confs_info
+
+    group = rank * groupNum // procNum
+
+    group_info = { key: val for key, val in mpi_confs_info.items()
+                   if key not in ( 'nodeComm', 'nodeRank', 'nodeProcNum',
+                                   'nodeRankList', 'leaderComm' ) }
+
+    group_info[ 'group' ] = group
+    group_info[ 'groupNum' ] = groupNum
+
+    group_info[ 'comm' ] = comm.Split( group, rank )
+    group_info[ 'procNum' ] = group_info[ 'comm' ].Get_size()
+    group_info[ 'rank' ] = group_info[ 'comm' ].Get_rank()
+
+    lqcdjk_mpi_node_info( group_info )
+    lqcdjk_mpi_bins_info( group_info )
+
+    return group_info
+
+
+# Frees the communicators of an MPI info dictionary from 
+# lqcdjk_mpi_split() or lqcdjk_mpi_group_info()
+
+# mpi_info: MPI info dictionary of a group
+
+def lqcdjk_mpi_free( mpi_info ):
+
+    for key in 'leaderComm', 'nodeComm', 'comm':
+
+        if mpi_info.get( key, COMM_NULL ) is not COMM_NULL:
+
+            mpi_info[ key ].Free()
+
+            mpi_info[ key ] = COMM_NULL
+
+
+# Runs independent work units, e.g., different tsinks, flavors or
+# form factors, in groups of processes, with each unit run by the 
+# bin-parallel routines of one group. Returns the list of results of
+# each unit on every process.
+
+# unitList: List of work units
+# func: Function which takes a work unit and the MPI info dictionary 
+#       of a group and returns the result of the unit on every 
+#       process of the group. It may instead return a 
+#       lqcdjk_CollectiveFuture of the result, which is waited on 
+#       after the group has started its other units.
+# mpi_confs_info: MPI info dictionary from lqcdjk_mpi_confs_info()
+# groupNum (Optional): Number of groups. If not given, uses as many 
+#                      groups as possible with at least as many 
+#                      processes as bins in each group.
+
+def groupTasks( unitList, func, mpi_confs_info, groupNum=None ):
+
+    if groupNum is None:
+
+        groupNum = mpi_confs_info[ 'procNum' ] \
+                   // mpi_confs_info[ 'binNum_glob' ]
+
+    groupNum = max( 1, min( groupNum, len( unitList ) ) )
+
+    group_info = lqcdjk_mpi_group_info( mpi_confs_info, groupNum )
+
+    if group_info is mpi_confs_info:
+
+        results = [ func( unit, mpi_confs_info ) for unit in unitList ]
+
+        return [ waitResult( result ) for result in results ]
+
+    group = group_info[ 'group' ]
+    groupNum = group_info[ 'groupNum' ]
+
+    try:
+
+        # Units are assigned to groups in turn
+
+        results_loc = [ ( iu, func( unit, group_info ) ) 
+                        for unit, iu in zip( unitList,
+                                             range( len( unitList ) ) )
+                        if iu % groupNum == group ]
+
+        results_loc = [ ( iu, waitResult( result ) ) 
+                        for iu, result in results_loc ]
+
+        # Reassemble results from the first process of each group
+
+        results = [ None for unit in unitList ]
+
+        for results_group in mpi_confs_info[ 'comm' ].allgather( 
+                results_loc if group_info[ 'rank' ] == 0 else [] ):
+
+            for iu, result in results_group:
+
+                results[ iu ] = result
+
+    finally:
+
+        lqcdjk_mpi_free( group_info )
+
+    return results
+
+
 # Prints message run by first process
 
 # message: Message to be printed
@@ -183,3 +474,854 @@ def recvCountOffset( procNum, binNum ):
         offsetSum += binNum[ p ]
 
     return np.array( recvCount ), np.array( recvOffset )
+
+
+# Returns the MPI datatype of a NumPy data type to be given in buffer
+# specifications, e.g., [ recvbuf, counts, displs, mpiType( comm ) ].
+# lqcdjk_PoolComm takes the data type from the arrays, so for it 
+# returns None without importing mpi4py.MPI.
+
+# comm: Communicator the buffer is given to
+# dtype (Optional): NumPy data type of buffer
+
+def mpiType( comm, dtype=float ):
+
+    if isinstance( comm, lqcdjk_PoolComm ):
+
+        return None
+
+    return dtlib.from_numpy_dtype( np.dtype( dtype ) )
+
+
+# Returns MPI.ANY_SOURCE, or ANY_SOURCE for a lqcdjk_PoolComm, 
+# without importing mpi4py.MPI for it
+
+# comm: Communicator to receive from
+
+def anySource( comm ):
+
+    if isinstance( comm, lqcdjk_PoolComm ):
+
+        return ANY_SOURCE
+
+    return MPI.ANY_SOURCE
+
+
+# Allocates a zero-initialized array in memory shared by all processes
+# on a node. Returns the array and the MPI window which owns its memory.
+# The window must be kept as long as the array is used and can be 
+# freed with win.Free() on all processes.
+
+# shape: Shape of array
+# mpi_info: MPI info dictionary containing node communicator
+# dtype (Optional): Data type of array
+
+def sharedZeros( shape, mpi_info, dtype=float ):
+
+    nodeComm = mpi_info[ 'nodeComm' ]
+
+    dtype = np.dtype( dtype )
+
+    # Only the node leader allocates memory
+
+    if mpi_info[ 'nodeRank' ] == 0:
+
+        byteNum = int( np.prod( shape ) ) * dtype.itemsize
+
+    else:
+
+        byteNum = 0
+
+    win = MPI.Win.Allocate_shared( byteNum, dtype.itemsize,
+                                   comm=nodeComm )
+
+    buf, itemsize = win.Shared_query( 0 )
+
+    array = np.ndarray( buffer=buf, dtype=dtype, shape=shape )
+
+    if mpi_info[ 'nodeRank' ] == 0:
+
+        array.fill( 0 )
+
+    nodeComm.Barrier()
+
+    return array, win
+
+
+# Same as comm.Allgatherv() over bins, but gathers into one 
+# node-shared array instead of a copy on every process. Without MPI,
+# gathers into a normal array and the returned window is None. Each
+# process writes its bins directly into the shared array and only 
+# node leaders communicate between nodes. Returns the array and the 
+# MPI window which owns its memory. The array should be treated as
+# read-only, and the window freed with freeSharedArrays() once the 
+# array is no longer needed.
+
+# sendbuf: Local data with local bins in first dimension
+# shape: Shape of gathered array with bins in first dimension
+# mpi_info: MPI info dictionary containing communicators and 
+#           'recvCount' and 'recvOffset' from lqcdjk_mpi_confs_info()
+# dtype (Optional): Data type of array
+
+def sharedAllgatherv( sendbuf, shape, mpi_info, dtype=float ):
+
+    rank = mpi_info[ 'rank' ]
+
+    elemNum = int( np.prod( shape[ 1: ] ) )
+
+    count = np.asarray( mpi_info[ 'recvCount' ], dtype=int ) * elemNum
+    offset = np.asarray( mpi_info[ 'recvOffset' ], dtype=int ) * elemNum
+
+    if 'nodeComm' not in mpi_info:
+
+        # Not running with MPI, so gather into a normal array
+
+        recvbuf = np.zeros( shape, dtype=dtype )
+
+        mpi_info[ 'comm' ].Allgatherv( np.asarray( sendbuf, dtype=dtype ),
+                                       [ recvbuf, count, offset,
+                                         mpiType( mpi_info[ 'comm' ],
+                                                  recvbuf.dtype ) ] )
+
+        return recvbuf, None
+
+    nodeComm = mpi_info[ 'nodeComm' ]
+    leaderComm = mpi_info[ 'leaderComm' ]
+
+    recvbuf, win = sharedZeros( shape, mpi_info, dtype )
+
+    recvbuf_flat = recvbuf.reshape( -1 )
+
+    # Write local data into node-shared array
+
+    recvbuf_flat[ offset[ rank ] : offset[ rank ] + count[ rank ] ] \
+        = np.asarray( sendbuf, dtype=dtype ).reshape( -1 )
+
+    nodeComm.Barrier()
+
+    if leaderComm is not COMM_NULL:
+
+        leaderType = mpiType( leaderComm, recvbuf.dtype )
+
+        # Global ranks on each node
+
+        rankList = leaderComm.allgather( mpi_info[ 'nodeRankList' ] )
+
+        nodeCount = np.array( [ np.sum( count[ r ] ) for r in rankList ],
+                              dtype=int )
+
+        if all( np.array_equal( r, np.arange( r[ 0 ], r[ -1 ] + 1 ) )
+                for r in rankList ):
+
+            # Data of each node is contiguous, so gather in place
+
+            nodeOffset = np.array( [ offset[ r[ 0 ] ] for r in rankList ],
+                                   dtype=int )
+
+            leaderComm.Allgatherv( MPI.IN_PLACE,
+                                   [ recvbuf_flat, nodeCount,
+                                     nodeOffset, leaderType ] )
+
+        else:
+
+            # Pack data of this node, gather, and unpack
+
+            sendbuf_node = np.concatenate( [ recvbuf_flat[ offset[ r ] :
+                                                           offset[ r ]
+                                                           + count[ r ] ]
+                                             for r in
+                                             mpi_info[ 'nodeRankList' ] ] )
+
+            nodeOffset = np.concatenate( ( [ 0 ],
+                                           np.cumsum( nodeCount )[ :-1 ] ) )
+
+            recvbuf_node = np.zeros( np.sum( nodeCount ), dtype=dtype )
+
+            leaderComm.Allgatherv( sendbuf_node,
+                                   [ recvbuf_node, nodeCount,
+                                     nodeOffset, leaderType ] )
+
+            iNode = 0
+
+            for r in np.concatenate( rankList ):
+
+                recvbuf_flat[ offset[ r ] : offset[ r ] + count[ r ] ] \
+                    = recvbuf_node[ iNode : iNode + count[ r ] ]
+
+                iNode += count[ r ]
+
+    nodeComm.Barrier()
+
+    return recvbuf, win
+
+
+# Frees the MPI windows of node-shared arrays from sharedAllgatherv()
+# stored in a dictionary. The arrays are removed from the dictionary
+# since their memory is no longer valid, so no other references to 
+# them may remain. Must be called by every process of the node before
+# its communicators are freed.
+
+# data_info: Dictionary with each array under its name and its window,
+#            or None without MPI, under its name followed by '_win'
+# nameList: Names of the arrays
+
+def freeSharedArrays( data_info, nameList ):
+
+    for name in nameList:
+
+        data_info.pop( name, None )
+
+        win = data_info.pop( name + "_win", None )
+
+        if win is not None:
+
+            win.Free()
+
+    # End loop over arrays
+
+
+# Sets the number and type of workers each process uses to run its
+# local bins in mapBins(). Threads suit NumPy-heavy work, which 
+# releases the GIL, and processes suit pure-Python work like scipy 
+# optimizers. When using several workers, the number of threads used 
+# by NumPy's linear algebra library should be reduced accordingly, 
+# e.g., with OMP_NUM_THREADS. Worker processes are forked, which most 
+# MPI libraries do not support once MPI is initialized, so threads are 
+# used instead under MPI. Starting them with spawn or forkserver would
+# run the analysis script again in each worker, initializing MPI there.
+
+# mpi_info: MPI info dictionary
+# workerNum: Number of workers per process
+# workerType (Optional): "thread" or "process"
+# dynamic (Optional): If True, binTasks() hands out bins of fit tasks
+#                     dynamically with dynamicBinTasks(), which suits
+#                     fits whose time varies between bins
+
+def lqcdjk_bin_workers_info( mpi_info, workerNum, workerType="thread",
+                             dynamic=False ):
+
+    assert workerType in ( "thread", "process" ), \
+        "Worker type " + str( workerType ) + " is not supported."
+
+    if workerType == "process" and workerNum > 1 and mpiInitialized():
+
+        mpiPrint( "WARNING: Bin worker processes cannot be forked "
+                  + "after MPI has been initialized. Using threads "
+                  + "instead.", mpi_info )
+
+        workerType = "thread"
+
+    mpi_info[ 'binWorkerNum' ] = workerNum
+    mpi_info[ 'binWorkerType' ] = workerType
+    mpi_info[ 'dynamicBins' ] = dynamic
+
+
+# Returns True if MPI has been initialized and not finalized in this
+# process
+
+def mpiInitialized():
+
+    return "mpi4py.MPI" in sys.modules \
+        and MPI.Is_initialized() and not MPI.Is_finalized()
+
+
+# Function being run by mapBins() in worker processes. Set before the
+# workers are forked so they do not need to unpickle it.
+
+_binFunc = None
+
+
+def _runBinFunc( b ):
+
+    return _binFunc( b )
+
+
+# Returns [ func( b ) for b in binList ], run in parallel on this 
+# process with the workers set by lqcdjk_bin_workers_info(), or in 
+# serial if none have been set.
+
+# func: Function which takes a global bin index
+# binList: List of global bin indices
+# mpi_info: MPI info dictionary
+
+def mapBins( func, binList, mpi_info ):
+
+    global _binFunc
+
+    workerNum = min( mpi_info.get( 'binWorkerNum', 1 ), len( binList ) )
+    workerType = mpi_info.get( 'binWorkerType', "thread" )
+
+    if workerNum <= 1:
+
+        return [ func( b ) for b in binList ]
+
+    # Processes are not forked once MPI is initialized, even if the MPI
+    # info was made without lqcdjk_bin_workers_info()
+
+    if workerType == "process" \
+       and "fork" in multiprocessing.get_all_start_methods() \
+       and not mpiInitialized():
+
+        # Functions are usually closures which cannot be pickled, so
+        # fork the workers with the function already set
+
+        _binFunc = func
+
+        try:
+
+            ctx = multiprocessing.get_context( "fork" )
+
+            with ProcessPoolExecutor( workerNum, mp_context=ctx ) as executor:
+
+                return list( executor.map( _runBinFunc, binList ) )
+
+        finally:
+
+            _binFunc = None
+
+    with ThreadPoolExecutor( workerNum ) as executor:
+
+        return list( executor.map( func, binList ) )
+
+
+# Runs fit tasks over all bins with each process running the bins in
+# its 'binList_loc', using mapBins(), and gathers the results on every
+# process.
+
+# taskList: List of fit tasks and their number of fit parameters, 
+#           i.e., [ ( task, paramNum ), ... ]. Each task is a function
+#           which takes a global bin index and returns the fit 
+#           parameters and chi^2 for that bin.
+# mpi_info: MPI info dictionary containing bin information from
+#           lqcdjk_mpi_confs_info()
+
+# Returns a list with the fit parameters and chi^2 of each task, 
+# i.e., [ ( fit[ b, param ], chiSq[ b ] ), ... ]
+
+def staticBinTasks( taskList, mpi_info ):
+
+    binNum = mpi_info[ 'binNum_glob' ]
+    binList_loc = mpi_info[ 'binList_loc' ]
+
+    futures = []
+
+    for task, paramNum in taskList:
+
+        fit_loc = [ [] for b in binList_loc ]
+        chiSq_loc = np.zeros( len( binList_loc ) )
+
+        for ( fit_b, chiSq_b ), ib in zip( mapBins( task, binList_loc, 
+                                                    mpi_info ),
+                                           range( len( binList_loc ) ) ):
+
+            fit_loc[ ib ], chiSq_loc[ ib ] = fit_b, chiSq_b
+
+        # The number of fit parameters is given by the task since 
+        # processes without bins could not get it from their fits
+
+        fit_loc = np.array( fit_loc, dtype=float ).reshape( -1, paramNum )
+
+        # Gather while the next task runs
+
+        futures.append( iallgathervBins( [ fit_loc, chiSq_loc ],
+                                         [ ( binNum, paramNum ),
+                                           ( binNum, ) ],
+                                         mpi_info ) )
+
+    return [ tuple( future.wait() ) for future in futures ]
+
+
+# Same as staticBinTasks() but hands out ( task, bin ) pairs 
+# dynamically. The first process only schedules and every other 
+# process asks for a new pair each time it finishes one, so processes
+# with fast fits do more of them. Tasks from several independent fits
+# can be given at once so that they share one queue.
+
+# taskList: List of fit tasks and their number of fit parameters as
+#           in staticBinTasks()
+# mpi_info: MPI info dictionary containing 'binNum_glob'
+
+# Returns a list with the fit parameters and chi^2 of each task, 
+# i.e., [ ( fit[ b, param ], chiSq[ b ] ), ... ]
+
+def dynamicBinTasks( taskList, mpi_info ):
+
+    comm = mpi_info[ 'comm' ]
+    rank = mpi_info[ 'rank' ]
+    procNum = mpi_info[ 'procNum' ]
+    binNum = mpi_info[ 'binNum_glob' ]
+
+    queue = [ ( itask, b ) for itask in range( len( taskList ) )
+              for b in range( binNum ) ]
+
+    # results[ task ][ b ] = ( fit, chiSq )
+
+    results = [ [ None for b in range( binNum ) ] for task in taskList ]
+
+    error = None
+
+    if procNum == 1:
+
+        for itask, b in queue:
+
+            results[ itask ][ b ] = taskList[ itask ][ 0 ]( b )
+
+    elif rank == 0:
+
+        workerNum = procNum - 1
+
+        while workerNum:
+
+            # Receive result of last pair from any process, if it had one,
+            # and send it the next pair, or None if the queue is empty
+
+            source, msg = comm.recv( source=anySource( comm ), tag=0 )
+
+            if msg is not None:
+
+                itask, b, result = msg
+
+                if isinstance( result, Exception ):
+
+                    error = result
+
+                else:
+
+                    results[ itask ][ b ] = result
+
+            if queue and error is None:
+
+                comm.send( queue.pop( 0 ), dest=source, tag=1 )
+
+            else:
+
+                comm.send( None, dest=source, tag=1 )
+
+                workerNum -= 1
+
+    else:
+
+        msg = None
+
+        while True:
+
+            comm.send( ( rank, msg ), dest=0, tag=0 )
+
+            pair = comm.recv( source=0, tag=1 )
+
+            if pair is None:
+
+                break
+
+            itask, b = pair
+
+            try:
+
+                msg = ( itask, b, taskList[ itask ][ 0 ]( b ) )
+
+            except Exception as e:
+
+                msg = ( itask, b, e )
+
+    results, error = comm.bcast( ( results, error ), root=0 )
+
+    if error is not None:
+
+        raise error
+
+    return [ ( np.array( [ r[ 0 ] for r in res ], dtype=float ),
+               np.array( [ r[ 1 ] for r in res ], dtype=float ) )
+             for res in results ]
+
+
+# Runs fit tasks with dynamicBinTasks() if dynamic scheduling was 
+# set by lqcdjk_bin_workers_info() and staticBinTasks() otherwise. 
+# Independent fits should be given together so that they share one
+# schedule.
+
+# taskList: List of fit tasks as in staticBinTasks()
+# mpi_info: MPI info dictionary
+
+# Returns a list with the fit parameters and chi^2 of each task
+
+def binTasks( taskList, mpi_info ):
+
+    if mpi_info.get( 'dynamicBins', False ):
+
+        return dynamicBinTasks( taskList, mpi_info )
+
+    return staticBinTasks( taskList, mpi_info )
+
+
+# Non-blocking version of comm.Allgatherv() over bins for several
+# arrays at once. The local arrays are packed into one contiguous 
+# buffer so that only one collective is needed. Returns a 
+# lqcdjk_CollectiveFuture whose wait() returns a list of the 
+# gathered arrays.
+
+# sendbufList: List of local arrays with local bins in first dimension
+# shapeList: List of shapes of gathered arrays with bins in first 
+#            dimension
+# mpi_info: MPI info dictionary containing 'recvCount' and 'recvOffset'
+#           from lqcdjk_mpi_confs_info()
+
+def iallgathervBins( sendbufList, shapeList, mpi_info ):
+
+    comm = mpi_info[ 'comm' ]
+    binNum = mpi_info[ 'binNum_glob' ]
+    binNum_loc = mpi_info[ 'binNum_loc' ]
+    recvCount = np.asarray( mpi_info[ 'recvCount' ] )
+    recvOffset = np.asarray( mpi_info[ 'recvOffset' ] )
+
+    # Number of elements per bin of each array
+
+    elemNum = [ int( np.prod( shape[ 1: ] ) ) for shape in shapeList ]
+    rowSize = sum( elemNum )
+
+    # sendbuf[ b_loc, elem ]
+
+    sendbuf = np.concatenate( [ np.asarray( buf, 
+                                            dtype=float ).reshape( binNum_loc,
+                                                                   n )
+                                for buf, n in zip( sendbufList, elemNum ) ],
+                              axis=1 )
+
+    recvbuf = np.zeros( ( binNum, rowSize ) )
+
+    request = comm.Iallgatherv( sendbuf,
+                                [ recvbuf,
+                                  recvCount * rowSize,
+                                  recvOffset * rowSize,
+                                  mpiType( comm ) ] )
+
+    def unpack():
+
+        split = np.split( recvbuf, np.cumsum( elemNum )[ :-1 ], axis=1 )
+
+        return [ buf.reshape( shape ) 
+                 for buf, shape in zip( split, shapeList ) ]
+
+    return lqcdjk_CollectiveFuture( request, unpack, sendbuf, recvbuf )
+
+
+# Non-blocking version of comm.Bcast() for several arrays at once. 
+# The arrays are packed into one contiguous buffer so that only one
+# collective is needed. Returns a lqcdjk_CollectiveFuture whose wait()
+# copies the broadcast values into the given arrays and returns them.
+
+# arrays: List of arrays with the same shapes on every process
+# mpi_info: MPI info dictionary containing communicator
+# root (Optional): Rank of process to broadcast from
+
+def ibcastArrays( arrays, mpi_info, root=0 ):
+
+    comm = mpi_info[ 'comm' ]
+
+    buf = np.concatenate( [ np.asarray( a, dtype=float ).reshape( -1 ) 
+                            for a in arrays ] )
+
+    request = comm.Ibcast( [ buf, mpiType( comm ) ], root=root )
+
+    def unpack():
+
+        split = np.split( buf, np.cumsum( [ np.size( a ) 
+                                            for a in arrays ] )[ :-1 ] )
+
+        for a, b in zip( arrays, split ):
+
+            a[ ... ] = b.reshape( np.shape( a ) )
+
+        return arrays
+
+    return lqcdjk_CollectiveFuture( request, unpack, buf )
+
+
+############################
+# Single-node process pool #
+############################
+
+
+# Communicator for processes started by lqcdjk_pool_run() on a single 
+# node without MPI. Supports the subset of the mpi4py communicator
+# interface used by this library, so the same code runs with either.
+# Buffer arguments are given as in mpi4py, e.g., 
+# [ recvbuf, counts, displacements, MPI.DOUBLE ], but the data type is 
+# taken from the arrays. Arrays are exchanged through shared memory 
+# and Python objects through queues.
+
+class lqcdjk_PoolComm:
+    def __init__( self, rank, size, queues, barrier ):
+        self.rank = rank
+        self.size = size
+        # queues[ r ] receives messages sent to process r
+        self.queues = queues
+        self.barrier = barrier
+        # Messages received before they were needed
+        self.stash = []
+        # Number of collectives called so far, used to match messages
+        self.collNum = 0
+
+    def Get_rank( self ):
+        return self.rank
+
+    def Get_size( self ):
+        return self.size
+
+    def Barrier( self ):
+        self.barrier.wait()
+
+    def Abort( self, errorcode=1 ):
+        os._exit( errorcode )
+
+    # Point-to-point
+
+    def send( self, obj, dest, tag=0 ):
+        self.queues[ dest ].put( ( self.rank, "p2p", tag, obj ) )
+
+    def recv( self, source=ANY_SOURCE, tag=ANY_TAG ):
+        # ANY_SOURCE/ANY_TAG or MPI.ANY_SOURCE/MPI.ANY_TAG, which are
+        # negative, match any source/tag
+        if source is not ANY_SOURCE and source < 0:
+            source = ANY_SOURCE
+        if tag is not ANY_TAG and tag < 0:
+            tag = ANY_TAG
+        return self._recv( source, "p2p", tag )[ 3 ]
+
+    def _recv( self, source, kind, key ):
+        def match( msg ):
+            return ( source is None or msg[ 0 ] == source ) \
+                and msg[ 1 ] == kind \
+                and ( key is None or msg[ 2 ] == key )
+        for i, msg in enumerate( self.stash ):
+            if match( msg ):
+                return self.stash.pop( i )
+        while True:
+            msg = self.queues[ self.rank ].get()
+            if match( msg ):
+                return msg
+            self.stash.append( msg )
+
+    # Collectives of Python objects
+
+    def allgather( self, obj ):
+        self.collNum += 1
+        for r in range( self.size ):
+            if r != self.rank:
+                self.queues[ r ].put( ( self.rank, "coll", 
+                                        self.collNum, obj ) )
+        return [ obj if r == self.rank 
+                 else self._recv( r, "coll", self.collNum )[ 3 ]
+                 for r in range( self.size ) ]
+
+    def bcast( self, obj, root=0 ):
+        return self.allgather( obj if self.rank == root else None )[ root ]
+
+    def gather( self, obj, root=0 ):
+        objs = self.allgather( obj )
+        return objs if self.rank == root else None
+
+    # Collectives of arrays
+
+    def Allgatherv( self, sendbuf, recvbuf ):
+        buf, counts, displs = _parseBufferSpec( recvbuf )
+        flat = buf.reshape( -1 )
+        if isInPlace( sendbuf ):
+            sendbuf = flat[ displs[ self.rank ] 
+                            : displs[ self.rank ] + counts[ self.rank ] ]
+        for r, data in enumerate( self._allgatherArrays( sendbuf ) ):
+            flat[ displs[ r ] : displs[ r ] + counts[ r ] ] = data
+        
+    def Gatherv( self, sendbuf, recvbuf, root=0 ):
+        datas = self._allgatherArrays( sendbuf, root )
+        if self.rank == root:
+            buf, counts, displs = _parseBufferSpec( recvbuf )
+            flat = buf.reshape( -1 )
+            for r, data in enumerate( datas ):
+                flat[ displs[ r ] : displs[ r ] + counts[ r ] ] = data
+
+    def Bcast( self, buf, root=0 ):
+        buf = _parseBufferSpec( buf )[ 0 ]
+        data = self._allgatherArrays( buf if self.rank == root 
+                                      else buf[ :0 ] )[ root ]
+        if self.rank != root:
+            buf[ ... ] = data.reshape( buf.shape )
+
+    def Iallgatherv( self, sendbuf, recvbuf ):
+        self.Allgatherv( sendbuf, recvbuf )
+        return lqcdjk_PoolRequest()
+
+    def Ibcast( self, buf, root=0 ):
+        self.Bcast( buf, root=root )
+        return lqcdjk_PoolRequest()
+
+    def _allgatherArrays( self, array, root=None ):
+        # Copy local array into shared memory and share its name.
+        # If root is given, only root copies the other arrays.
+        array = np.ascontiguousarray( array ).reshape( -1 )
+        shm = shared_memory.SharedMemory( create=True,
+                                          size=max( array.nbytes, 1 ) )
+        np.ndarray( array.shape, dtype=array.dtype, 
+                    buffer=shm.buf )[ ... ] = array
+        meta = self.allgather( ( shm.name, array.shape, array.dtype.str ) )
+        datas = []
+        for r, ( name, shape, dtype ) in enumerate( meta ):
+            if r == self.rank:
+                datas.append( array )
+                continue
+            if root is not None and self.rank != root:
+                datas.append( None )
+                continue
+            shm_r = shared_memory.SharedMemory( name=name )
+            datas.append( np.array( np.ndarray( shape, dtype=dtype,
+                                                buffer=shm_r.buf ) ) )
+            shm_r.close()
+        # Wait until every process has copied before freeing
+        self.Barrier()
+        shm.close()
+        shm.unlink()
+        return datas
+
+
+# Completed request returned by the non-blocking collectives of
+# lqcdjk_PoolComm, which complete before returning.
+
+class lqcdjk_PoolRequest:
+    def Wait( self ):
+        return None
+
+    def Test( self ):
+        return True
+
+
+# Returns True if buf is MPI.IN_PLACE. If mpi4py.MPI has not been
+# imported, buf cannot be MPI.IN_PLACE, so it is not imported to check.
+
+def isInPlace( buf ):
+
+    return "mpi4py.MPI" in sys.modules and buf is MPI.IN_PLACE
+
+
+# Returns the buffer, counts and displacements of a buffer 
+# specification in the form used by mpi4py, i.e., buf, [ buf, type ],
+# [ buf, counts, displs, type ] or [ buf, ( counts, displs ), type ].
+# The type is ignored and may be None, e.g., from mpiType().
+
+def _parseBufferSpec( spec ):
+
+    if not isinstance( spec, ( list, tuple ) ):
+
+        return spec, None, None
+
+    if len( spec ) == 4:
+
+        buf, counts, displs = spec[ :3 ]
+
+    elif len( spec ) == 3:
+
+        buf, ( counts, displs ) = spec[ 0 ], spec[ 1 ]
+
+    else:
+
+        return spec[ 0 ], None, None
+
+    return buf, np.asarray( counts, dtype=int ), np.asarray( displs, 
+                                                             dtype=int )
+
+
+def _poolWorker( func, rank, procNum, queues, barrier, results, 
+                 args, kwargs ):
+
+    mpi_info = {}
+
+    mpi_info[ 'comm' ] = lqcdjk_PoolComm( rank, procNum, queues, barrier )
+    mpi_info[ 'procNum' ] = procNum
+    mpi_info[ 'rank' ] = rank
+
+    try:
+
+        results.put( ( rank, None, func( mpi_info, *args, **kwargs ) ) )
+
+    except BaseException as e:
+
+        results.put( ( rank, e, None ) )
+
+
+# Runs func( mpi_info, *args, **kwargs ) on procNum processes of this
+# node, like running a script with mpirun, where mpi_info has the same
+# keys as from lqcdjk_mpi_init() with a lqcdjk_PoolComm as 'comm'. 
+# Returns a list of the return values of each process.
+
+# func: Function to run. Must be picklable if processes are spawned.
+# procNum: Number of processes
+
+def lqcdjk_pool_run( func, procNum, *args, **kwargs ):
+
+    # Processes are forked, which MPI does not support
+
+    assert not mpiInitialized(), \
+        "lqcdjk_pool_run() cannot be used after MPI has been initialized."
+
+    ctx = multiprocessing.get_context()
+
+    # Start the shared memory tracker before starting processes so 
+    # that they share it
+
+    resource_tracker.ensure_running()
+
+    queues = [ ctx.Queue() for r in range( procNum ) ]
+    barrier = ctx.Barrier( procNum )
+    results = ctx.Queue()
+
+    procs = [ ctx.Process( target=_poolWorker,
+                           args=( func, r, procNum, queues, barrier,
+                                  results, args, kwargs ) )
+              for r in range( procNum ) ]
+
+    for p in procs:
+
+        p.start()
+
+    out = [ None for r in range( procNum ) ]
+    resultNum = 0
+    error = None
+
+    try:
+
+        while resultNum < procNum and error is None:
+
+            try:
+
+                rank, error, result = results.get( timeout=1 )
+
+            except Empty:
+
+                # Check for processes which exited without a result, 
+                # e.g., from Abort()
+
+                if any( p.exitcode not in ( None, 0 ) for p in procs ):
+
+                    error = RuntimeError( "Process in pool exited " \
+                                          + "without returning." )
+
+                continue
+
+            out[ rank ] = result
+            resultNum += 1
+
+    finally:
+
+        if error is not None:
+
+            for p in procs:
+
+                p.terminate()
+
+        for p in procs:
+
+            p.join()
+
+    if error is not None:
+
+        raise error
+
+    return out
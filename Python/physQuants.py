@@ -2,7 +2,6 @@ import numpy as np
 import lqcdjk_fitting as fit
 import functions as fncs
 import mpi_functions as mpi_fncs
-from mpi4py import MPI
 
 # E = sqrt( m^2 + p^2 )
 
@@ -858,16 +857,11 @@ def calcFormFactors_SVD( kineFactor_loc, ratio, ratio_err, Qsq_where,
 
     # Set MPI variables
 
-    comm = mpi_info[ 'comm' ]
-
     binNum = mpi_info[ 'binNum_glob' ]
     binNum_loc = mpi_info[ 'binNum_loc' ]
 
     binList_loc = mpi_info[ 'binList_loc' ]
 
-    recvCount = mpi_info[ 'recvCount' ]
-    recvOffset = mpi_info[ 'recvOffset' ]
-
     # Set dimension sizes
 
     qNum = kineFactor_loc.shape[ 2 ]
@@ -881,18 +875,14 @@ def calcFormFactors_SVD( kineFactor_loc, ratio, ratio_err, Qsq_where,
 
     ratio_loc = ratio[ binList_loc ]
 
-    # Gather kinematic factors
+    # Start gathering kinematic factors
     # kineFactor[ b, p, q, r, [ F1, F2 ] ]
 
-    kineFactor = np.zeros( ( binNum, ) + kineFactor_loc.shape[ 1: ] )
-    
-    comm.Allgatherv( kineFactor_loc,
-                     [ kineFactor,
-                       recvCount \
-                       * np.prod( kineFactor_loc.shape[ 1: ] ),
-                       recvOffset \
-                       * np.prod( kineFactor_loc.shape[ 1: ] ),
-                       MPI.DOUBLE ] )
+    kineFactor_future \
+        = mpi_fncs.iallgathervBins( [ kineFactor_loc ],
+                                    [ ( binNum, ) 
+                                      + kineFactor_loc.shape[ 1: ] ],
+                                    mpi_info )
 
     # Repeat error for each bin
 
@@ -903,6 +893,8 @@ def calcFormFactors_SVD( kineFactor_loc, ratio, ratio_err, Qsq_where,
     ratio_err_glob = np.array( [ ratio_err ] * binNum )
     ratio_err_glob = ratio_err_glob.reshape( ratio.shape )
 
+    kineFactor, = kineFactor_future.wait()
+
     # Initialize local form factors
     # F_loc[ b_loc, qs, [ F1, F2 ] ]
 
@@ -0,0 +1,420 @@
+import os
+import cProfile
+import threading
+import numpy as np
+from time import perf_counter
+from functools import wraps
+from contextlib import contextmanager
+from mpi4py import MPI
+import functions as fncs
+import mpi_functions as mpi_fncs
+import readWrite as rw
+import lqcdjk_fitting as fit
+
+# Per-stage and per-rank timing instrumentation. After
+# lqcdjk_profiling_init() is called, the readers in readWrite, the
+# jackknife functions, the fits in lqcdjk_fitting and the collectives
+# are timed on each process, the bytes returned by readers and the
+# number of cost function evaluations are counted, and
+# lqcdjk_profiling_report() prints the minimum, average and maximum
+# of each over processes so that load imbalance and I/O stalls can be
+# seen. Timers are not collected from workers of
+# bin_workers_type="process" since they run in other processes.
+
+# Accumulated timers and counters of this process
+# timers[ ( category, name ) ] = [ seconds, calls ]
+# counters[ ( category, name ) ] = count
+
+timers = {}
+counters = {}
+
+profiler = None
+
+_lock = threading.Lock()
+
+# Depth of nested reader calls on each thread so that bytes are only
+# counted by the outermost reader
+
+_readDepth = threading.local()
+
+# Methods of the communicator which are timed as collectives
+
+collectiveMethodList = [ "Allgather", "Allgatherv", "Allreduce",
+                         "Alltoall", "Alltoallv", "Barrier", "Bcast",
+                         "Gather", "Gatherv", "Reduce", "Scatter",
+                         "Scatterv", "allgather", "allreduce",
+                         "barrier", "bcast", "gather", "reduce",
+                         "scatter" ]
+
+
+# Add elapsed time to a timer
+
+# category: Category of timer, e.g., "read", "jackknife", "fit", or
+#           "collective"
+# name: Name of timer
+# seconds: Elapsed time in seconds
+
+def addTime( category, name, seconds ):
+
+    with _lock:
+
+        timer = timers.setdefault( ( category, name ), [ 0.0, 0 ] )
+
+        timer[ 0 ] += seconds
+        timer[ 1 ] += 1
+
+
+# Add to a counter
+
+# category: Category of counter, e.g., "bytes read" or "evaluations"
+# name: Name of counter
+# count (Optional): Amount to add to counter
+
+def addCount( category, name, count=1 ):
+
+    with _lock:
+
+        counters[ ( category, name ) ] \
+            = counters.get( ( category, name ), 0 ) + count
+
+
+# Context manager which times its block, e.g.,
+#
+# with profiling.timer( "stage", "form factors" ):
+#     ...
+
+# category: Category of timer
+# name: Name of timer
+
+@contextmanager
+def timer( category, name ):
+
+    t0 = perf_counter()
+
+    try:
+
+        yield
+
+    finally:
+
+        addTime( category, name, perf_counter() - t0 )
+
+
+# Total number of bytes in numpy arrays in data, which may be an
+# array or a (nested) tuple or list of arrays
+
+def dataBytes( data ):
+
+    if isinstance( data, np.ndarray ):
+
+        return data.nbytes
+
+    elif isinstance( data, ( tuple, list ) ):
+
+        return sum( dataBytes( d ) for d in data )
+
+    else:
+
+        return 0
+
+
+# Wrap a function so that calls to it are timed
+
+# func: Function to be wrapped
+# category: Category of timer
+# name: Name of timer
+
+def timed( func, category, name ):
+
+    @wraps( func )
+    def wrapper( *args, **kwargs ):
+
+        with timer( category, name ):
+
+            return func( *args, **kwargs )
+
+    return wrapper
+
+
+# Wrap a reader so that calls to it are timed and the bytes of the data
+# it returns are counted if it is not called by another reader
+
+# func: Reader to be wrapped
+# name: Name of timer
+
+def timedReader( func, name ):
+
+    @wraps( func )
+    def wrapper( *args, **kwargs ):
+
+        depth = getattr( _readDepth, "depth", 0 )
+
+        _readDepth.depth = depth + 1
+
+        try:
+
+            with timer( "read", name ):
+
+                data = func( *args, **kwargs )
+
+        finally:
+
+            _readDepth.depth = depth
+
+        if depth == 0:
+
+            addCount( "bytes read", name, dataBytes( data ) )
+
+        return data
+
+    return wrapper
+
+
+# Wrap a cost function so that the number of parameter sets it is
+# evaluated for is counted. Vectorized cost functions evaluate a
+# population with shape [ paramNum, S ] in one call.
+
+# func: Cost function to be wrapped
+# name: Name of counter
+
+def countedCostFunction( func, name ):
+
+    @wraps( func )
+    def wrapper( fitParams, *args, **kwargs ):
+
+        if np.ndim( fitParams ) == 2:
+
+            addCount( "evaluations", name, np.shape( fitParams )[ 1 ] )
+
+        else:
+
+            addCount( "evaluations", name )
+
+        return func( fitParams, *args, **kwargs )
+
+    return wrapper
+
+
+# Replace the functions of a module whose names pass select with
+# wrapped versions. Functions calling each other within the module
+# look them up in the module at call time, so they also use the
+# wrapped versions.
+
+# module: Module whose functions are wrapped
+# select: Function which takes a function name and returns whether
+#         it should be wrapped
+# wrap: Function which takes a function and its name and returns the
+#       wrapped function
+
+def instrumentModule( module, select, wrap ):
+
+    for name, func in list( vars( module ).items() ):
+
+        if callable( func ) and not isinstance( func, type ) \
+           and getattr( func, "__module__", None ) == module.__name__ \
+           and not hasattr( func, "__wrapped__" ) \
+           and select( name ):
+
+            setattr( module, name, wrap( func, name ) )
+
+    # End loop over module attributes
+
+
+# Communicator whose collectives are timed. Since it is an
+# MPI.Intracomm, it can be used anywhere the communicator it wraps is.
+
+class lqcdjk_TimedComm( MPI.Intracomm ):
+
+    pass
+
+
+def _timedMethod( methodName ):
+
+    method = getattr( MPI.Intracomm, methodName )
+
+    def wrapper( self, *args, **kwargs ):
+
+        with timer( "collective", methodName ):
+
+            return method( self, *args, **kwargs )
+
+    wrapper.__name__ = methodName
+
+    return wrapper
+
+
+for methodName in collectiveMethodList:
+
+    setattr( lqcdjk_TimedComm, methodName, _timedMethod( methodName ) )
+
+# End loop over collective methods
+
+
+# Start timing readers, jackknife, fits and collectives. Must be called
+# by every process right after mpi_functions.lqcdjk_mpi_init() and
+# before the communicator is taken from mpi_info.
+
+# mpi_info: MPI info dictionary from mpi_functions.lqcdjk_mpi_init().
+#           Its communicator is replaced by one whose collectives are
+#           timed.
+# profileDir (Optional): If given, cProfile is also run on each process
+#                        and its statistics are written to this
+#                        directory by lqcdjk_profiling_report()
+
+def lqcdjk_profiling_init( mpi_info, profileDir=None ):
+
+    global profiler
+
+    # Readers
+
+    instrumentModule( rw,
+                      lambda name: name.startswith( ( "read", "get" ) ),
+                      timedReader )
+
+    # Jackknife
+
+    instrumentModule( fncs,
+                      lambda name: name.startswith( "jackknife" ),
+                      lambda func, name: timed( func, "jackknife",
+                                                name ) )
+
+    # Fits and their cost functions
+
+    instrumentModule( fit,
+                      lambda name: ( "Fit" in name
+                                     or name.startswith( "fit" ) )
+                      and "Function" not in name,
+                      lambda func, name: timed( func, "fit", name ) )
+
+    instrumentModule( fit,
+                      lambda name: "CostFunction" in name,
+                      countedCostFunction )
+
+    # Collectives
+
+    instrumentModule( mpi_fncs,
+                      lambda name: name in ( "sharedAllgatherv",
+                                             "iallgathervBins",
+                                             "ibcastArrays" ),
+                      lambda func, name: timed( func, "collective",
+                                                name ) )
+
+    future = mpi_fncs.lqcdjk_CollectiveFuture
+
+    if not hasattr( future.wait, "__wrapped__" ):
+
+        future.wait = timed( future.wait, "collective",
+                             "non-blocking collective wait" )
+
+    if isinstance( mpi_info[ 'comm' ], MPI.Intracomm ):
+
+        mpi_info[ 'comm' ] = lqcdjk_TimedComm( mpi_info[ 'comm' ] )
+
+    if profileDir:
+
+        profiler = cProfile.Profile()
+
+        profiler.enable()
+
+
+# Print the timers and counters of all processes, giving the minimum,
+# average and maximum over processes and the ratio of the maximum to
+# the average as a measure of load imbalance. Must be called by every
+# process.
+
+# mpi_info: MPI info dictionary containing communicator
+# profileDir (Optional): Directory to write cProfile statistics of each
+#                        process to as profile_rank<rank>.prof
+# filename (Optional): File to also write report to
+
+def lqcdjk_profiling_report( mpi_info, profileDir=None, filename=None ):
+
+    comm = mpi_info[ 'comm' ]
+    rank = mpi_info[ 'rank' ]
+    procNum = mpi_info[ 'procNum' ]
+
+    if profiler is not None:
+
+        profiler.disable()
+
+        if profileDir:
+
+            os.makedirs( profileDir, exist_ok=True )
+
+            profiler.dump_stats( os.path.join( profileDir,
+                                               "profile_rank{}.prof"\
+                                               .format( rank ) ) )
+
+    with _lock:
+
+        record = ( dict( timers ), dict( counters ) )
+
+    recordList = comm.gather( record, root=0 )
+
+    if rank != 0:
+
+        return
+
+    lines = [ "Timing report over {} processes".format( procNum ), "" ]
+
+    # Timers
+
+    keyList = sorted( set( key for timers_p, _ in recordList
+                           for key in timers_p ) )
+
+    lines.append( "{:<11} {:<40} {:>8} {:>10} {:>10} {:>10} {:>8}"\
+                  .format( "category", "timer", "calls", "min (s)",
+                           "avg (s)", "max (s)", "max/avg" ) )
+
+    for key in keyList:
+
+        seconds = np.array( [ timers_p.get( key, [ 0.0, 0 ] )[ 0 ]
+                              for timers_p, _ in recordList ] )
+        calls = sum( timers_p.get( key, [ 0.0, 0 ] )[ 1 ]
+                     for timers_p, _ in recordList )
+
+        avg = np.average( seconds )
+
+        lines.append( "{:<11} {:<40} {:>8} {:>10.3f} {:>10.3f} {:>10.3f} "\
+                      "{:>8.2f}".format( key[ 0 ], key[ 1 ], calls,
+                                         np.min( seconds ), avg,
+                                         np.max( seconds ),
+                                         np.max( seconds ) / avg
+                                         if avg > 0 else 1.0 ) )
+
+    # End loop over timers
+
+    # Counters
+
+    keyList = sorted( set( key for _, counters_p in recordList
+                           for key in counters_p ) )
+
+    if keyList:
+
+        lines.append( "" )
+
+        lines.append( "{:<11} {:<40} {:>14} {:>14} {:>14} {:>14}"\
+                      .format( "category", "counter", "total", "min",
+                               "avg", "max" ) )
+
+    for key in keyList:
+
+        count = np.array( [ counters_p.get( key, 0 )
+                            for _, counters_p in recordList ] )
+
+        lines.append( "{:<11} {:<40} {:>14} {:>14} {:>14.1f} {:>14}"\
+                      .format( key[ 0 ], key[ 1 ], np.sum( count ),
+                               np.min( count ), np.average( count ),
+                               np.max( count ) ) )
+
+    # End loop over counters
+
+    report = "\n".join( lines )
+
+    print( report )
+
+    if filename:
+
+        with open( filename, "w" ) as outFile:
+
+            outFile.write( report + "\n" )
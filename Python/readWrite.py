@@ -1,11 +1,21 @@
-from time import time
-import h5py
+import os
+import copy
+import hashlib
+import atexit
+import queue
+import threading
+from time import time, strftime
 import numpy as np
 from os import listdir as ls
 from glob import glob
+from itertools import chain
 import functions as fncs
 import mpi_functions as mpi_fncs
-from mpi4py import MPI
+import lazyImport as lazy
+
+# Imported when first used
+
+h5py = lazy.lazyImport( "h5py" )
 
 # Exception thrown there is an error reading an HDF5 dataset
 
@@ -504,6 +514,44 @@ def readMomentumTransferList( corrDir, corrTemplate, configList,
     return Q, QNum, Qsq, QsqNum, Qsq_start, Qsq_end, Qsq_where
 
 
+# Determines the time dimension length of two-point functions from the
+# shape of a dataset without reading the data
+
+# twopDir: Head directory which contains configuration sub-directories
+# twop_template: Two-point function filename template
+# config: Configuration whose file is used
+# dataFormat: Data format of two-point functions
+
+def readTimeDimension( twopDir, twop_template, config, dataFormat ):
+
+    if dataFormat == "ASCII":
+
+        T, dummy \
+            = detTimestepAndConfigNum( twopDir
+                                       + twop_template.replace( "*",
+                                                                config ) )
+
+        return T
+
+    filename = getFileNames( twopDir, [ config ], twop_template )[ 0 ][ 0 ]
+
+    # cpu datasets are arr[ t, q ] and gpu datasets are twop[ t, q, ... ]
+
+    keyword = "arr" if dataFormat == "cpu" else "twop"
+
+    shape = []
+
+    with h5py.File( filename, "r" ) as dataFile:
+
+        dataFile.visititems( lambda name, obj: \
+                             shape.append( obj.shape ) \
+                             if type( obj ) is h5py.Dataset \
+                             and name.split( "/" )[ -1 ] == keyword \
+                             else None )
+
+    return shape[ 0 ][ 0 ]
+
+
 def readTwopFile_zeroQ( twopDir, configList, configNum, twop_template,
                         srcNum, pSq, dataFormat, mpi_info ):
 
@@ -556,7 +604,7 @@ def readTwopFile_zeroQ( twopDir, configList, configNum, twop_template,
                        * np.prod( twop_loc.shape[ 1: ] ),
                        confOffset \
                        * np.prod( twop_loc.shape[ 1: ] ),
-                       MPI.DOUBLE ] )
+                       mpi_fncs.mpiType( comm ) ] )
 
     if pSq > 0:
 
@@ -638,9 +686,9 @@ def readTwopFile( twopDir, twop_template, configList, configNum,
         twop_loc = getTxtData( twopDir,
                                configList,
                                twop_template,
-                               dtype=float).reshape( len( configList ),
-                                                     QNum, T, 6 )[ ...,
-                                                                   4 ]
+                               dtype=float,
+                               usecols=( 4, ) ).reshape( len( configList ),
+                                                         QNum, T )
 
     else:
         
@@ -668,7 +716,7 @@ def readTwopFile( twopDir, twop_template, configList, configNum,
                                  * np.prod( twop_loc.shape[ 1: ] ),
                                  confOffset
                                  * np.prod( twop_loc.shape[ 1: ] ),
-                                 MPI.DOUBLE ] )
+                                 mpi_fncs.mpiType( comm ) ] )
 
     return twop
 
@@ -820,7 +868,7 @@ def getMellinMomentThreep( threepDir, configList, configNum, threep_tokens,
                      [ threep[ 0 ], 
                        configNum_loc_list * np.prod( threep_loc.shape[ 1: ] ),
                        confOffset * np.prod( threep_loc.shape[ 1: ] ),
-                       MPI.DOUBLE ] )
+                       mpi_fncs.mpiType( comm ) ] )
 
     if particle == "kaon":
 
@@ -828,7 +876,7 @@ def getMellinMomentThreep( threepDir, configList, configNum, threep_tokens,
                          [ threep[ 1 ], 
                            configNum_loc_list * np.prod( threep_s_loc.shape[ 1: ] ),
                            confOffset * np.prod( threep_s_loc.shape[ 1: ] ),
-                           MPI.DOUBLE ] )
+                           mpi_fncs.mpiType( comm ) ] )
 
     return threep
 
@@ -2354,7 +2402,7 @@ def readEMFile( threepDir, configList, configNum, threep_tokens, srcNum,
                      [ threep[ 0 ],
                        configNum_loc_list * np.prod( threep_loc.shape[ 1: ] ),
                        confOffset * np.prod( threep_loc.shape[ 1: ] ), 
-                       MPI.DOUBLE ] )
+                       mpi_fncs.mpiType( comm ) ] )
 
     if particle == "kaon":
 
@@ -2371,7 +2419,7 @@ def readEMFile( threepDir, configList, configNum, threep_tokens, srcNum,
                            * np.prod( threep_s_loc.shape[ 1: ] ),
                            confOffset \
                            * np.prod( threep_s_loc.shape[ 1: ] ),
-                           MPI.DOUBLE ] )
+                           mpi_fncs.mpiType( comm ) ] )
 
     return threep
 
@@ -2462,7 +2510,7 @@ def readFormFactorFile( threepDir, threep_tokens, formFactor,
                                      * np.prod( threep_loc.shape[ 1: ] ),
                                      mpi_info[ 'confOffset' ]
                                      * np.prod( threep_loc.shape[ 1: ] ),
-                                     MPI.DOUBLE ] )
+                                     mpi_fncs.mpiType( mpi_info[ 'comm' ] ) ] )
 
     return threep
 
@@ -2658,7 +2706,8 @@ def readEMFF_ASCII( threepDir, threep_template,
     # threep[ conf, QNum*t*curr ]
     
     threep = getTxtData( threepDir, configList,
-                         threep_template, dtype=float )[ ..., 4:6 ]
+                         threep_template, dtype=float,
+                         usecols=( 4, 5 ) )
 
     if "comm" in kwargs:
 
@@ -3399,11 +3448,54 @@ def readFormFactorFile_A40_B40_C40( threepDir, threep_tokens, srcNum,
 ########################
 
 
+# The ASCII read functions also read outputs of results files given as
+# <results file>.h5/<name> (see readResultsColumns()).
+
+
+# Binary cache of parsed ASCII files. While a cache directory is set
+# by lqcdjk_txt_cache_init(), numeric ASCII files are parsed once and
+# saved as .npy files, which later reads memory map instead of parsing.
+# Cache files are named after the file's path, modification time,
+# size, the dtype, and the columns read, so changed files are parsed
+# again.
+
+txt_cache_info = {}
+
+
+# Sets the directory of the binary cache of ASCII files
+
+# cacheDir: Directory to write cache files to
+
+def lqcdjk_txt_cache_init( cacheDir ):
+
+    os.makedirs( cacheDir, exist_ok=True )
+
+    txt_cache_info[ 'dir' ] = cacheDir
+
+
+# Name of the cache file of an ASCII file
+
+# filename: Name of ASCII file
+# dtype: numpy dtype the file is parsed as
+# usecols: Columns read, or None for all
+
+def txtCacheFilename( filename, dtype, usecols ):
+
+    stat = os.stat( filename )
+
+    key = "{}:{}:{}:{}:{}".format( os.path.abspath( filename ),
+                                   stat.st_mtime_ns, stat.st_size,
+                                   dtype.str, usecols )
+
+    return os.path.join( txt_cache_info[ 'dir' ],
+                         hashlib.sha1( key.encode() ).hexdigest() + ".npy" )
+
+
 def getTxtData( configDir, configList, fn_template, **kwargs ):
 
     configNum = len( configList )
 
-    data = fncs.initEmptyList( configNum, 1 )
+    data = None
 
     # Loop over config indices
     for c in range( configNum ):
@@ -3412,30 +3504,79 @@ def getTxtData( configDir, configList, fn_template, **kwargs ):
 
         # Get data
 
-        data[ c ] = readTxtFile( filename, **kwargs )
+        data_c = readTxtFile( filename, **kwargs )
+
+        # Shape of all configurations is set by the first
+
+        if data is None:
+
+            data = np.empty( ( configNum, ) + data_c.shape,
+                             dtype=data_c.dtype )
+
+        data[ c ] = data_c
 
     # End loop over configs
 
-    return np.array( data )
+    return data
 
 
-def readTxtFile( filename, **kwargs ):
+# Reads an ASCII file of columns into an array data[ line, column ].
+# Numeric files are parsed in one pass by numpy's C parser and, if a
+# cache directory is set, cached.
 
-    with open( filename, "r" ) as txtFile:
+# filename: Name of file to be read, or <results file>.h5/<name>
+# dtype (Optional): dtype of data. If not given, data are strings.
+# usecols (Optional): Sequence of columns to read. Defaults to all.
 
-        lines = txtFile.readlines()
+def readTxtFile( filename, dtype=None, usecols=None ):
 
-        lineNum = len( lines )
+    resultsFilename, name = splitResultsFilename( filename )
 
-        columnNum = len( lines[0].split() )
+    if resultsFilename:
 
-        # Go back to beginning of file
-        
-        txtFile.seek( 0 )
+        data = np.array( readResultsColumns( resultsFilename, name ),
+                         dtype=dtype )
+
+        return data if usecols is None else data[ :, list( usecols ) ]
+
+    if dtype is None or np.dtype( dtype ).kind not in "biuf":
+
+        with open( filename, "r" ) as txtFile:
+
+            text = txtFile.read()
+
+        columnNum = len( text.split( "\n", 1 )[ 0 ].split() )
+
+        data = np.array( text.split(), dtype=dtype ).reshape( -1, columnNum )
+
+        return data if usecols is None else data[ :, list( usecols ) ]
+
+    dtype = np.dtype( dtype )
 
-        data = np.array( txtFile.read().split(), \
-                         **kwargs ).reshape( lineNum, \
-                                             columnNum )
+    if usecols is not None:
+
+        usecols = tuple( usecols )
+
+    if 'dir' in txt_cache_info:
+
+        cacheFilename = txtCacheFilename( filename, dtype, usecols )
+
+        if os.path.isfile( cacheFilename ):
+
+            return np.load( cacheFilename, mmap_mode="r" )
+
+    data = np.loadtxt( filename, dtype=dtype, usecols=usecols, ndmin=2 )
+
+    if 'dir' in txt_cache_info:
+
+        # Write to a temporary file first so that other processes
+        # never read a partial cache file
+
+        tmpFilename = "{}.{}.tmp.npy".format( cacheFilename, os.getpid() )
+
+        np.save( tmpFilename, data )
+
+        os.replace( tmpFilename, cacheFilename )
 
     return data
 
@@ -3445,7 +3586,7 @@ def readTxtFile( filename, **kwargs ):
 # over d1 and then d0. Data is stored in an array with 
 # shape ( d0, d1 ).
 
-# filename: Name of data file to be read
+# filename: Name of data file to be read, or <results file>.h5/<name>
 # d0: Last dimension data is repeated over, 
 #     to be first dimension in output
 # d1: First dimension data is repeated over,
@@ -3453,35 +3594,24 @@ def readTxtFile( filename, **kwargs ):
 
 def readDataFile( filename, d0, d1 ):
 
-    with open( filename, "r" ) as file:
-
-        data = np.array( file.read().split(), dtype=float )
-
-    data = data.reshape( d0, d1, 2  )
+    data = readTxtFile( filename, dtype=float ).reshape( d0, d1, 2 )
 
     return data[ ..., -1 ]
 
 
 # Reads the Nth column of an ASCII data file.
 
-# filename: Name of data file to be read
+# filename: Name of data file to be read, or <results file>.h5/<name>
+#           to read the output of a results file as its ASCII file
 # N: Column number to be read (counting starts at 0)
 
 def readNthDataCol( filename, N ):
 
-    data = []
-
-    with open( filename, "r" ) as file:
-
-        for line in file:
-
-            if line.split():
-
-                data.append( line.split() )
+    if N < 0:
 
-    data = np.array( data, dtype=float )
+        return readTxtFile( filename, dtype=float )[ ..., N ]
 
-    return data[ ..., N ]
+    return readTxtFile( filename, dtype=float, usecols=( N, ) )[ ..., 0 ]
 
 
 # Reads and ASCII file of form factor data 
@@ -3522,72 +3652,58 @@ def readFormFactorFile_ASCII( filename, binNum ):
 
 def detTimestepAndConfigNum( filename ):
 
-    t_last = -1
-
-    timestepNum = 0
-
-    timestepNum_last = -1
-
-    configNum = 0
-
-    # Open file
-    with open( filename, "r" ) as file:
-        # Loop over lines
-        for line in file:
+    # First column as integers
 
-            # Get first column
+    t = readTxtFile( filename, dtype=float,
+                     usecols=( 0, ) )[ :, 0 ].astype( int )
 
-            t = int( line.split()[ 0 ] )
+    lineNum = len( t )
 
-            # If next timestep
+    # Lines which continue the timesteps of the last line and lines
+    # where timesteps start over
 
-            if t == ( t_last + 1 ):
+    t_last = np.concatenate( ( [ -1 ], t[ :-1 ] ) )
 
-                timestepNum += 1
+    nextTimestep = t == t_last + 1
+    restart = ~nextTimestep & ( t == 0 )
 
-                t_last = t
+    # First line with unsupported behaviour
 
-            # Else if timesteps have started over
+    bad = np.flatnonzero( ~nextTimestep & ~restart )
 
-            elif t == 0:
+    badLine = bad[ 0 ] if len( bad ) else lineNum
 
-                # If this is not first time counting timestepNum
+    start = np.flatnonzero( restart[ :badLine ] )
 
-                if timestepNum_last >= 0:
+    # Number of timesteps counted before each restart
 
-                    assert timestepNum == timestepNum_last, \
-                        "Error (detTimestepAndConfigNum): " \
-                        + "Number of timesteps not" \
-                        + " consistent across configurations"
-                    
-                timestepNum_last = timestepNum
-
-                timestepNum = 1
+    timestepNum = np.diff( np.concatenate( ( [ 0 ], start ) ) )
 
-                configNum += 1
+    if len( timestepNum ) > 1:
 
-                t_last = t
+        assert np.all( timestepNum[ 1: ] == timestepNum[ 0 ] ), \
+            "Error (detTimestepAndConfigNum): " \
+            + "Number of timesteps not" \
+            + " consistent across configurations"
 
-            # Else unsupported behaviour
+    if len( bad ):
 
-            else:
+        print( "Error (detTimestepAndConfigNum): " \
+               + "Timestep in 1st column " \
+               + "does not behave as expected" )
 
-                print( "Error (detTimestepAndConfigNum): " \
-                       + "Timestep in 1st column " \
-                    + "does not behave as expected" )
+        return -1
 
-                return -1
+    timestepNum_last = timestepNum[ -1 ] if len( timestepNum ) else -1
 
-            # End if
-        # End loop over lines
-    # Close file
+    timestepNum = lineNum - int( start[ -1 ] if len( start ) else 0 )
 
     assert timestepNum == timestepNum_last, \
         "Error (detTimestepAndConfigNum): " \
         + "Number of timesteps not" \
         + " consistent across configurations"
                     
-    configNum += 1
+    configNum = len( start ) + 1
 
     return timestepNum, configNum
 
@@ -3602,88 +3718,94 @@ def detTimestepAndConfigNum( filename ):
 
 def detQsqConfigNumAndTimestepNum( filename ):
 
-    t_last = -1
+    # First two columns as integers
 
-    q_last = 0
-    
-    # We can set the 1st Qsq to zero because we will
-    # check that it is equal to q_last
+    tq = readTxtFile( filename, dtype=float,
+                      usecols=( 0, 1 ) ).astype( int )
 
-    Qsq = [ 0 ] 
+    t = tq[ :, 0 ]
+    q = tq[ :, 1 ]
 
-    configNum = 0
+    lineNum = len( t )
 
-    configNum_last = -1
+    # Lines which are the next timestep of the same Q^2 as the last
+    # line and lines where timesteps start over. Only lines where
+    # timesteps start over change the counts, so the loop below is
+    # over those lines.
 
-    timestepNum = 0
+    t_last = np.concatenate( ( [ -1 ], t[ :-1 ] ) )
+    q_last = np.concatenate( ( [ 0 ], q[ :-1 ] ) )
 
-    timestepNum_last = -1
+    nextTimestep = ( t == t_last + 1 ) & ( q == q_last )
+    restart = ~nextTimestep & ( t == 0 )
 
-    with open( filename, "r" ) as file:
+    bad = np.flatnonzero( ~nextTimestep & ~restart )
 
-        for line in file:
+    badLine = bad[ 0 ] if len( bad ) else lineNum
 
-            t = int( line.split()[ 0 ] )
+    # We can set the 1st Qsq to zero because we will
+    # check that it is equal to q_last
 
-            q = int( line.split()[ 1 ] )
+    Qsq = [ 0 ] 
 
-            # If next timestep and Q^2 is the same as last
+    configNum = 0
 
-            if t == ( t_last + 1 ) and q == q_last:
+    configNum_last = -1
 
-                timestepNum += 1
+    timestepNum_last = -1
 
-            # Else if timesteps have started over
+    lastStart = 0
 
-            elif t == 0:
+    # Loop over lines where timesteps start over
+    for line in np.flatnonzero( restart[ :badLine ] ):
 
-                # If this is not the first time counting timestep number
+        timestepNum = int( line ) - lastStart
 
-                if timestepNum_last >= 0:
+        # If this is not the first time counting timestep number
 
-                    assert timestepNum == timestepNum_last, \
-                        "Error (detQsqConfigNumAndTimestepNum): " \
-                        + "Number of timesteps is not " \
-                        + "consistent across configurations"
-                    
-                timestepNum_last = timestepNum
+        if timestepNum_last >= 0:
 
-                timestepNum = 1
+            assert timestepNum == timestepNum_last, \
+                "Error (detQsqConfigNumAndTimestepNum): " \
+                + "Number of timesteps is not " \
+                + "consistent across configurations"
+                    
+        timestepNum_last = timestepNum
 
-                configNum += 1
+        lastStart = int( line )
 
-                # If next Q^2
+        configNum += 1
 
-                if q > q_last:
+        # If next Q^2
 
-                    # If this in not the first time counting Q^2 number
+        if q[ line ] > q_last[ line ]:
 
-                    if configNum_last >= 0:
+            # If this in not the first time counting Q^2 number
 
-                        assert configNum == configNum_last, \
-                            "Error (detQsqConfigNumAndTimestepNum): "\
-                            + "Number of configurations is not " \
-                            + "consistent across Qsq's"
+            if configNum_last >= 0:
 
-                    configNum_last = configNum
+                assert configNum == configNum_last, \
+                    "Error (detQsqConfigNumAndTimestepNum): "\
+                    + "Number of configurations is not " \
+                    + "consistent across Qsq's"
 
-                    configNum = 0
+            configNum_last = configNum
 
-                    Qsq.append( q )
+            configNum = 0
 
-            # Else unsupported behaviour
+            Qsq.append( int( q[ line ] ) )
 
-            else:
+    # End loop over lines
 
-                print( "Error (detTimestepAndConfigNum): " \
-                       + "Timestep in 1st column " \
-                       + "does not behave as expected" )
+    if len( bad ):
 
-                return -1
+        print( "Error (detTimestepAndConfigNum): " \
+               + "Timestep in 1st column " \
+               + "does not behave as expected" )
 
-            t_last = t
+        return -1
 
-            q_last = q
+    timestepNum = lineNum - lastStart
 
     assert timestepNum == timestepNum_last, \
         "Error (detTimestepAndConfigNum): Number of timesteps not" \
@@ -3703,6 +3825,40 @@ def detQsqConfigNumAndTimestepNum( filename ):
 ###################
 
 
+# Writes rows of an ASCII file from columns of values. Rows are
+# formatted a block at a time with one format call per block, which
+# gives the same text as formatting each row with template.
+
+# output: Open file to be written to
+# template: Format string of one row
+# columns: List of 1-D arrays or lists of equal length, one for each
+#          replacement field of template
+# blockSize (Optional): Number of rows formatted at once
+
+def writeColumns( output, template, columns, blockSize=4096 ):
+
+    rowNum = len( columns[ 0 ] )
+
+    # Python floats and ints format the same as 64-bit numpy scalars
+    # and much faster. Other types are kept as numpy scalars, e.g.,
+    # float32 values, whose str() differs from that of Python floats.
+
+    columns = [ col.tolist() if isinstance( col, np.ndarray )
+                and col.dtype in ( np.float64, np.int64 ) else col
+                for col in columns ]
+
+    # Loop over blocks of rows
+    for start in range( 0, rowNum, blockSize ):
+
+        block = [ col[ start : start + blockSize ] for col in columns ]
+
+        values = list( chain.from_iterable( zip( *block ) ) )
+
+        output.write( ( template * len( block[ 0 ] ) ).format( *values ) )
+
+    # End loop over blocks
+
+
 # Writes an ASCII file with two columns and two repeating dimensions.
 # The first column is the first repeating dimension and the second is
 # the data.
@@ -3719,14 +3875,14 @@ def writeDataFile( filename, data ):
 
         return -1
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeDataFile", filename, data=data ):
 
-        for d0 in range( len( data ) ):
+        return
 
-            for d1 in range( len( data[ d0 ] ) ):
-                
-                output.write( "{:<5d}{:<20.15}\n".format( d1, \
-                                                          data[ d0, d1 ] ) )
+    with open( filename, "w" ) as output:
+
+        writeColumns( output, "{:<5d}{:<20.15}\n",
+                      resultsColumnFunctions[ "writeDataFile" ]( data ) )
 
     print( "Wrote " + filename )
 
@@ -3740,51 +3896,35 @@ def writeDataFile_wX( filename, x, data ):
 
         return -1
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeDataFile_wX", filename, x=x, data=data ):
 
-        for d0 in range( len( data ) ):
+        return
 
-            if np.array_equal( x.shape, data.shape ):
+    if np.array_equal( x.shape, data.shape ):
 
-                for d1 in range( len( data[ d0 ] ) ):
-                
-                    if x.dtype == int:
+        if x.dtype == int:
 
-                        template = "{:<5d}{:<20.15}\n"
-                        
-                    else:
-                    
-                        template = "{:<20.15f}{:<20.15f}\n"
+            template = "{:<5d}{:<20.15}\n"
 
-                    output.write( template.format( x[ d0, d1 ],
-                                                   data[ d0, d1 ] ) )
+        else:
 
-            elif x.ndim == 2:
+            template = "{:<20.15f}{:<20.15f}\n"
 
-                for d1 in range( len( data[ d0 ] ) ):
-                
-                    template = "{:<+5}{:<+5}{:<+5}{:<20.15}\n"
+    elif x.ndim == 2:
 
-                    output.write( template.format( x[ d1, 0 ],
-                                                   x[ d1, 1 ],
-                                                   x[ d1, 2 ],
-                                                   data[ d0, d1 ] ) )
+        template = "{:<+5}{:<+5}{:<+5}{:<20.15}\n"
 
-            else:
-            
-                for d1 in range( len( data[ d0 ] ) ):
-                        
-                    if x.dtype == int:
+    elif x.dtype == int:
 
-                        template = "{:<5d}{:<20.15}\n"
-                        
-                    else:
-                    
-                        template = "{:<20.10f}{:<20.15}\n"
-                        
-                    output.write( template.format( x[ d1 ],
-                                                   data[ d0, d1 ] ) )
+        template = "{:<5d}{:<20.15}\n"
 
+    else:
+
+        template = "{:<20.10f}{:<20.15}\n"
+
+    with open( filename, "w" ) as output:
+
+        writeColumns( output, template, columns_wX( x, data ) )
 
     print( "Wrote " + filename )
 
@@ -3813,13 +3953,15 @@ def writeAvgDataFile( filename, data, error ):
         
         return -1
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeAvgDataFile", filename,
+                      data=data, error=error ):
 
-        for d0 in range( len( data ) ):
+        return
 
-            output.write( "{:<5d}{:<25.15}{:<25.15}\n".format(d0, \
-                                                              data[ d0 ], \
-                                                              error[ d0 ]) )
+    with open( filename, "w" ) as output:
+
+        writeColumns( output, "{:<5d}{:<25.15}{:<25.15}\n",
+                      [ range( len( data ) ), data, error ] )
 
     print( "Wrote " + filename )
 
@@ -3845,43 +3987,34 @@ def writeAvgDataFile_wX( filename, x, y, error ):
         "Error (writeAvgDataFile_wX): x array's length and " \
         + "shape does not match data array's" 
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeAvgDataFile_wX", filename,
+                      x=x, y=y, error=error ):
 
-        if x.ndim == 2:
+        return
 
-            for ix, iy, ierr in zip( x, y, error ):
+    if x.ndim == 2:
 
-                x_str = " ".join( "{:>2}".format( xx ) for xx in ix )
+        # Join the components of each x into one column
 
-                output.write( "{:<10}{:<20.10f}{:.10f}\n".format( x_str,
-                                                                  iy,
-                                                                  ierr) )
-            
-        elif x.dtype == int:
-            
-            for ix, iy, ierr in zip( x, y, error ):
+        x = [ " ".join( "{:>2}".format( xx ) for xx in ix ) for ix in x ]
 
-                output.write( "{:<20d}{:<20.10f}{:.10f}\n".format( ix,
-                                                                   iy,
-                                                                   ierr) )
+        template = "{:<10}{:<20.10f}{:.10f}\n"
 
-        elif x.dtype == '<U6':
+    elif x.dtype == int:
 
-            for ix, iy, ierr in zip( x, y, error ):
+        template = "{:<20d}{:<20.10f}{:.10f}\n"
 
-                output.write( "{:<20}{:<20.10f}{:.10f}\n".format( ix,
-                                                                  iy,
-                                                                  ierr) )
+    elif x.dtype == '<U6':
 
-        else: # Default: treat x as float
+        template = "{:<20}{:<20.10f}{:.10f}\n"
 
-            for ix, iy, ierr in zip( x, y, error ):
+    else: # Default: treat x as float
 
-                output.write( "{:<20.10f}{:<20.10f}{:.10f}\n".format( ix,
-                                                                      iy,
-                                                                      ierr) )
+        template = "{:<20.10f}{:<20.10f}{:.10f}\n"
 
-        
+    with open( filename, "w" ) as output:
+
+        writeColumns( output, template, [ x, y, error ] )
 
     print( "Wrote " + filename )
 
@@ -3904,17 +4037,22 @@ def write2ValueDataFile( filename, data0, data1 ):
 
         return -1
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "write2ValueDataFile", filename,
+                      data0=data0, data1=data1 ):
 
-        for d0, d1 in zip( data0, data1 ):
+        return
 
-            if d0.dtype == int:
+    if data0.dtype == int:
 
-                output.write( "{:<5}{:<25.15}\n".format( d0, d1 ) )
+        template = "{:<5}{:<25.15}\n"
 
-            else:
+    else:
+
+        template = "{:<25.15}{:<25.15}\n"
+
+    with open( filename, "w" ) as output:
 
-                output.write( "{:<25.15}{:<25.15}\n".format( d0, d1 ) )
+        writeColumns( output, template, [ data0, data1 ] )
 
     print( "Wrote " + filename )
 
@@ -3926,13 +4064,13 @@ def writeMomentumList( filename, p_list ):
     assert p_list.ndim == 2, "Error (writeAvgDataFile_wX): Data array " \
         + "has more than two dimensions"
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeMomentumList", filename, p_list=p_list ):
+
+        return
 
-        for p in p_list:
+    with open( filename, "w" ) as output:
 
-            output.write( "{:<+5}{:<+5}{:<+}\n".format( p[ 0 ],
-                                                        p[ 1 ],
-                                                        p[ 2 ] ) )
+        writeColumns( output, "{:<+5}{:<+5}{:<+}\n", list( p_list.T ) )
 
     print( "Wrote " + filename )
 
@@ -3951,17 +4089,15 @@ def writeFormFactorFile( filename, Qsq, data ):
     assert data.ndim == 3, "Error (writeFormFactorFile): " \
         + "Data array does not have three dimensions"
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeFormFactorFile", filename, Qsq=Qsq, data=data ):
 
-        for q in range( data.shape[ 0 ] ):
+        return
 
-            for b in range( data.shape[ 1 ] ):
-                
-                for t in range( data.shape[ 2 ] ):
+    with open( filename, "w" ) as output:
 
-                    output.write( str( t ).ljust(20) \
-                                  + str( Qsq[ q ] ).ljust(20) \
-                                  + str( data[ q, b, t ] ) + "\n" )
+        writeColumns( output, "{!s:<20}{!s:<20}{!s}\n",
+                      resultsColumnFunctions[ "writeFormFactorFile" ]( Qsq,
+                                                                       data ) )
 
     print( "Wrote " + filename )
 
@@ -3977,30 +4113,40 @@ def writeFormFactorFile( filename, Qsq, data ):
 
 def writeSVDOutputFile( filename, data, Qsq ):
 
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeSVDOutputFile", filename, data=data, Qsq=Qsq ):
 
-        for q in range( len( data ) ):
+        return
 
-            for r in range( data[ q ].shape[ 0 ] ):
+    # Row number, Q^2 or components of Q, and data pairs of each row
 
-                if Qsq.ndim > 1:
+    r = np.concatenate( [ np.arange( data[ q ].shape[ 0 ] )
+                          for q in range( len( data ) ) ]
+                        + [ np.zeros( 0, dtype=int ) ] )
 
-                    template = "{:<10}{:<+5}{:<+5}{:<+5}{:<20.10}{:<.10}\n"
+    Qsq_rows = np.concatenate( [ np.repeat( Qsq[ q : q + 1 ],
+                                            data[ q ].shape[ 0 ], axis=0 )
+                                 for q in range( len( data ) ) ]
+                               + [ Qsq[ : 0 ] ] )
 
-                    output.write( template.format( r,
-                                                   Qsq[ q, 0 ],
-                                                   Qsq[ q, 1 ],
-                                                   Qsq[ q, 2 ],
-                                                   data[ q ][ r, 0 ],
-                                                   data[ q ][ r, 1 ] ) )
+    data_rows = np.concatenate( [ data[ q ] for q in range( len( data ) ) ] ) \
+                if len( data ) else np.zeros( ( 0, 2 ) )
 
-                else:
+    if Qsq.ndim > 1:
+
+        template = "{:<10}{:<+5}{:<+5}{:<+5}{:<20.10}{:<.10}\n"
+
+        columns = [ r ] + list( Qsq_rows[ :, :3 ].T ) \
+                  + [ data_rows[ :, 0 ], data_rows[ :, 1 ] ]
+
+    else:
 
-                    template = "{:<10}{:<10}{:<20.10}{:<.10}\n"
+        template = "{:<10}{:<10}{:<20.10}{:<.10}\n"
 
-                    output.write( template.format( r, Qsq[ q ],
-                                                   data[ q ][ r, 0 ],
-                                                   data[ q ][ r, 1 ] ) )
+        columns = [ r, Qsq_rows, data_rows[ :, 0 ], data_rows[ :, 1 ] ]
+
+    with open( filename, "w" ) as output:
+
+        writeColumns( output, template, columns )
 
     print( "Wrote " + filename )
 
@@ -4024,16 +4170,16 @@ def writeAvgFormFactorFile( filename, Qsq, data, error ):
     assert data.shape == error.shape, "Error (writeAvgFormFactorFile): " \
         + "Error array's shape does not match data array's"
         
-    with open( filename, "w" ) as output:
+    if redirectWrite( "writeAvgFormFactorFile", filename,
+                      Qsq=Qsq, data=data, error=error ):
 
-        for q in range( data.shape[ 0 ] ):
+        return
 
-            for t in range( data.shape[ 1 ] ):
+    with open( filename, "w" ) as output:
 
-                output.write( str( t ).ljust(5) 
-                              + str( Qsq[ q ] ).ljust(10) 
-                              + str( data[ q, t ] ).ljust(20) 
-                              + str( error[ q, t ] ) + "\n" )
+        writeColumns( output, "{!s:<5}{!s:<10}{!s:<20}{!s}\n",
+                      resultsColumnFunctions[ "writeAvgFormFactorFile" ]\
+                      ( Qsq, data, error ) )
 
     print( "Wrote " + filename )
 
@@ -4050,6 +4196,11 @@ def writeAvgFormFactorFile( filename, Qsq, data, error ):
 
 def writeFitDataFile( filename, fit, err, fitStart, fitEnd ):
 
+    if redirectWrite( "writeFitDataFile", filename, fit=fit, err=err,
+                     fitStart=fitStart, fitEnd=fitEnd ):
+
+        return
+
     with open( filename, "w" ) as output:
 
         output.write( str( fit ).ljust( 20 ) 
@@ -4076,6 +4227,11 @@ def writeTSFParamsFile( filename, params, params_err ):
         "Error (writeTwoStateFitParams): " \
         + "number of parameters and number of parameter errors do not match."
 
+    if redirectWrite( "writeTSFParamsFile", filename, params=params,
+                     params_err=params_err ):
+
+        return
+
     with open( filename, "w" ) as output:
 
         # A00
@@ -4117,6 +4273,11 @@ def writeTSFParamsFile( filename, params, params_err ):
 
 def writeDipoleFitParamsFile( filename, params, params_err, rSq, rSq_err ):
 
+    if redirectWrite( "writeDipoleFitParamsFile", filename, params=params,
+                     params_err=params_err, rSq=rSq, rSq_err=rSq_err ):
+
+        return
+
     with open( filename, "w" ) as output:
 
         template = "{:<10}{:<20.10}{:<20.10}\n"
@@ -4141,6 +4302,11 @@ def writePDFParamsFile( filename, params, params_err ):
         "Error (readWrite.writePDFParamsFile): " \
         + "number of parameters and number of parameter errors do not match."
 
+    if redirectWrite( "writePDFParamsFile", filename, params=params,
+                     params_err=params_err ):
+
+        return
+
     with open( filename, "w" ) as output:
 
         # a
@@ -4176,6 +4342,11 @@ def writeTSFParamsFile_twop( filename, params, params_err ):
         "Error (writeTwoStateFitParams): " \
         + "number of parameters and number of parameter errors do not match."
 
+    if redirectWrite( "writeTSFParamsFile_twop", filename, params=params,
+                     params_err=params_err ):
+
+        return
+
     with open( filename, "w" ) as output:
 
         # c0
@@ -4200,3 +4371,546 @@ def writeTSFParamsFile_twop( filename, params, params_err ):
 
     print( "Wrote " + filename )
 
+
+
+##########################
+# Results file functions #
+##########################
+
+
+# A results file is a single HDF5 file holding everything a run writes.
+# While a results file is set by lqcdjk_results_init(), the write*File
+# functions above store their arguments in a group of the results file,
+# named after the part of the filename which replaced '*' in the output
+# template, instead of writing an ASCII file. The ASCII files can be
+# exported from the results file afterwards with exportResultsASCII().
+
+results_info = {}
+
+
+# Creates a results file and sets it as the destination of the write
+# functions. Should only be called by the process which writes output.
+
+# filename: Name of results file
+# output_template: Template for output files with '*' for the name of
+#                  each output
+# metadata (Optional): Dictionary of run information to be stored as
+#                      attributes of the results file
+# append (Optional): Keep the output already in the results file, e.g.,
+#                    when resuming a run from a checkpoint
+
+def lqcdjk_results_init( filename, output_template, metadata={},
+                         append=False ):
+
+    with h5py.File( filename, "a" if append else "w" ) as resultsFile:
+
+        resultsFile.attrs[ "date" ] = strftime( "%Y-%m-%d %H:%M:%S" )
+        resultsFile.attrs[ "output_template" ] = output_template
+
+        for key, value in metadata.items():
+
+            if value is None:
+
+                continue
+
+            if not isinstance( value, ( int, float, np.number ) ):
+
+                value = str( value )
+
+            resultsFile.attrs[ key ] = value
+
+        # End loop over metadata
+
+    results_info[ 'filename' ] = filename
+
+    if "*" in output_template:
+
+        results_info[ 'prefix' ], results_info[ 'suffix' ] \
+            = output_template.split( "*", 1 )
+
+    else:
+
+        results_info[ 'prefix' ] = results_info[ 'suffix' ] = ""
+
+    print( "Writing results to " + filename )
+
+
+# Name of the results file of a run made from the output template with
+# its file extension replaced by .h5
+
+# output_template: Template for output files
+# specTemplate: Template for the part of the name which replaces '*'
+# args: Values to format specTemplate with
+
+def makeResultsFilename( output_template, specTemplate, *args ):
+
+    return os.path.splitext( makeFilename( output_template, specTemplate,
+                                           *args ) )[ 0 ] + ".h5"
+
+
+# Stops storing output in the results file and optionally exports
+# its contents as ASCII files
+
+# asciiExport (Optional): If True, write the ASCII file of every
+#                         output in the results file
+# output_template (Optional): Template for ASCII files. Defaults to
+#                             the filenames given when writing.
+
+def lqcdjk_results_finalize( asciiExport=False, output_template=None ):
+
+    # Finish queued writes to the results file
+
+    lqcdjk_write_queue_finalize()
+
+    if 'filename' not in results_info:
+
+        return
+
+    filename = results_info[ 'filename' ]
+
+    results_info.clear()
+
+    if asciiExport:
+
+        exportResultsASCII( filename, output_template )
+
+
+# Name of the results file group of an output file
+
+# filename: Name of output file
+
+def resultsName( filename ):
+
+    prefix = results_info[ 'prefix' ]
+    suffix = results_info[ 'suffix' ]
+
+    if filename.startswith( prefix ) and filename.endswith( suffix ) \
+       and len( filename ) > len( prefix ) + len( suffix ):
+
+        name = filename[ len( prefix ) : len( filename ) - len( suffix ) ]
+
+    else:
+
+        name = os.path.basename( filename )
+
+    return name.replace( "/", "_" )
+
+
+# Hands a write to the write queue or the results file if either is
+# set. Returns True if the write was handed off, in which case the
+# write function should not write its ASCII file.
+
+# writer: Name of the write function
+# filename: Name of output file given to the write function
+# args: Arguments of the write function after filename in order
+
+def redirectWrite( writer, filename, **args ):
+
+    if queueWrite( writer, filename, args ):
+
+        return True
+
+    return writeResults( writer, filename, **args )
+
+
+# Stores the arguments of a write function in the results file if one
+# is set. Returns True if the arguments were stored, in which case the
+# ASCII file should not be written.
+
+# writer: Name of the write function
+# filename: Name of output file given to the write function
+# args: Arguments of the write function after filename in order
+
+def writeResults( writer, filename, **args ):
+
+    if 'filename' not in results_info:
+
+        return False
+
+    name = resultsName( filename )
+
+    with h5py.File( results_info[ 'filename' ], "a" ) as resultsFile:
+
+        # Outputs written more than once keep their last values,
+        # as an overwritten ASCII file would
+
+        if name in resultsFile:
+
+            del resultsFile[ name ]
+
+        group = resultsFile.create_group( name )
+
+        group.attrs[ "writer" ] = writer
+        group.attrs[ "filename" ] = filename
+        group.attrs[ "args" ] = ",".join( args )
+
+        for key, value in args.items():
+
+            writeResultsDataset( group, key, value )
+
+    print( "Wrote " + name + " to " + results_info[ 'filename' ] )
+
+    return True
+
+
+# Writes one argument of a write function to a results file group.
+# Lists of arrays with different shapes are written as a sub-group
+# with one dataset per element.
+
+# group: Results file group of output
+# key: Argument name
+# value: Argument value
+
+def writeResultsDataset( group, key, value ):
+
+    if isinstance( value, ( list, tuple ) ) \
+       and len( set( np.shape( v ) for v in value ) ) > 1:
+
+        subgroup = group.create_group( key )
+
+        for i, v in enumerate( value ):
+
+            writeResultsDataset( subgroup, str( i ), v )
+
+        return
+
+    value = np.asarray( value )
+
+    # Strings are stored as bytes with their original dtype so that
+    # they are read back as the same type
+
+    if value.dtype.kind == "U":
+
+        group.attrs[ "dtype_" + key ] = value.dtype.str
+
+        value = np.char.encode( value )
+
+    if value.size >= 1024:
+
+        group.create_dataset( key, data=value,
+                              compression="gzip", shuffle=True )
+
+    else:
+
+        group.create_dataset( key, data=value )
+
+
+# Reads the arguments of a write function from a results file group
+
+# group: Results file group of output
+
+# Returns dictionary of arguments in order
+
+def readResultsGroup( group ):
+
+    args = {}
+
+    for key in group.attrs[ "args" ].split( "," ):
+
+        if type( group[ key ] ) is h5py.Group:
+
+            args[ key ] = [ group[ key ][ str( i ) ][ () ]
+                            for i in range( len( group[ key ] ) ) ]
+
+        else:
+
+            args[ key ] = group[ key ][ () ]
+
+        if "dtype_" + key in group.attrs:
+
+            args[ key ] = args[ key ].astype( group.attrs[ "dtype_" + key ] )
+
+    # End loop over arguments
+
+    return args
+
+
+# Reads an output from a results file
+
+# filename: Name of results file
+# name: Name of output. A trailing file extension is ignored if no
+#       output has the full name.
+
+# Returns dictionary of the arrays given to the write function, e.g.,
+# data and error for writeAvgDataFile(), with 'writer' set to the name
+# of the write function
+
+def readResults( filename, name ):
+
+    with h5py.File( filename, "r" ) as resultsFile:
+
+        if name not in resultsFile:
+
+            name = os.path.splitext( name )[ 0 ]
+
+        assert name in resultsFile, "Error (readWrite.readResults): " \
+            + "no output {} in {}".format( name, filename )
+
+        args = readResultsGroup( resultsFile[ name ] )
+
+        args[ "writer" ] = resultsFile[ name ].attrs[ "writer" ]
+
+    return args
+
+
+# Column functions of each write function. Each takes the arguments
+# of the write function and returns the columns of its ASCII file.
+
+def columns_wX( x, data ):
+
+    if np.array_equal( x.shape, data.shape ):
+
+        return [ x.flatten(), data.flatten() ]
+
+    elif x.ndim == 2:
+
+        return list( np.tile( x.T, len( data ) ) ) + [ data.flatten() ]
+
+    else:
+
+        return [ np.tile( x, len( data ) ), data.flatten() ]
+
+
+resultsColumnFunctions \
+    = { "writeDataFile":
+        lambda data: [ np.tile( np.arange( data.shape[ 1 ] ),
+                                data.shape[ 0 ] ),
+                       data.flatten() ],
+        "writeDataFile_wX": columns_wX,
+        "writeAvgDataFile":
+        lambda data, error: [ np.arange( len( data ) ), data, error ],
+        "writeAvgDataFile_wX":
+        lambda x, y, error: ( list( x.T ) if x.ndim == 2 else [ x ] )
+        + [ y, error ],
+        "write2ValueDataFile":
+        lambda data0, data1: [ data0, data1 ],
+        "writeMomentumList":
+        lambda p_list: list( p_list.T ),
+        "writeFormFactorFile":
+        lambda Qsq, data: [ np.tile( np.arange( data.shape[ 2 ] ),
+                                     data.shape[ 0 ] * data.shape[ 1 ] ),
+                            np.repeat( Qsq, data.shape[ 1 ]
+                                       * data.shape[ 2 ] ),
+                            data.flatten() ],
+        "writeAvgFormFactorFile":
+        lambda Qsq, data, error: [ np.tile( np.arange( data.shape[ 1 ] ),
+                                            data.shape[ 0 ] ),
+                                   np.repeat( Qsq, data.shape[ 1 ] ),
+                                   data.flatten(), error.flatten() ],
+        "writeFitDataFile":
+        lambda fit, err, fitStart, fitEnd: [ [ fit ], [ err ],
+                                             [ int( fitStart ) ],
+                                             [ int( fitEnd ) ] ],
+        "writeTSFParamsFile":
+        lambda params, params_err: [ [ "A00", "A01", "A11",
+                                       "c0", "c1", "E0", "E1" ],
+                                     params, params_err ],
+        "writeDipoleFitParamsFile":
+        lambda params, params_err, rSq, rSq_err: \
+        [ [ "M", "F0", "<r^2>" ],
+          [ params[ 0 ], params[ 1 ], rSq ],
+          [ params_err[ 0 ], params_err[ 1 ], rSq_err ] ],
+        "writePDFParamsFile":
+        lambda params, params_err: [ [ "a", "b", "c" ],
+                                     params, params_err ],
+        "writeTSFParamsFile_twop":
+        lambda params, params_err: [ [ "c0", "c1", "E0", "E1" ],
+                                     params, params_err ] }
+
+
+# Reads an output from a results file as the table of columns its
+# ASCII file would have
+
+# filename: Name of results file
+# name: Name of output
+
+def readResultsColumns( filename, name ):
+
+    args = readResults( filename, name )
+
+    writer = args.pop( "writer" )
+
+    assert writer in resultsColumnFunctions, \
+        "Error (readWrite.readResultsColumns): output {} ".format( name ) \
+        + "written by {} cannot be read as columns.".format( writer )
+
+    columns = resultsColumnFunctions[ writer ]( *args.values() )
+
+    return np.column_stack( [ np.asarray( col ) for col in columns ] )
+
+
+# Splits a filename of the form <results file>.h5/<name> into the
+# results file and output name. If filename is not in a results file,
+# the results file returned is None.
+
+# filename: Name of output file
+
+def splitResultsFilename( filename ):
+
+    head, sep, name = filename.rpartition( ".h5/" )
+
+    if sep and os.path.isfile( head + ".h5" ):
+
+        return head + ".h5", name
+
+    return None, filename
+
+
+# Writes the ASCII file of every output in a results file with the
+# write function which would have written it
+
+# filename: Name of results file
+# output_template (Optional): Template for ASCII files with '*' for the
+#                             name of each output. Defaults to the
+#                             filenames given when writing.
+
+def exportResultsASCII( filename, output_template=None ):
+
+    # Write ASCII files even if a results file is set
+
+    results_info_set = dict( results_info )
+
+    results_info.clear()
+
+    try:
+
+        with h5py.File( filename, "r" ) as resultsFile:
+
+            for name, group in resultsFile.items():
+
+                args = readResultsGroup( group )
+
+                if output_template:
+
+                    asciiFilename = output_template.replace( "*", name )
+
+                else:
+
+                    asciiFilename = group.attrs[ "filename" ]
+
+                globals()[ group.attrs[ "writer" ] ]( asciiFilename,
+                                                      *args.values() )
+
+            # End loop over outputs
+
+    finally:
+
+        results_info.update( results_info_set )
+
+
+#########################
+# Write queue functions #
+#########################
+
+
+# While the write queue is running, the write functions copy their
+# arguments onto a queue and return, and a thread writes them to file
+# in the order they were queued. The process which writes output can
+# then continue computing while files are written. Write functions
+# return nothing when queued, and errors raised while writing are
+# raised again by lqcdjk_write_queue_finalize().
+
+write_queue_info = {}
+
+
+# Starts the write queue
+
+# maxsize (Optional): Largest number of writes waiting in the queue.
+#                     Queuing a write waits while the queue is full,
+#                     which bounds the memory used by copied arguments.
+
+def lqcdjk_write_queue_init( maxsize=16 ):
+
+    if 'thread' in write_queue_info:
+
+        return
+
+    writeQueue = queue.Queue( maxsize )
+
+    thread = threading.Thread( target=writeQueueWorker,
+                               args=( writeQueue, ), daemon=True )
+
+    write_queue_info[ 'queue' ] = writeQueue
+    write_queue_info[ 'thread' ] = thread
+    write_queue_info[ 'errors' ] = []
+
+    thread.start()
+
+    # Finish queued writes if the program exits without finalizing
+
+    atexit.register( lqcdjk_write_queue_finalize )
+
+
+# Waits for all queued writes to finish and stops the write queue
+
+def lqcdjk_write_queue_finalize():
+
+    if 'thread' not in write_queue_info:
+
+        return
+
+    write_queue_info[ 'queue' ].put( None )
+    write_queue_info[ 'thread' ].join()
+
+    errors = write_queue_info[ 'errors' ]
+
+    write_queue_info.clear()
+
+    atexit.unregister( lqcdjk_write_queue_finalize )
+
+    if errors:
+
+        raise errors[ 0 ]
+
+
+# Queues a write if the write queue is running and the write was not
+# made by the write queue thread itself. Returns True if the write
+# was queued.
+
+# writer: Name of the write function
+# filename: Name of output file given to the write function
+# args: Dictionary of the arguments of the write function after
+#       filename in order
+
+def queueWrite( writer, filename, args ):
+
+    if 'thread' not in write_queue_info \
+       or threading.current_thread() is write_queue_info[ 'thread' ]:
+
+        return False
+
+    # Copy arguments so that the caller can change them after
+    # returning
+
+    write_queue_info[ 'queue' ].put( ( writer, filename,
+                                       copy.deepcopy( args ) ) )
+
+    return True
+
+
+# Writes queued writes until None is queued
+
+# writeQueue: Queue of ( write function name, filename, arguments )
+
+def writeQueueWorker( writeQueue ):
+
+    while True:
+
+        item = writeQueue.get()
+
+        if item is None:
+
+            return
+
+        writer, filename, args = item
+
+        try:
+
+            globals()[ writer ]( filename, *args.values() )
+
+        except Exception as error:
+
+            write_queue_info[ 'errors' ].append( error )
+
+    # End loop over queued writes
+
@@ -2,23 +2,11 @@ import sys
 import time
 import numpy as np
 import argparse as argp
-from scipy.optimize import curve_fit
 import functions as fncs
-import mpi_functions as mpi_fncs
 import readWrite as rw
 import physQuants as pq
 import lqcdjk_fitting as fit
-from mpi4py import MPI
-
-#scaleConvertFactor = [ 1.0,
-#                       1.0,
-#                       1.0 ]
-scaleConvertFactor = [ 0.88006465263859557,
-                       0.82124624619025055,
-                       0.78205608925074033 ]
-#scaleConvertFactor = [ 0.64385830344721184,
-#                       0.51453823194515136,
-#                       0.43934940901402392 ]
+import ensemble as ens
 
 np.set_printoptions(threshold=sys.maxsize)
 
@@ -71,6 +59,15 @@ parser.add_argument( "bin_num", action='store',
 parser.add_argument( "-o", "--output_template", action='store',
                      type=str, default="./*.dat" )
 
+parser.add_argument( "--ensemble", action='store', type=str,
+                     help="Name of ensemble in --ensemble_registry "
+                     + "whose lattice parameters are used. If not "
+                     + "given, defaults in ensemble.py are used." )
+
+parser.add_argument( "--ensemble_registry", action='store', type=str,
+                     help="JSON file of ensemble information by "
+                     + "name." )
+
 args = parser.parse_args()
 
 
@@ -97,6 +94,13 @@ paramNum = args.parameter_num
 
 binNum = args.bin_num
 
+# Factors which convert the scale of the Mellin moments of the
+# ensemble
+
+scaleConvertFactor \
+    = ens.lqcdjk_ensemble_parameters( args.ensemble_registry,
+                                      args.ensemble )[ 'scaleConvertFactor' ]
+
 # Other info
 
 output_template = args.output_template
@@ -220,7 +224,7 @@ for part, flav, ipart in zip( particle, flavor, range( particleNum ) ):
     b_err = fncs.calcError( b, binNum ) 
     c_err = fncs.calcError( c, binNum ) 
 
-    print( out_str_template.format( "a", a_avg, a_err ) )
+    print( out_str_template.format( 'a', a_avg, a_err ) )
     print( out_str_template.format( "b", b_avg, b_err ) )
     print( out_str_template.format( "c", c_avg, c_err ) )
     print( out_str_template.format( "c", chiSq_avg, 0.0 ) )
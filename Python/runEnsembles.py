@@ -0,0 +1,147 @@
+import sys
+import json
+import numpy as np
+import argparse as argp
+import mpi_functions as mpi_fncs
+import profiling as prof
+import readWrite as rw
+import ensemble as ens
+import ensembleScheduler as sched
+
+# Runs batches of analyses of several ensembles in one MPI job. The
+# processes are split into groups which run different ensembles at
+# the same time. Ensembles are read from a registry file (see
+# ensemble.py) and the schedule file is a JSON list of ensembles and
+# their analyses, e.g.,
+#
+# [ { "ensemble": "cA2.09.48",
+#     "analyses": [ { "analysis": "formFactors", "form_factor": "GE_GM",
+#                     "particle": "pion", "t_sink": [ 12, 14, 16 ],
+#                     "threep_final_momentum_squared": 0,
+#                     "binSize": 50, "source_number": [ 16, 16, 16 ] } ] },
+#   { "ensemble": "cA2.09.32",
+#     "analyses": [ ... ] } ]
+#
+# where the analyses are given as in batchAnalyses.py.
+
+# Set option so that entire numpy arrays are printed
+
+np.set_printoptions(threshold=sys.maxsize)
+
+#########################
+# Parse input arguments #
+#########################
+
+parser = argp.ArgumentParser( description="Run batches of analyses "
+                              + "of several ensembles" )
+
+# Set input arguments
+
+parser.add_argument( "ensemble_registry", action='store', type=str,
+                     help="JSON file of ensemble information by "
+                     + "name." )
+
+parser.add_argument( "schedule_file", action='store', type=str,
+                     help="JSON file with the list of ensembles and "
+                     + "their analyses." )
+
+parser.add_argument( "-g", "--groups", action='store', type=int,
+                     help="Number of groups of processes which run "
+                     + "ensembles at the same time. Defaults to the "
+                     + "number of ensembles or processes, whichever "
+                     + "is less." )
+
+parser.add_argument( "-o", "--output_template", action='store',
+                     type=str, default="./*.dat",
+                     help="Template for output files of analyses "
+                     + "which do not give one. '*' will be replaced "
+                     + "with the ensemble name and text depending on "
+                     + "output data." )
+
+parser.add_argument( "-bw", "--bin_workers", action='store', type=int,
+                     help="Number of workers each process uses to "
+                     + "fit its bins.",
+                     default=1 )
+
+parser.add_argument( "--bin_worker_type", action='store', type=str,
+                     help="Type of workers used to fit bins. Must be "
+                     + "'thread' or 'process'. Processes cannot be "
+                     + "forked once MPI is initialized, so threads are "
+                     + "used instead when running under MPI.",
+                     default="thread" )
+
+parser.add_argument( "--dynamic_bins", action='store_true',
+                     help="Hand out the bins of fits to processes as "
+                     + "they finish their previous bins instead of "
+                     + "splitting them evenly beforehand. Helps when "
+                     + "fits take different times for different "
+                     + "bins." )
+
+parser.add_argument( "--timing", action='store_true',
+                     help="Time reading, jackknifing, fitting and "
+                     + "collectives on each process and print a "
+                     + "report at the end." )
+
+parser.add_argument( "--profile_dir", action='store', type=str,
+                     help="Also run cProfile on each process and "
+                     + "write its statistics to this directory. "
+                     + "Implies --timing." )
+
+parser.add_argument( "--txt_cache_dir", action='store', type=str,
+                     help="Directory for a binary cache of ASCII "
+                     + "correlator files. Files are parsed once and "
+                     + "later runs memory map the cache." )
+
+parser.add_argument( "--ascii", action='store_true',
+                     help="Also export every output of the results "
+                     + "files as an ASCII file at the end." )
+
+# Parse
+
+args = parser.parse_args()
+
+#########
+# Setup #
+#########
+
+# Set MPI values
+
+mpi_info = mpi_fncs.lqcdjk_mpi_init()
+
+if args.timing or args.profile_dir:
+
+    prof.lqcdjk_profiling_init( mpi_info, args.profile_dir )
+
+if args.txt_cache_dir:
+
+    rw.lqcdjk_txt_cache_init( args.txt_cache_dir )
+
+# Read ensembles and schedule
+
+registry = ens.readEnsembleRegistry( args.ensemble_registry )
+
+with open( args.schedule_file, "r" ) as scheduleFile:
+
+    schedule = json.load( scheduleFile )
+
+# Options used by analyses which do not give them
+
+options = { 'output_template': args.output_template,
+            'bin_workers': args.bin_workers,
+            'bin_worker_type': args.bin_worker_type,
+            'dynamic_bins': args.dynamic_bins }
+
+
+############
+# Analysis #
+############
+
+
+sched.runEnsembles( registry, schedule, mpi_info, args.groups, options,
+                    args.ascii )
+
+if args.timing or args.profile_dir:
+
+    prof.lqcdjk_profiling_report( mpi_info, args.profile_dir )
+
+exit()
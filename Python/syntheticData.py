@@ -0,0 +1,521 @@
+import os
+import h5py
+import numpy as np
+import argparse as argp
+import functions as fncs
+import physQuants as pq
+import lqcdjk_fitting as fit
+
+# Generates synthetic ensembles of two- and three-point functions
+# with known ground and first excited state energies and writes them
+# in the layouts read by readWrite: "cpu" HDF5 files with
+# /twop_<particle>/ave<srcNum>/msq<Q^2>/arr datasets, "gpu" HDF5 files
+# with Momenta_list and twop datasets, and "ASCII" text files. Each
+# configuration is generated and written on its own, so ensembles with
+# many configurations do not need to fit in memory.
+#
+# Two-point functions follow fit.twoStateTwop() with
+# E0 = pq.energy( m0, p^2, L ) and E1 = pq.energy( m1, p^2, L ).
+# Three-point functions at final momentum p_fin follow
+# fit.twoStateThreep_momTransfer() with the ground state amplitude
+# multiplied by a dipole in Q^2 and are the same for every current
+# and projector. Each configuration is the model times
+# ( 1 + noise * Gaussian noise ).
+
+
+# Makes a list of momenta with p^2 <= pSqMax ordered by p^2, as
+# expected by fncs.processMomList()
+
+# pSqMax: Maximum p^2 in lattice units of 2 pi / L
+
+def momentumList( pSqMax ):
+
+    pMax = int( np.floor( np.sqrt( pSqMax ) ) )
+
+    p = np.arange( -pMax, pMax + 1 )
+
+    momList = np.stack( np.meshgrid( p, p, p, indexing="ij" ),
+                        axis=-1 ).reshape( -1, 3 )
+
+    pSq = np.sum( momList ** 2, axis=-1 )
+
+    momList = momList[ pSq <= pSqMax ]
+    pSq = pSq[ pSq <= pSqMax ]
+
+    return momList[ np.argsort( pSq, kind="stable" ) ]
+
+
+# Two-point functions of the model for each momentum
+
+# T: Time dimension length of ensemble
+# momList: Momentum list ordered by p^2
+# m0: Ground state mass
+# m1: First excited state mass
+# L: Spatial dimension length of ensemble
+# c0 (Optional): Ground state amplitude
+# c1 (Optional): First excited state amplitude
+
+# Returns twop[ p, t ]
+
+def twopModel( T, momList, m0, m1, L, c0=1.0e-3, c1=5.0e-4 ):
+
+    pSq = np.sum( np.asarray( momList ) ** 2, axis=-1 )[ :, None ]
+
+    return fit.twoStateTwop( np.arange( T ), T, c0, c1,
+                             pq.energy( m0, pSq, L ),
+                             pq.energy( m1, pSq, L ) )
+
+
+# Three-point functions of the model for each momentum transfer.
+# Insertion times after tsink are 0.
+
+# T: Time dimension length of ensemble
+# ts: tsink
+# momList: Momentum transfer list ordered by Q^2
+# p_fin: Final momentum
+# m0: Ground state mass
+# m1: First excited state mass
+# L: Spatial dimension length of ensemble
+# a00, a01, a11 (Optional): Amplitudes of the two-state fit at Q^2=0
+# dipoleMass (Optional): Dipole mass in lattice units of the ground
+#                        state amplitude
+
+# Returns threep[ Q, t ]
+
+def threepModel( T, ts, momList, p_fin, m0, m1, L,
+                 a00=1.0e-3, a01=2.0e-4, a11=1.0e-4, dipoleMass=0.8 ):
+
+    momList = np.asarray( momList )
+
+    p_ini = np.asarray( p_fin ) - momList
+
+    pSq_ini = np.sum( p_ini ** 2, axis=-1 )[ :, None ]
+    pSq_fin = np.sum( np.asarray( p_fin ) ** 2 )
+
+    E0_ini = pq.energy( m0, pSq_ini, L )
+    E1_ini = pq.energy( m1, pSq_ini, L )
+    E0_fin = pq.energy( m0, pSq_fin, L )
+    E1_fin = pq.energy( m1, pSq_fin, L )
+
+    # Q^2 in lattice units
+
+    Qsq = ( 2.0 * np.pi / L ) ** 2 \
+          * np.sum( momList ** 2, axis=-1 )[ :, None ] \
+          - ( E0_fin - E0_ini ) ** 2
+
+    ti = np.arange( ts + 1 )
+
+    threep = np.zeros( ( len( momList ), T ) )
+
+    threep[ :, :ts + 1 ] \
+        = fit.twoStateThreep_momTransfer( ti, ts,
+                                          a00 * fit.dipole( Qsq,
+                                                            dipoleMass,
+                                                            1.0 ),
+                                          a01, a01, a11,
+                                          E0_ini, E0_fin,
+                                          E1_ini, E1_fin )
+
+    return threep
+
+
+# Random number generator of a configuration which is independent of
+# which other configurations are generated
+
+# seed: Seed of ensemble
+# c: Configuration index
+# stream: Index of the data set being generated
+
+def configRNG( seed, c, stream ):
+
+    return np.random.default_rng( [ seed, c, stream ] )
+
+
+# Model with noise for one configuration
+
+# model: Model data
+# noise: Relative size of noise
+# rng: Random number generator
+
+def noisyConfig( model, noise, rng ):
+
+    return model * ( 1.0 + noise * rng.standard_normal( model.shape ) )
+
+
+# Makes the directories of a file
+
+def makeDirs( filename ):
+
+    dirname = os.path.dirname( filename )
+
+    if dirname:
+
+        os.makedirs( dirname, exist_ok=True )
+
+
+# Writes a text file with columns t, Q_x, Q_y, Q_z, real, imaginary
+# which repeat over the innermost dimension, then t, then Q
+
+# filename: Name of file
+# data: Data with shape [ Q, t ] or [ Q, t, curr ]
+# momList: Momentum list
+
+def writeTxtCorrelator( filename, data, momList ):
+
+    data = data.reshape( data.shape[ :2 ] + ( -1, ) )
+
+    QNum, T, currNum = data.shape
+
+    index = np.indices( data.shape ).reshape( 3, -1 )
+
+    columns = np.column_stack( ( index[ 1 ],
+                                 np.asarray( momList )[ index[ 0 ] ],
+                                 data.reshape( -1 ),
+                                 np.zeros( data.size ) ) )
+
+    makeDirs( filename )
+
+    np.savetxt( filename, columns,
+                fmt=[ "%d", "%+d", "%+d", "%+d", "%.16e", "%.16e" ] )
+
+
+# Writes synthetic two-point functions for each configuration
+
+# twopDir: Directory containing configuration sub-directories for
+#          "cpu" and "gpu" formats, or prefix of file names for "ASCII"
+# twop_template: File name template. "*" is replaced by the
+#                configuration for the "ASCII" format.
+# configList: List of configurations
+# model: Two-point functions of the model from twopModel()
+# momList: Momentum list ordered by p^2
+# particle: Particle name used in "cpu" dataset names
+# srcNum: Number of sources used in "cpu" dataset names
+# dataFormat: "cpu", "gpu", or "ASCII"
+# noise (Optional): Relative size of noise
+# seed (Optional): Seed of ensemble
+
+def writeTwop( twopDir, twop_template, configList, model, momList,
+               particle, srcNum, dataFormat, noise=0.01, seed=0 ):
+
+    momList, pSq, pSq_start, pSq_end, pSq_where \
+        = fncs.processMomList( momList )
+
+    # Loop over configurations
+    for c, config in enumerate( configList ):
+
+        # twop[ p, t ]
+
+        twop = noisyConfig( model, noise, configRNG( seed, c, 0 ) )
+
+        if dataFormat == "ASCII":
+
+            writeTxtCorrelator( twopDir + twop_template.replace( "*",
+                                                                 config ),
+                                twop, momList )
+
+            continue
+
+        filename = os.path.join( twopDir, config, twop_template )
+
+        makeDirs( filename )
+
+        with h5py.File( filename, "w" ) as dataFile:
+
+            if dataFormat == "cpu":
+
+                group = "/twop_{}/ave{}".format( particle, srcNum )
+
+                # Loop over p^2
+                for psq, start, end in zip( pSq, pSq_start, pSq_end ):
+
+                    template = group + "/msq{:0>4}/{}"
+
+                    # arr[ t, p ]
+
+                    dataFile.create_dataset( template.format( psq, "arr" ),
+                                             data=twop[ start : end + 1 ]\
+                                             .T.astype( complex ) )
+
+                    dataFile.create_dataset( template.format( psq, "mvec" ),
+                                             data=momList[ start
+                                                           : end + 1 ] )
+
+                # End loop over p^2
+
+            else:
+
+                group = "conf_{}".format( config )
+
+                # twop[ t, p, re/im ]
+
+                dataFile.create_dataset( group + "/twop",
+                                         data=np.stack( ( twop.T,
+                                                          np.zeros_like( twop.T ) ),
+                                                        axis=-1 ) )
+
+                dataFile.create_dataset( group + "/Momenta_list",
+                                         data=momList )
+
+    # End loop over configurations
+
+
+# Writes synthetic three-point functions of the four Noether currents
+# for each configuration with the file names and datasets read by
+# readWrite.readFormFactorFile_GE_GM()
+
+# threepDir: Directory containing configuration sub-directories for
+#            "cpu" and "gpu" formats, or prefix of file names for "ASCII"
+# threep_tokens: Tokens of the three-point file name templates
+# configList: List of configurations
+# models: Dictionary of three-point functions of the model from
+#         threepModel() for each tsink
+# momList: Momentum transfer list ordered by Q^2
+# p_fin: Final momentum
+# particle: Particle name
+# srcNum: Number of sources used in "cpu" dataset names
+# projector: List of projectors used for the nucleon
+# dataFormat: "cpu", "gpu", or "ASCII"
+# noise (Optional): Relative size of noise
+# seed (Optional): Seed of ensemble
+
+def writeThreep( threepDir, threep_tokens, configList, models, momList,
+                 p_fin, particle, srcNum, projector, dataFormat,
+                 noise=0.01, seed=0 ):
+
+    momList, Qsq, Qsq_start, Qsq_end, Qsq_where \
+        = fncs.processMomList( momList )
+
+    flavor, flavorNum = fncs.setFlavorStrings( particle, dataFormat )
+
+    insertion_str = [ "=noe:g0=", "=noe:gx=", "=noe:gy=", "=noe:gz=" ]
+
+    if particle != "nucleon":
+
+        projector = [ projector[ 0 ] ]
+
+    # Loop over configurations
+    for c, config in enumerate( configList ):
+
+        rng = configRNG( seed, c, 1 )
+
+        # threep[ ts ][ Q, t ]
+
+        threep = { ts: noisyConfig( models[ ts ], noise, rng )
+                   for ts in sorted( models ) }
+
+        if dataFormat == "gpu":
+
+            filename = os.path.join( threepDir, config,
+                                     "{}{}{}".format( threep_tokens[ 0 ],
+                                                      particle,
+                                                      threep_tokens[ 1 ] ) )
+
+            makeDirs( filename )
+
+            with h5py.File( filename, "w" ) as dataFile:
+
+                group = "conf_{}".format( config )
+
+                dataFile.create_dataset( group + "/Momenta_list",
+                                         data=momList )
+
+                # Loop over tsink
+                for ts in threep:
+
+                    # dset[ t, Q, curr, re/im ] with currents ordered
+                    # x, y, z, t
+
+                    dset = np.zeros( ( ts + 1, len( momList ), 4, 2 ) )
+
+                    dset[ ... ] = threep[ ts ].T[ :ts + 1, :, None, None ]
+
+                    # Loop over flavor
+                    for flav in flavor:
+
+                        dataFile.create_dataset( "{}/tsink_{}/{}/noether"\
+                                                 .format( group, ts, flav ),
+                                                 data=dset )
+
+                # End loop over tsink
+
+            continue
+
+        # Loop over tsink
+        for ts in threep:
+            # Loop over flavor
+            for flav in flavor:
+
+                if dataFormat == "ASCII":
+
+                    # Loop over projector
+                    for proj in projector:
+
+                        filename = threepDir \
+                            + "{}{}{}{}{}{}".format( threep_tokens[ 0 ],
+                                                     proj,
+                                                     threep_tokens[ 1 ],
+                                                     ts,
+                                                     threep_tokens[ 2 ],
+                                                     flav )\
+                                            .replace( "*", config )
+
+                        # data[ Q, t, curr ]
+
+                        writeTxtCorrelator( filename,
+                                            np.repeat( threep[ ts ][ ..., None ],
+                                                       4, axis=-1 ),
+                                            momList )
+
+                    # End loop over projector
+
+                    continue
+
+                # cpu format has one file per tsink and flavor
+
+                template = "{0}{1}{2}{3:+}_{4:+}_{5:+}.{6}.h5"
+
+                filename = os.path.join( threepDir, config,
+                                         template.format( threep_tokens[ 0 ],
+                                                          ts,
+                                                          threep_tokens[ 1 ],
+                                                          p_fin[ 0 ],
+                                                          p_fin[ 1 ],
+                                                          p_fin[ 2 ],
+                                                          flav ) )
+
+                makeDirs( filename )
+
+                with h5py.File( filename, "w" ) as dataFile:
+
+                    # Loop over projector
+                    for proj in projector:
+
+                        if particle == "nucleon":
+
+                            group = "/thrp/ave{}/P{}/dt{}/{}"\
+                                .format( srcNum, proj, ts, flav )
+
+                        else:
+
+                            group = "/thrp/ave{}/dt{}/{}"\
+                                .format( srcNum, ts, flav )
+
+                        # Loop over insertion current
+                        for curr in insertion_str:
+                            # Loop over Q^2
+                            for qsq, start, end in zip( Qsq, Qsq_start,
+                                                        Qsq_end ):
+
+                                # arr[ t, Q ] is complex and the
+                                # currents are read from either the
+                                # real or imaginary part
+
+                                arr = threep[ ts ][ start : end + 1 ].T
+
+                                dataFile.create_dataset( "{}/{}/msq{:0>4}/arr"\
+                                                         .format( group, curr,
+                                                                  qsq ),
+                                                         data=arr + 1j * arr )
+
+                            # End loop over Q^2
+                        # End loop over insertion current
+                    # End loop over projector
+            # End loop over flavor
+        # End loop over tsink
+    # End loop over configurations
+
+
+# Write a synthetic ensemble from the command line
+
+if __name__ == "__main__":
+
+    parser = argp.ArgumentParser( description="Write synthetic two- and "
+                                  + "three-point functions with known "
+                                  + "energies" )
+
+    parser.add_argument( "output_dir", action='store', type=str,
+                         help="Directory to write configuration "
+                         + "sub-directories to." )
+
+    parser.add_argument( "data_format", action='store', type=str,
+                         help="Data format. Must be 'cpu', 'gpu', or "
+                         + "'ASCII'." )
+
+    parser.add_argument( "config_number", action='store', type=int,
+                         help="Number of configurations." )
+
+    parser.add_argument( "-T", "--time_dim", action='store', type=int,
+                         help="Time dimension length.", default=64 )
+
+    parser.add_argument( "-L", "--space_dim", action='store', type=int,
+                         help="Spatial dimension length.", default=32 )
+
+    parser.add_argument( "-t", "--t_sink", action='store', type=int,
+                         nargs='+', help="tsink values.",
+                         default=[ 12, 14, 16 ] )
+
+    parser.add_argument( "-q", "--Qsq_max", action='store', type=int,
+                         help="Maximum Q^2 and p^2 in units of "
+                         + "( 2 pi / L )^2.", default=4 )
+
+    parser.add_argument( "-pf", "--final_momentum", action='store',
+                         type=int, nargs=3,
+                         help="Final momentum of three-point "
+                         + "functions.", default=[ 0, 0, 0 ] )
+
+    parser.add_argument( "-p", "--particle", action='store', type=str,
+                         help="Particle. Must be 'pion', 'kaon', or "
+                         + "'nucleon'.", default="pion" )
+
+    parser.add_argument( "-m", "--masses", action='store', type=float,
+                         nargs=2, help="Ground and first excited "
+                         + "state masses.", default=[ 0.2, 0.6 ] )
+
+    parser.add_argument( "-n", "--noise", action='store', type=float,
+                         help="Relative size of noise.", default=0.01 )
+
+    parser.add_argument( "-sn", "--source_number", action='store',
+                         type=int, help="Number of sources in dataset "
+                         + "names.", default=16 )
+
+    parser.add_argument( "--seed", action='store', type=int,
+                         help="Seed of random numbers.", default=0 )
+
+    args = parser.parse_args()
+
+    configList = [ "{:0>4}".format( c )
+                   for c in range( args.config_number ) ]
+
+    momList = momentumList( args.Qsq_max )
+
+    m0, m1 = args.masses
+
+    if args.data_format == "ASCII":
+
+        twop_template = "/*/twop.dat"
+        threep_tokens = [ "/*/threep_P", "_dt", "_" ]
+
+    else:
+
+        twop_template = "twop.h5"
+        threep_tokens = [ "threep_dt", "_mom" ] \
+            if args.data_format == "cpu" else [ "threep_", ".h5" ]
+
+    writeTwop( args.output_dir, twop_template, configList,
+               twopModel( args.time_dim, momList, m0, m1,
+                          args.space_dim ),
+               momList, args.particle, args.source_number,
+               args.data_format, args.noise, args.seed )
+
+    models = { ts: threepModel( args.time_dim, ts, momList,
+                                args.final_momentum, m0, m1,
+                                args.space_dim )
+               for ts in args.t_sink }
+
+    writeThreep( args.output_dir, threep_tokens, configList, models,
+                 momList, args.final_momentum, args.particle,
+                 args.source_number, [ "0" ], args.data_format,
+                 args.noise, args.seed )
+
+    print( "Wrote {} configurations to {}".format( len( configList ),
+                                                    args.output_dir ) )
@@ -8,13 +8,11 @@ import mpi_functions as mpi_fncs
 import readWrite as rw
 import physQuants as pq
 import lqcdjk_fitting as fit
+import ensemble as ens
 from mpi4py import MPI
 
 np.set_printoptions(threshold=sys.maxsize)
 
-a = 0.093
-L = 32.0
-
 particle_list = fncs.particleList()
 
 form_factor_list = fncs.formFactorList()
@@ -29,11 +27,11 @@ parser = argp.ArgumentParser( description="Calculate effective energy " \
                               + "from two-state fit and dispersion " \
                               + "relation." )
 
-parser.add_argument( "twop_dir", action='store',
+parser.add_argument( 'twop_dir', action='store',
                      help="Two-point function filename directory",
                      type=str )
 
-parser.add_argument( "twop_template", action='store',
+parser.add_argument( 'twop_template', action='store',
                      help="Two-point function filename template",
                      type=str )
 
@@ -64,6 +62,15 @@ parser.add_argument( "-c", "--config_list", action='store', \
 parser.add_argument( "-m", "--momentum_transfer_list", action='store', \
                      type=str, default="" )
 
+parser.add_argument( "--ensemble", action='store', type=str,
+                     help="Name of ensemble in --ensemble_registry "
+                     + "whose lattice parameters are used. If not "
+                     + "given, defaults in ensemble.py are used." )
+
+parser.add_argument( "--ensemble_registry", action='store', type=str,
+                     help="JSON file of ensemble information by "
+                     + "name." )
+
 args = parser.parse_args()
 
 #########
@@ -88,6 +95,14 @@ twop_template = args.twop_template
 
 particle = args.particle
 
+# Lattice spacing and length of the ensemble
+
+ensemble_params = ens.lqcdjk_ensemble_parameters( args.ensemble_registry,
+                                                  args.ensemble )
+
+a = ensemble_params[ 'a' ]
+L = ensemble_params[ 'L' ]
+
 # Other info
 
 binSize = args.binSize
@@ -281,14 +296,18 @@ E_disp[ :, 0 ] = fitResults[ 2 ]
 tsf_fitStart = fitResults[ 3 ]
 plat_fitStart = fitResults[ 4 ]
 
+E_plat_futures = []
+
 for iq in range( 1, qSqNum ):
     
     mpi_fncs.mpiPrint(iq,mpi_confs_info)
 
-    E_plat[ :, iq ], dummy \
-        = fit.fitPlateau_parallel( effEnergy[ :, iq, : ],
-                                   plat_fitStart, rangeEnd,
-                                   mpi_confs_info )
+    # Gather the plateau fit while the next q is fit
+
+    E_plat_futures.append( fit.fitPlateau_parallel( effEnergy[ :, iq, : ],
+                                                    plat_fitStart, rangeEnd,
+                                                    mpi_confs_info,
+                                                    wait=False ) )
 
     E_disp[ :, iq ] = pq.energy( E_plat[ :, 0 ], qSq[ iq ], L )
 
@@ -310,6 +329,10 @@ for iq in range( 1, qSqNum ):
     
 # End loop over q^2
 
+for iq, future in zip( range( 1, qSqNum ), E_plat_futures ):
+
+    E_plat[ :, iq ], dummy = future.wait()
+
 ##########
 # Output #
 ##########
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Modules are imported from the Python directory, as by the scripts
+
+sys.path.insert( 0, os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
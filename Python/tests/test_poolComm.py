@@ -0,0 +1,207 @@
+import sys
+import numpy as np
+import pytest
+import mpi_functions as mpi_fncs
+
+# Tests of the single-node process pool backend, which runs the MPI 
+# helpers on several processes without MPI. Functions run on the 
+# processes are defined at module level so that they can be pickled.
+
+procNum = 3
+
+
+def allgathervRanks( mpi_info ):
+
+    comm = mpi_info[ 'comm' ]
+    rank = mpi_info[ 'rank' ]
+
+    # Process r sends r + 1 values of r
+
+    counts = np.arange( 1, procNum + 1 )
+    displs = np.concatenate( ( [ 0 ], np.cumsum( counts )[ :-1 ] ) )
+
+    recvbuf = np.zeros( np.sum( counts ) )
+
+    comm.Allgatherv( np.full( rank + 1, float( rank ) ),
+                     [ recvbuf, counts, displs, mpi_fncs.mpiType( comm ) ] )
+
+    return recvbuf
+
+
+def test_allgatherv():
+
+    expected = np.repeat( np.arange( procNum ), np.arange( 1, procNum + 1 ) )
+
+    for recvbuf in mpi_fncs.lqcdjk_pool_run( allgathervRanks, procNum ):
+
+        np.testing.assert_array_equal( recvbuf, expected )
+
+
+def bcastRoot( mpi_info, root ):
+
+    comm = mpi_info[ 'comm' ]
+    rank = mpi_info[ 'rank' ]
+
+    obj = comm.bcast( { 'rank': rank } if rank == root else None, root=root )
+
+    buf = np.arange( 4.0 ) if rank == root else np.zeros( 4 )
+
+    comm.Bcast( [ buf, mpi_fncs.mpiType( comm ) ], root=root )
+
+    return obj, buf
+
+
+def test_bcast():
+
+    for obj, buf in mpi_fncs.lqcdjk_pool_run( bcastRoot, procNum, 1 ):
+
+        assert obj == { 'rank': 1 }
+
+        np.testing.assert_array_equal( buf, np.arange( 4.0 ) )
+
+
+def sendRecv( mpi_info ):
+
+    comm = mpi_info[ 'comm' ]
+    rank = mpi_info[ 'rank' ]
+
+    if rank == 0:
+
+        # Receive tag 2 from each process before tag 1, which arrives 
+        # first, then the rest from any process
+
+        msgs = [ comm.recv( source=r, tag=2 ) for r in range( 1, procNum ) ]
+
+        msgs += [ comm.recv( source=mpi_fncs.anySource( comm ), tag=1 )
+                  for r in range( 1, procNum ) ]
+
+        return msgs
+
+    comm.send( ( rank, 1 ), dest=0, tag=1 )
+    comm.send( ( rank, 2 ), dest=0, tag=2 )
+
+    return None
+
+
+def test_recv():
+
+    msgs = mpi_fncs.lqcdjk_pool_run( sendRecv, procNum )[ 0 ]
+
+    assert msgs[ :procNum - 1 ] == [ ( r, 2 ) for r in range( 1, procNum ) ]
+
+    assert sorted( msgs[ procNum - 1: ] ) \
+        == [ ( r, 1 ) for r in range( 1, procNum ) ]
+
+
+def returnRank( mpi_info, offset, scale=1 ):
+
+    assert mpi_info[ 'procNum' ] == procNum
+
+    mpi_info[ 'comm' ].Barrier()
+
+    return scale * mpi_info[ 'rank' ] + offset
+
+
+def raiseOnRank( mpi_info ):
+
+    if mpi_info[ 'rank' ] == 1:
+
+        raise ValueError( "rank 1" )
+
+    return mpi_info[ 'rank' ]
+
+
+def test_pool_run():
+
+    assert mpi_fncs.lqcdjk_pool_run( returnRank, procNum, 10, scale=2 ) \
+        == [ 10, 12, 14 ]
+
+    with pytest.raises( ValueError, match="rank 1" ):
+
+        mpi_fncs.lqcdjk_pool_run( raiseOnRank, procNum )
+
+
+# Runs the bin-parallel helpers and returns whether mpi4py.MPI was 
+# imported
+
+def binHelpers( mpi_info, binNum ):
+
+    mpi_info[ 'binNum_glob' ] = binNum
+
+    mpi_fncs.lqcdjk_mpi_node_info( mpi_info )
+    mpi_fncs.lqcdjk_mpi_bins_info( mpi_info )
+
+    binList_loc = mpi_info[ 'binList_loc' ]
+
+    data, win = mpi_fncs.sharedAllgatherv( np.array( binList_loc, 
+                                                     dtype=float ),
+                                           ( binNum, ), mpi_info )
+
+    gathered = mpi_fncs.iallgathervBins( [ 2.0 * binList_loc ],
+                                         [ ( binNum, ) ],
+                                         mpi_info ).wait()[ 0 ]
+
+    dynamic = mpi_fncs.dynamicBinTasks( [ ( lambda b: ( [ b, -b ], b ), 
+                                            2 ) ],
+                                        mpi_info )[ 0 ]
+
+    arrays = mpi_fncs.ibcastArrays( [ np.full( 2, float( mpi_info[ 'rank' ] ) ) ],
+                                    mpi_info ).wait()
+
+    return data, gathered, dynamic, arrays[ 0 ], "mpi4py.MPI" in sys.modules
+
+
+def test_bin_helpers_without_MPI():
+
+    # Processes are forked from this one, so it must not have imported
+    # mpi4py.MPI either
+
+    assert "mpi4py.MPI" not in sys.modules
+
+    binNum = 7
+
+    for data, gathered, ( fit, chiSq ), bcast, imported \
+        in mpi_fncs.lqcdjk_pool_run( binHelpers, procNum, binNum ):
+
+        np.testing.assert_array_equal( data, np.arange( binNum ) )
+        np.testing.assert_array_equal( gathered, 2.0 * np.arange( binNum ) )
+        np.testing.assert_array_equal( fit[ :, 0 ], np.arange( binNum ) )
+        np.testing.assert_array_equal( chiSq, np.arange( binNum ) )
+        np.testing.assert_array_equal( bcast, np.zeros( 2 ) )
+
+        assert not imported
+
+
+# Runs several fit tasks at once with static or dynamic scheduling
+
+def binTasksFits( mpi_info, binNum, dynamic ):
+
+    mpi_info[ 'binNum_glob' ] = binNum
+
+    mpi_fncs.lqcdjk_mpi_bins_info( mpi_info )
+    mpi_fncs.lqcdjk_bin_workers_info( mpi_info, 1, dynamic=dynamic )
+
+    taskList = [ ( lambda b: ( [ b, 2 * b ], b ), 2 ),
+                 ( lambda b: ( [ -b, 0 ], 2 * b ), 2 ) ]
+
+    return mpi_fncs.binTasks( taskList, mpi_info )
+
+
+# Fewer bins than processes leaves a process without bins
+
+@pytest.mark.parametrize( "binNum", [ 5, 2 ] )
+@pytest.mark.parametrize( "dynamic", [ False, True ] )
+def test_bin_tasks( dynamic, binNum ):
+
+    b = np.arange( binNum )
+
+    for results in mpi_fncs.lqcdjk_pool_run( binTasksFits, procNum, 
+                                             binNum, dynamic ):
+
+        ( fit_0, chiSq_0 ), ( fit_1, chiSq_1 ) = results
+
+        np.testing.assert_array_equal( fit_0, np.stack( ( b, 2 * b ), 
+                                                        axis=1 ) )
+        np.testing.assert_array_equal( chiSq_0, b )
+        np.testing.assert_array_equal( fit_1[ :, 0 ], -b )
+        np.testing.assert_array_equal( chiSq_1, 2 * b )